@@ -1,9 +1,33 @@
+import json
+from datetime import datetime
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.helpers import ActionForm
 from django.contrib.auth.admin import UserAdmin, GroupAdmin
 from django.contrib.auth.models import Group
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Max, Min, QuerySet
+from django.http import Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from django.utils.text import Truncator
 from django.utils.translation import gettext_lazy as _
 
-from .models import CustomUser, GroupChat, PrivateChat, Message
+from .export import export_response, history_messages
+from .group_members import add_group_members, read_member_ids, remove_group_members, role_member_ids
+from .models import MESSAGE_SEARCH_CONFIG, CustomUser, GroupChat, PrivateChat, Message
+
+ADMIN_EXACT_COUNT_LIMIT = getattr(settings, 'CHAT_ADMIN_EXACT_COUNT_LIMIT', 10000)
 
 
 # --- Rename Group model globally ---
@@ -11,6 +35,36 @@ Group._meta.verbose_name = _("Role")
 Group._meta.verbose_name_plural = _(" Roles")
 
 
+# --- Chat History Export ---
+class ExportActionForm(ActionForm):
+    """
+    Action bar with an optional date range (UTC, inclusive) for the export actions.
+    """
+    start = forms.DateField(required=False, label=_("From"), widget=forms.DateInput(attrs={"type": "date"}))
+    end = forms.DateField(required=False, label=_("To"), widget=forms.DateInput(attrs={"type": "date"}))
+
+
+def export_actions(selection, name):
+    """
+    CSV and XLSX export actions streaming the history of the selected objects;
+    `selection` maps the queryset to history_messages() arguments.
+    """
+    def make_action(export_format):
+        def action(modeladmin, request, queryset):
+            form = ExportActionForm(request.POST)
+            dates = form.cleaned_data if form.is_valid() else {}
+            messages = history_messages(**selection(queryset), start=dates.get("start"), end=dates.get("end"))
+            filename = f"{name}-history-{timezone.now():%Y%m%d-%H%M%S}"
+            return export_response(messages, export_format, filename)
+
+        action.__name__ = f"export_history_{export_format}"
+        return admin.action(
+            description=_("Export message history (%s)") % export_format.upper(), permissions=["view"],
+        )(action)
+
+    return [make_action("csv"), make_action("xlsx")]
+
+
 # --- Custom User Admin ---
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -28,6 +82,9 @@ class CustomUserAdmin(UserAdmin):
     list_filter = ("is_staff", "is_superuser", "is_active")
     search_fields = ("username", "first_name", "last_name")
     ordering = ("userid",)
+    # A user's history is the messages they sent
+    action_form = ExportActionForm
+    actions = export_actions(lambda users: {"senders": users}, "user")
 
     fieldsets = (
         (None, {"fields": ("userid", "username", "password")}),
@@ -53,15 +110,242 @@ class CustomUserAdmin(UserAdmin):
 
 
 # --- GroupChat Admin ---
+# Kept up to date by the message write path; as form fields they would also
+# render a dropdown of every message
+CHAT_SUMMARY_FIELDS = ('last_message', 'last_message_preview', 'last_message_sender', 'last_message_at')
+
+
+class GroupMembersForm(forms.Form):
+    """
+    Bulk membership change: the users of a spreadsheet or of a role.
+    """
+    ACTIONS = (('add', _("Add to the group")), ('remove', _("Remove from the group")))
+
+    action = forms.ChoiceField(choices=ACTIONS, widget=forms.RadioSelect, initial='add')
+    file = forms.FileField(
+        required=False, label=_("Spreadsheet"),
+        help_text=_("An .xlsx or .csv file with a userid column; other columns are ignored."),
+    )
+    role = forms.ModelChoiceField(Group.objects.order_by('name'), required=False, label=_("Role"))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload, role = cleaned_data.get('file'), cleaned_data.get('role')
+        if bool(upload) == bool(role):
+            raise forms.ValidationError(_("Choose either a spreadsheet or a role."))
+        if upload:
+            try:
+                cleaned_data['user_ids'] = read_member_ids(upload, upload.name)
+            except ValueError as e:
+                raise forms.ValidationError(str(e))
+        else:
+            cleaned_data['user_ids'] = role_member_ids(role)
+        return cleaned_data
+
+
 @admin.register(GroupChat)
 class GroupChatAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_at')
-    filter_horizontal = ('members',)
+    search_fields = ('name',)
+    # Searched as you type instead of rendering every user into the page
+    autocomplete_fields = ('members',)
+    readonly_fields = CHAT_SUMMARY_FIELDS
+    action_form = ExportActionForm
+    actions = export_actions(lambda groups: {'groups': groups}, 'group')
+
+    def get_urls(self):
+        return [
+            path(
+                '<path:object_id>/members/', self.admin_site.admin_view(self.members_view),
+                name='a_rtchat_groupchat_members',
+            ),
+        ] + super().get_urls()
+
+    def members_view(self, request, object_id):
+        """
+        Add or remove the users of a spreadsheet or role in one batched statement.
+        """
+        group = self.get_object(request, object_id)
+        if group is None:
+            raise Http404
+        if not self.has_change_permission(request, group):
+            raise PermissionDenied
+
+        form = GroupMembersForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            with transaction.atomic():
+                if form.cleaned_data['action'] == 'add':
+                    changed = add_group_members(group, form.cleaned_data['user_ids'])
+                    message = _("Added %(count)d member(s).")
+                else:
+                    changed = remove_group_members(group, form.cleaned_data['user_ids'])
+                    message = _("Removed %(count)d member(s).")
+                self.log_change(request, group, message % {'count': len(changed)})
+            self.message_user(request, message % {'count': len(changed)})
+            return redirect('admin:a_rtchat_groupchat_change', group.pk)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': _("Bulk members: %s") % group,
+            'opts': self.model._meta,
+            'original': group,
+            'form': form,
+            'member_count': group.members.count(),
+        }
+        return TemplateResponse(request, 'admin/a_rtchat/groupchat/members.html', context)
+
+
+# --- PrivateChat Admin ---
+@admin.register(PrivateChat)
+class PrivateChatAdmin(admin.ModelAdmin):
+    autocomplete_fields = ('user1', 'user2')
+    readonly_fields = CHAT_SUMMARY_FIELDS
+    action_form = ExportActionForm
+    actions = export_actions(lambda chats: {'private_chats': chats}, 'private')
+
+
+# --- Message Admin ---
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts at most ADMIN_EXACT_COUNT_LIMIT rows; past that the total is the
+    planner's row estimate, so no page runs COUNT(*) over the whole table.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        exact = queryset[:ADMIN_EXACT_COUNT_LIMIT + 1].count()
+        if exact <= ADMIN_EXACT_COUNT_LIMIT:
+            return exact
+        if connection.vendor != 'postgresql':
+            return queryset.count()
+        sql, params = queryset.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return max(exact, int(plan[0]['Plan']['Plan Rows']))
+
+
+class MessageAdminQuerySet(QuerySet):
+    """
+    Message queryset for the changelist. The date hierarchy lists the years,
+    months or days that have messages with SELECT DISTINCT over every matching
+    row; here each candidate period is probed with an EXISTS on the timestamp
+    index instead (at most 31 probes, for the days of a month).
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if field_name != 'timestamp' or kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        bounds = self.aggregate(first=Min('timestamp'), last=Max('timestamp'))
+        if bounds['first'] is None:
+            return []
+        tzinfo = tzinfo or timezone.get_current_timezone()
+        periods = []
+        period = self._period_start(bounds['first'].astimezone(tzinfo), kind)
+        while period <= bounds['last']:
+            following = self._next_period(period, kind)
+            if self.filter(timestamp__gte=period, timestamp__lt=following).exists():
+                periods.append(period)
+            period = following
+        return periods[::-1] if order == 'DESC' else periods
+
+    @staticmethod
+    def _period_start(moment, kind):
+        return datetime(
+            moment.year, moment.month if kind != 'year' else 1, moment.day if kind == 'day' else 1,
+            tzinfo=moment.tzinfo,
+        )
+
+    @staticmethod
+    def _next_period(period, kind):
+        if kind == 'year':
+            return period.replace(year=period.year + 1)
+        if kind == 'month':
+            return period.replace(year=period.year + period.month // 12, month=period.month % 12 + 1)
+        return datetime.fromordinal(period.toordinal() + 1).replace(tzinfo=period.tzinfo)
+
+
+@admin.register(Message)
+class MessageAdmin(admin.ModelAdmin):
+    """
+    Changelist built for a table of millions of rows: one joined query per
+    page, estimated totals, newest-first on the timestamp index, and the room
+    and sender columns link to the changelist filtered on their indexes.
+    """
+    list_display = ('id', 'timestamp', 'sender_link', 'room_link', 'excerpt', 'is_pinned', 'deleted')
+    list_display_links = ('id',)
+    list_select_related = ('sender', 'group', 'private_chat__user1', 'private_chat__user2')
+    list_filter = ('is_pinned', 'deleted')
+    date_hierarchy = 'timestamp'
+    ordering = ('-timestamp', '-id')
+    search_fields = ('message',)
+    search_help_text = _("Full-text search of message text")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = ('sender', 'deleted_by', 'group')
+    raw_id_fields = ('private_chat', 'reply_to')
+    actions = ('soft_delete', 'restore', 'pin', 'unpin')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return MessageAdminQuerySet(self.model, query=queryset.query, using=queryset.db)
+
+    def get_search_results(self, request, queryset, search_term):
+        # The message_search_idx GIN index instead of icontains over every row
+        if not search_term:
+            return queryset, False
+        query = SearchQuery(search_term, search_type='websearch', config=MESSAGE_SEARCH_CONFIG)
+        return queryset.alias(search=SearchVector('message', config=MESSAGE_SEARCH_CONFIG)).filter(search=query), False
+
+    def get_actions(self, request):
+        # Deleting selected messages one by one does not scale; moderation soft-deletes
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    @admin.display(description=_("Sender"), ordering='sender')
+    def sender_link(self, obj):
+        return format_html('<a href="?{}">{}</a>', urlencode({'sender': obj.sender_id}), obj.sender)
+
+    @admin.display(description=_("Room"))
+    def room_link(self, obj):
+        if obj.group_id:
+            return format_html('<a href="?group={}">{}</a>', obj.group_id, obj.group)
+        return format_html('<a href="?private_chat={}">{}</a>', obj.private_chat_id, obj.private_chat)
+
+    @admin.display(description=_("Message"))
+    def excerpt(self, obj):
+        return Truncator(obj.message).chars(80)
+
+    def _moderate(self, request, queryset, message, **changes):
+        # One UPDATE for the whole selection, however many messages it holds
+        updated = queryset.update(**changes)
+        self.message_user(request, message % {'count': updated})
+
+    @admin.action(description=_("Soft-delete selected messages"), permissions=['change'])
+    def soft_delete(self, request, queryset):
+        self._moderate(
+            request, queryset.filter(deleted=False), _("%(count)d message(s) deleted."),
+            deleted=True, deleted_by=request.user,
+        )
+
+    @admin.action(description=_("Restore selected messages"), permissions=['change'])
+    def restore(self, request, queryset):
+        self._moderate(
+            request, queryset.filter(deleted=True), _("%(count)d message(s) restored."),
+            deleted=False, deleted_by=None,
+        )
 
+    @admin.action(description=_("Pin selected messages"), permissions=['change'])
+    def pin(self, request, queryset):
+        self._moderate(request, queryset.filter(is_pinned=False), _("%(count)d message(s) pinned."), is_pinned=True)
 
-# --- PrivateChat & Message Admin ---
-admin.site.register(PrivateChat)
-admin.site.register(Message)
+    @admin.action(description=_("Unpin selected messages"), permissions=['change'])
+    def unpin(self, request, queryset):
+        self._moderate(request, queryset.filter(is_pinned=True), _("%(count)d message(s) unpinned."), is_pinned=False)
 
 
 # --- Re-register Group with new name ---
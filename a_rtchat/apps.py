@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ARtchatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'a_rtchat'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+# Seconds a session's user is resolved from the cache instead of the database
+USER_CACHE_TTL = getattr(settings, 'CHAT_AUTH_USER_CACHE_TTL', 60)
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def invalidate_cached_users(user_ids):
+    """
+    Drop the cached users of `user_ids` at once, for bulk writes that send no post_save.
+    """
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that resolves the user of a session from the cache.
+
+    Both AuthenticationMiddleware and the channels AuthMiddlewareStack call
+    get_user() on every request and WebSocket connect; with this backend a
+    reconnect storm costs cache reads, not a CustomUser SELECT each. Entries
+    are per user, shared by all of their sessions, and dropped on any change
+    to the user (see signals) and on logout. The session auth hash is still
+    checked against the cached user, so a password change ends other sessions.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, USER_CACHE_TTL)
+        return user if self.user_can_authenticate(user) else None
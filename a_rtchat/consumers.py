@@ -1,78 +1,272 @@
+import asyncio
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+import logging
+from urllib.parse import parse_qs
 from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.utils.timezone import localtime
-from .models import Message, GroupChat, PrivateChat
+from .history import encode_cursor, get_message_page, room_filter
+from .models import Message
+from .membership import get_member_room, load_member_room, load_user_rooms
+from .notifications import room_group_name, user_group_name
+from .persistence import message_buffer
+from .receipts import read_receipts
+from . import presence
+
+logger = logging.getLogger(__name__)
+
+# Most messages replayed to a reconnecting socket; further behind, the client reloads instead
+REPLAY_LIMIT = getattr(settings, 'CHAT_REPLAY_LIMIT', 100)
+
+
+async def save_message(sender, message, room_type, room):
+    if room_type == "private":
+        message_obj = Message(sender=sender, message=message, private_chat=room)
+    else:
+        message_obj = Message(sender=sender, message=message, group=room)
+    try:
+        return await message_buffer.save(message_obj)
+    except Exception:
+        logger.exception("Error saving message from %s", sender.pk)
+        return None
+
+
+def message_frame(message, room_type, room_id):
+    """
+    The JSON-ready chat_message frame of a saved message. `id` and `cursor`
+    let clients drop duplicates and resume after a reconnect.
+    """
+    sender = message.sender
+    return {
+        "type": "chat_message",
+        "id": message.id,
+        "cursor": encode_cursor(message),
+        "message": message.message,
+        "sender_first_name": sender.first_name or sender.username,
+        "sender_username": sender.username,
+        # Format timestamp with timezone offset (localtime)
+        "timestamp": localtime(message.timestamp).isoformat(),
+        "room_type": room_type,
+        "room_id": room_id,
+    }
+
+
+async def post_message(channel_layer, user, room_type, room, content):
+    """
+    Save a chat message and broadcast it to the room's group.
+
+    The frame is encoded once here and receivers forward it as-is. It carries
+    room_type and room_id so user-level sockets can route it.
+    """
+    message_obj = await save_message(user, content, room_type, room)
+    if not message_obj:
+        return
+
+    frame = json.dumps(message_frame(message_obj, room_type, room.id))
+    await channel_layer.group_send(
+        room_group_name(room_type, room.id),
+        {"type": "chat_message", "frame": frame},
+    )
+
+
+async def replay_missed(consumer, room_type, room, after):
+    """
+    Send a reconnecting socket the messages of `room` newer than the cursor
+    `after` in one "replay" frame, from a single keyset query.
+
+    Past REPLAY_LIMIT messages a "too_far_behind" frame is sent instead and the
+    client reloads the page. The socket has already joined the room's group,
+    so a message can arrive both live and in the replay; clients drop the
+    duplicate by id.
+    """
+    try:
+        messages, more = await database_sync_to_async(get_message_page)(
+            room_filter(room_type, room), after=after, limit=REPLAY_LIMIT,
+        )
+    except ValueError:
+        return
+    if more:
+        frame = {"type": "too_far_behind", "room_type": room_type, "room_id": room.id}
+    else:
+        frame = {
+            "type": "replay",
+            "room_type": room_type,
+            "room_id": room.id,
+            "messages": [message_frame(message, room_type, room.id) for message in messages],
+        }
+    await consumer.send(text_data=json.dumps(frame))
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+def add_read_receipt(channel_layer, user, room_type, room_id, data):
+    """
+    Queue a {"type": "read", "message_id"} frame for the coalesced read receipt flush.
+    """
+    try:
+        message_id = int(data.get("message_id"))
+    except (TypeError, ValueError):
+        return
+    read_receipts.add(channel_layer, user, room_type, room_id, message_id)
+
+
+def query_params(scope):
+    return {key: values[-1] for key, values in parse_qs(scope.get("query_string", b"").decode()).items()}
+
+
+class PresenceMixin:
+    """
+    Presence bookkeeping shared by the chat consumers.
+    """
+
+    async def start_presence(self):
+        await presence.touch(self.channel_layer, self.user.pk, self.channel_name)
+        self.heartbeat = asyncio.ensure_future(
+            presence.heartbeat(self.channel_layer, self.user.pk, self.channel_name)
+        )
+
+    async def stop_presence(self):
+        if self.heartbeat:
+            self.heartbeat.cancel()
+            await presence.leave(self.channel_layer, self.user.pk, self.channel_name)
+
+
+class ChatConsumer(PresenceMixin, AsyncWebsocketConsumer):
+    """
+    One connection per open room: ws/chat/<room_type>/<room_id>/.
+    """
+
     async def connect(self):
         self.user = self.scope["user"]
+        self.room_group_name = None
+        self.heartbeat = None
         if not self.user.is_authenticated:
             await self.close()
             return
 
         self.room_type = self.scope["url_route"]["kwargs"]["room_type"]
         self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
-        self.room_group_name = f"chat_{self.room_type}_{self.room_id}"
+
+        # Only members may join; the room is resolved once for the whole connection
+        self.room = await get_member_room(self.user, self.room_type, self.room_id)
+        if self.room is None:
+            await self.close()
+            return
+
+        self.room_group_name = room_group_name(self.room_type, self.room_id)
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
+        await self.start_presence()
+
+        # ?after=<cursor of the last message seen> resumes a dropped connection
+        after = query_params(self.scope).get("after")
+        if after:
+            await replay_missed(self, self.room_type, self.room, after)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.stop_presence()
+        if self.room_group_name:
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     async def receive(self, text_data):
         data = json.loads(text_data)
+        if data.get("type") == "typing":
+            presence.typing_coalescer.add(
+                self.channel_layer, self.room_group_name, self.room_type, self.room_id, self.user
+            )
+            return
+        if data.get("type") == "read":
+            add_read_receipt(self.channel_layer, self.user, self.room_type, self.room.id, data)
+            return
+
         message_content = data.get("message", "").strip()
-        if not message_content:
+        if message_content:
+            await post_message(self.channel_layer, self.user, self.room_type, self.room, message_content)
+
+    async def chat_message(self, event):
+        await self.send(text_data=event["frame"])
+
+
+class UserConsumer(PresenceMixin, AsyncWebsocketConsumer):
+    """
+    One connection per user: ws/chat/, or ws/chat/?room=<type>_<id>&after=<cursor>
+    to resume the open room after a dropped connection (see replay_missed).
+
+    The socket is subscribed to every room of the user plus the user's own
+    group, and frames name their room_type and room_id so the client can
+    route them. Client frames must name the room too:
+    {"room_type", "room_id", "message"}, {"type": "typing", "room_type", "room_id"}
+    or {"type": "read", "room_type", "room_id", "message_id"}.
+    Rooms the user joins or leaves while connected are (un)subscribed through
+    room.joined / room.left events on the user's group.
+    """
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        self.rooms = {}
+        self.heartbeat = None
+        if not self.user.is_authenticated:
+            await self.close()
             return
 
-        sender_first_name = self.user.first_name or self.user.username
-        sender_username = self.user.username
+        self.rooms = await database_sync_to_async(load_user_rooms)(self.user)
+        groups = [user_group_name(self.user.pk)]
+        groups += [room_group_name(room_type, room_id) for room_type, room_id in self.rooms]
+        await asyncio.gather(*(self.channel_layer.group_add(group, self.channel_name) for group in groups))
+        await self.accept()
+        await self.start_presence()
+
+        params = query_params(self.scope)
+        if params.get("after"):
+            room_type, _, room_id = params.get("room", "").partition("_")
+            room = self.rooms.get((room_type, int(room_id))) if room_id.isdigit() else None
+            if room is not None:
+                await replay_missed(self, room_type, room, params["after"])
 
-        # Save message in DB
-        message_obj = await self.save_message(
-            sender=self.user,
-            message=message_content,
-            room_type=self.room_type,
-            room_id=self.room_id,
-        )
-        if not message_obj:
+    async def disconnect(self, close_code):
+        await self.stop_presence()
+        if not self.user.is_authenticated:
             return
+        groups = [user_group_name(self.user.pk)]
+        groups += [room_group_name(room_type, room_id) for room_type, room_id in self.rooms]
+        await asyncio.gather(*(self.channel_layer.group_discard(group, self.channel_name) for group in groups))
 
-        # Format timestamp with timezone offset (localtime)
-        timestamp = localtime(message_obj.timestamp).isoformat()
-
-        # Broadcast message
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message_content,
-                "sender_first_name": sender_first_name,
-                "sender_username": sender_username,
-                "timestamp": timestamp,
-                "room_type": self.room_type,
-            },
-        )
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+        try:
+            key = (data.get("room_type"), int(data.get("room_id")))
+        except (TypeError, ValueError):
+            return
+        room = self.rooms.get(key)
+        if room is None:
+            return
+
+        if data.get("type") == "typing":
+            presence.typing_coalescer.add(self.channel_layer, room_group_name(*key), *key, self.user)
+            return
+        if data.get("type") == "read":
+            add_read_receipt(self.channel_layer, self.user, *key, data)
+            return
+
+        message_content = data.get("message", "").strip()
+        if message_content:
+            await post_message(self.channel_layer, self.user, key[0], room, message_content)
 
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.send(text_data=event["frame"])
 
-    @database_sync_to_async
-    def save_message(self, sender, message, room_type, room_id):
-        try:
-            if room_type == "private":
-                chat = PrivateChat.objects.get(id=room_id)
-                return Message.objects.create(
-                    sender=sender, message=message, private_chat=chat
-                )
-            elif room_type == "group":
-                chat = GroupChat.objects.get(id=room_id)
-                return Message.objects.create(
-                    sender=sender, message=message, group=chat
-                )
-        except Exception as e:
-            print(f"Error saving message: {e}")
-            return None
+    async def room_joined(self, event):
+        key = (event["room_type"], event["room_id"])
+        room = await database_sync_to_async(load_member_room)(self.user, *key)
+        if room is None:
+            return
+        self.rooms[key] = room
+        await self.channel_layer.group_add(room_group_name(*key), self.channel_name)
+        await self.send(text_data=json.dumps({"type": "room_joined", "room_type": key[0], "room_id": key[1]}))
+
+    async def room_left(self, event):
+        key = (event["room_type"], event["room_id"])
+        if self.rooms.pop(key, None) is None:
+            return
+        await self.channel_layer.group_discard(room_group_name(*key), self.channel_name)
+        await self.send(text_data=json.dumps({"type": "room_left", "room_type": key[0], "room_id": key[1]}))
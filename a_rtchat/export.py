@@ -0,0 +1,176 @@
+import csv
+import tempfile
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from .models import Message
+
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+# Rows fetched per round-trip of the server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_HEADER = ('Timestamp (UTC)', 'Room', 'Sender ID', 'Sender', 'Message', 'Deleted', 'Message ID')
+# Leading characters that make a spreadsheet read a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+# ---------------- Selection ----------------
+
+def history_messages(groups=None, private_chats=None, senders=None, start=None, end=None):
+    """
+    Messages to export: those of `groups` and `private_chats` (querysets or
+    ids), or sent by `senders`, between the dates `start` and `end` inclusive
+    (UTC). Deleted messages are included, flagged, as transcripts must be complete.
+    """
+    messages = Message.objects.all()
+    if groups is not None:
+        messages = messages.filter(group__in=groups)
+    if private_chats is not None:
+        messages = messages.filter(private_chat__in=private_chats)
+    if senders is not None:
+        messages = messages.filter(sender__in=senders)
+    if start:
+        messages = messages.filter(timestamp__gte=datetime.combine(start, time.min, dt_timezone.utc))
+    if end:
+        messages = messages.filter(timestamp__lt=datetime.combine(end + timedelta(days=1), time.min, dt_timezone.utc))
+    return messages
+
+
+def export_rows(messages):
+    """
+    Yield one EXPORT_HEADER row per message in (timestamp, id) order.
+
+    Rows come from a server-side cursor EXPORT_CHUNK_SIZE at a time, so memory
+    stays flat however long the transcript is.
+    """
+    rows = messages.order_by('timestamp', 'id').values_list(
+        'timestamp', 'group__name', 'private_chat__user1__username', 'private_chat__user2__username',
+        'sender_id', 'sender__first_name', 'sender__last_name', 'sender__username', 'message', 'deleted', 'id',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for timestamp, group, user1, user2, sender_id, first, last, username, text, deleted, message_id in rows:
+        room = group if group is not None else f'{user1} & {user2}'
+        sender = f'{first} {last}'.strip() or username
+        yield (
+            timestamp.astimezone(dt_timezone.utc).replace(tzinfo=None),
+            room, sender_id, sender, text, deleted, message_id,
+        )
+
+
+# ---------------- Writers ----------------
+
+class _Echo:
+    """
+    File-like object whose write() returns the data, for csv.writer to format single rows.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_text(value):
+    """
+    Quote user text that a spreadsheet would otherwise run as a formula.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(rows, rows_per_chunk=500):
+    """
+    Encode rows as CSV, yielding bytes a few hundred rows at a time. Starts
+    with a byte order mark so Excel opens the file as UTF-8.
+    """
+    writer = csv.writer(_Echo())
+    yield '\ufeff'.encode()
+    yield writer.writerow(EXPORT_HEADER).encode()
+    while chunk := list(islice(rows, rows_per_chunk)):
+        yield ''.join(writer.writerow([_csv_text(value) for value in row]) for row in chunk).encode()
+
+
+def _xlsx_cell(sheet, value):
+    """
+    Strings are written as text cells, so a message, room or sender name
+    starting with "=" is never stored as a formula.
+    """
+    if not isinstance(value, str):
+        return value
+    # Control characters are valid in messages but not in XML
+    cell = WriteOnlyCell(sheet, ILLEGAL_CHARACTERS_RE.sub('', value))
+    cell.data_type = 's'
+    return cell
+
+
+def write_xlsx(rows, file):
+    """
+    Write rows to `file` as a workbook. openpyxl's write-only mode streams
+    rows out to disk instead of building the sheet in memory.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Messages')
+    sheet.append(EXPORT_HEADER)
+    for row in rows:
+        sheet.append([_xlsx_cell(sheet, value) for value in row])
+    workbook.save(file)
+
+
+def write_export(messages, export_format, file):
+    """
+    Write an export of `messages` to a binary `file`, for the management command.
+    """
+    if export_format == 'xlsx':
+        write_xlsx(export_rows(messages), file)
+    else:
+        for chunk in csv_chunks(export_rows(messages)):
+            file.write(chunk)
+
+
+# ---------------- Responses ----------------
+
+async def _in_thread(iterator, batch=20):
+    """
+    Drive a blocking iterator from the event loop, `batch` items per hop.
+
+    Under ASGI, StreamingHttpResponse reads a synchronous iterator to the end
+    before sending anything; this one is consumed as it is sent. The hops are
+    thread-sensitive, so a server-side cursor stays on the request's connection.
+    """
+    next_batch = sync_to_async(lambda: list(islice(iterator, batch)), thread_sensitive=True)
+    while items := await next_batch():
+        for item in items:
+            yield item
+
+
+def _xlsx_chunks(messages, chunk_size=64 * 1024):
+    with tempfile.TemporaryFile() as file:
+        write_xlsx(export_rows(messages), file)
+        file.seek(0)
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+def export_response(messages, export_format, filename):
+    """
+    Stream an export of `messages` as a CSV or XLSX download.
+
+    A workbook can only be sent once it is complete, so it is built in a
+    temporary file first; CSV rows are sent as they are read.
+    """
+    if export_format == 'xlsx':
+        chunks = _xlsx_chunks(messages)
+    else:
+        chunks = csv_chunks(export_rows(messages))
+    response = StreamingHttpResponse(_in_thread(chunks), content_type=_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
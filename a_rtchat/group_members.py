@@ -0,0 +1,76 @@
+import csv
+import io
+from pathlib import Path
+
+from .models import CustomUser
+
+
+# ---------------- Bulk Membership ----------------
+
+def add_group_members(group, user_ids):
+    """
+    Add users to `group` in one batched INSERT into the membership table.
+    `user_ids` is a list of userids or a queryset of them (used as a
+    subquery). Unknown userids and current members are skipped. Returns the
+    userids added.
+
+    members.add() sends a single m2m_changed for the whole batch, so read
+    states, chat lists, membership caches and open sockets are updated once
+    (see signals.py) rather than per member.
+    """
+    new_ids = list(
+        CustomUser.objects.filter(pk__in=user_ids).exclude(chat_groups=group).values_list('pk', flat=True)
+    )
+    if new_ids:
+        group.members.add(*new_ids)
+    return new_ids
+
+
+def remove_group_members(group, user_ids):
+    """
+    Remove users from `group` in one DELETE, like add_group_members().
+    Returns the userids removed; those that were not members are ignored.
+    """
+    member_ids = list(group.members.filter(pk__in=user_ids).values_list('pk', flat=True))
+    if member_ids:
+        group.members.remove(*member_ids)
+    return member_ids
+
+
+def role_member_ids(role):
+    """
+    Userids of the users with an auth Group (role), as a subquery.
+    """
+    return role.user_set.values('pk')
+
+
+# ---------------- Spreadsheet Import ----------------
+
+def read_member_ids(file, filename):
+    """
+    Userids from the `userid` column of an .xlsx or .csv file; other columns
+    are ignored, so an import_users sheet can be reused as is. Raises
+    ValueError for other file types or a missing column.
+    """
+    suffix = Path(filename).suffix.lower()
+    if suffix == '.csv':
+        return _column_values(csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline='')))
+    if suffix in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            return _column_values(workbook.active.iter_rows(values_only=True))
+        finally:
+            workbook.close()
+    raise ValueError("Only .xlsx and .csv files are supported")
+
+
+def _column_values(rows, column='userid'):
+    header = [str(name or '').strip().lower() for name in next(rows, ())]
+    if column not in header:
+        raise ValueError(f"The file has no {column} column")
+    index = header.index(column)
+    values = {str(row[index]).strip() for row in rows if len(row) > index and row[index] is not None}
+    values.discard('')
+    return sorted(values)
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Message
+
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+# Backward pages look this far back first, so they only touch the newest month partitions
+HISTORY_RECENT_WINDOW = timedelta(days=getattr(settings, 'CHAT_HISTORY_RECENT_DAYS', 31))
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+# ---------------- Cursors ----------------
+
+def encode_cursor(message):
+    """
+    Encode a message position as "<epoch microseconds>-<id>".
+    """
+    micros = (message.timestamp - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}-{message.id}"
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor. Raises ValueError on garbage input,
+    including numbers out of range for a datetime or a message id.
+    """
+    micros, _, message_id = cursor.partition('-')
+    try:
+        timestamp = _EPOCH + timedelta(microseconds=int(micros))
+    except OverflowError as error:
+        raise ValueError(f'Cursor out of range: {cursor!r}') from error
+    message_id = int(message_id)
+    if not 0 < message_id < 2 ** 63:
+        raise ValueError(f'Cursor out of range: {cursor!r}')
+    return timestamp, message_id
+
+
+# ---------------- Pages ----------------
+
+def room_filter(chat_type, chat):
+    """
+    Keyword filter selecting the messages of a group or private chat.
+    """
+    if chat_type == 'group':
+        return {'group': chat}
+    return {'private_chat': chat}
+
+
+def get_message_page(room, before=None, after=None, limit=HISTORY_PAGE_SIZE):
+    """
+    Return one page of messages for a room as (messages, next_cursor).
+
+    `room` is a filter from room_filter(). Pages are keyset-paginated on
+    (timestamp, id): with `before` the page holds the messages just older than
+    the cursor, with `after` the ones just newer, and with neither the newest
+    page. Messages are always returned oldest first with their sender joined in.
+    next_cursor continues in the same direction and is None when nothing is left.
+
+    Backward pages first read the HISTORY_RECENT_WINDOW before their end so
+    busy rooms stay within the newest partitions; quiet rooms take a second
+    query for the rest.
+    """
+    limit = max(1, min(int(limit), HISTORY_MAX_PAGE_SIZE))
+    queryset = Message.objects.filter(**room).select_related('sender').only(
+        'id', 'message', 'timestamp', 'group_id', 'private_chat_id',
+        'sender__userid', 'sender__username', 'sender__first_name', 'sender__last_name',
+    )
+
+    if after:
+        timestamp, message_id = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+        ).order_by('timestamp', 'id')
+        messages = list(queryset[:limit + 1])
+    else:
+        end = timezone.now()
+        if before:
+            end, message_id = decode_cursor(before)
+            queryset = queryset.filter(
+                Q(timestamp__lt=end) | Q(timestamp=end, id__lt=message_id)
+            )
+        queryset = queryset.order_by('-timestamp', '-id')
+
+        # Messages are partitioned by month: a bounded query is pruned to the
+        # partitions of the window, and older ones are only read when it falls short
+        window_start = end - HISTORY_RECENT_WINDOW
+        messages = list(queryset.filter(timestamp__gte=window_start)[:limit + 1])
+        if len(messages) <= limit:
+            messages += queryset.filter(timestamp__lt=window_start)[:limit + 1 - len(messages)]
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+
+    if not after:
+        messages.reverse()
+
+    next_cursor = None
+    if has_more and messages:
+        next_cursor = encode_cursor(messages[-1] if after else messages[0])
+
+    return messages, next_cursor
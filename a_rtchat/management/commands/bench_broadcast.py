@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from a_rtchat.consumers import ChatConsumer
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark the receiving side of a chat broadcast: CPU per broadcast "
+        "for per-receiver json.dumps versus forwarding the frame encoded once by the sender."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,500,1000', help='Comma separated group sizes')
+        parser.add_argument('--broadcasts', type=int, default=200, help='Broadcasts per group size')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        asyncio.run(self.run(sizes, options['broadcasts']))
+
+    async def run(self, sizes, broadcasts):
+        message = {
+            "type": "chat_message",
+            "message": "Shift handover: all stations report in " * 3,
+            "sender_first_name": "Amina",
+            "sender_username": "amina.k",
+            "timestamp": "2025-09-01T08:00:00+03:00",
+            "room_type": "group",
+        }
+
+        self.stdout.write(f"{'members':>8} {'per-receiver dumps':>20} {'encode once':>14} {'speedup':>8}")
+        for size in sizes:
+            consumers = [self.make_consumer() for _ in range(size)]
+
+            async def legacy():
+                for consumer in consumers:
+                    await consumer.send(text_data=json.dumps(message))
+
+            async def encode_once():
+                event = {"type": "chat_message", "frame": json.dumps(message)}
+                for consumer in consumers:
+                    await consumer.chat_message(event)
+
+            legacy_us = await self.measure(legacy, broadcasts)
+            once_us = await self.measure(encode_once, broadcasts)
+            self.stdout.write(
+                f"{size:>8} {legacy_us:>17.1f} us {once_us:>11.1f} us {legacy_us / once_us:>7.2f}x"
+            )
+
+    def make_consumer(self):
+        consumer = ChatConsumer()
+
+        async def sink(message):
+            pass
+
+        consumer.base_send = sink
+        return consumer
+
+    async def measure(self, broadcast, count):
+        """
+        CPU microseconds per broadcast.
+        """
+        await broadcast()
+        started = time.process_time()
+        for _ in range(count):
+            await broadcast()
+        return (time.process_time() - started) / count * 1e6
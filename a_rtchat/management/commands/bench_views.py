@@ -0,0 +1,154 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from a_rtchat.models import CustomUser, GroupChat, PrivateChat
+
+
+VIEWS = ('home', 'filter_groups', 'filter_private', 'chat_area_group', 'chat_area_private',
+         'get_messages', 'get_messages_older')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the chat HTTP views as a logged-in user: wall time, query count and "
+        "peak Python memory per view, over repeated requests. Run it against a dataset "
+        "from generate_chat_data and compare the JSON output between releases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to benchmark as (default: the member of the most groups)')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per view')
+        parser.add_argument('--views', default=','.join(VIEWS), help=f"Comma separated subset of {', '.join(VIEWS)}")
+        parser.add_argument('--output', help='Write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        names = options['views'].split(',')
+        unknown = set(names) - set(VIEWS)
+        if unknown:
+            raise CommandError(f"Unknown views: {', '.join(sorted(unknown))}")
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        user = self.pick_user(options['user'])
+        host = next((host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')), 'localhost')
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+        urls = self.view_urls(client, user)
+
+        results = {
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'user': user.username,
+            'repeat': options['repeat'],
+            'views': {},
+        }
+        self.stdout.write(f"Benchmarking as {user.username}, {options['repeat']} requests per view")
+        self.stdout.write(
+            f"{'view':<20} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'queries':>8} {'peak KiB':>9}"
+        )
+        for name in names:
+            url = urls.get(name)
+            if url is None:
+                self.stdout.write(f"{name:<20} skipped: no such chat or page for {user.username}")
+                continue
+            result = self.measure(client, url, options['repeat'])
+            results['views'][name] = result
+            self.stdout.write(
+                f"{name:<20} {result['wall_ms']['p50']:>8.1f} {result['wall_ms']['p95']:>8.1f} "
+                f"{result['wall_ms']['max']:>8.1f} {result['queries']:>8} {result['peak_kib']:>9.0f}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return CustomUser.objects.get(username=username)
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"No user {username!r}")
+        user = CustomUser.objects.annotate(group_count=Count('chat_groups')).order_by('-group_count').first()
+        if user is None:
+            raise CommandError("No users: run generate_chat_data first")
+        return user
+
+    def view_urls(self, client, user):
+        """
+        URLs for each benchmarked view, using the user's busiest group and latest private chat.
+        """
+        urls = {
+            'home': reverse('a_rtchat:home'),
+            'filter_groups': reverse('a_rtchat:filter_chats', args=['groups']),
+            'filter_private': reverse('a_rtchat:filter_chats', args=['private']),
+        }
+        group = (
+            GroupChat.objects.filter(members=user).exclude(last_message_at=None)
+            .annotate(member_count=Count('members')).order_by('-member_count').first()
+        )
+        private = (
+            PrivateChat.objects.filter(Q(user1=user) | Q(user2=user))
+            .order_by(F('last_message_at').desc(nulls_last=True)).first()
+        )
+        if group:
+            urls['chat_area_group'] = reverse('a_rtchat:chat_area', args=['group', group.id])
+            urls['get_messages'] = reverse('a_rtchat:get_messages', args=['group', group.id])
+            # The second page exercises the keyset cursor rather than the newest-first path
+            first_page = client.get(urls['get_messages']).json()
+            if first_page.get('next_cursor'):
+                urls['get_messages_older'] = f"{urls['get_messages']}?before={first_page['next_cursor']}"
+        if private:
+            urls['chat_area_private'] = reverse('a_rtchat:chat_area', args=['private', private.id])
+        return urls
+
+    def measure(self, client, url, repeat):
+        response = client.get(url)  # warm caches, templates and the connection
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+
+        # Count through an execute wrapper: the request_started signal resets connection.queries
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        timings = []
+        for _ in range(repeat):
+            queries.clear()
+            with connection.execute_wrapper(count_query):
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+
+        # Tracing slows allocation down, so peak memory gets its own request
+        tracemalloc.start()
+        client.get(url)
+        peak = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'url': url,
+            'status': response.status_code,
+            'bytes': len(response.content),
+            'queries': len(queries),
+            'wall_ms': {
+                'p50': statistics.median(timings),
+                'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+                'max': timings[-1],
+                'mean': statistics.fmean(timings),
+            },
+            'peak_kib': peak,
+        }
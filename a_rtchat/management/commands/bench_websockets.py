@@ -0,0 +1,291 @@
+import asyncio
+import json
+import platform
+import time
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, channel_layers, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from a_rtchat.models import CustomUser, GroupChat
+from a_rtchat.routing import websocket_urlpatterns
+
+
+BENCH_USERID = 'UTEL/CC/UGCL-{:04d}/9999'
+BENCH_PREFIX = 'bench_ws_'
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+# ---------------- Clients ----------------
+
+class CommunicatorClient:
+    """
+    In-process client driving the ASGI app through channels.testing.
+    """
+
+    application = URLRouter(websocket_urlpatterns)
+
+    def __init__(self, user, path):
+        self.communicator = WebsocketCommunicator(self.application, path)
+        self.communicator.scope['user'] = user
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=30)
+        return connected
+
+    async def send(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def receive(self):
+        return await self.communicator.receive_from(timeout=3600)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class SocketClient:
+    """
+    Real WebSocket client against a running server, authenticated by session cookie.
+    """
+
+    def __init__(self, user, url, cookie):
+        self.url = url
+        self.cookie = cookie
+
+    async def connect(self):
+        import websockets
+
+        try:
+            self.socket = await websockets.connect(
+                self.url, additional_headers={'Cookie': self.cookie}, max_queue=None,
+            )
+        except Exception:
+            return False
+        return True
+
+    async def send(self, text):
+        await self.socket.send(text)
+
+    async def receive(self):
+        return await self.socket.recv()
+
+    async def close(self):
+        await self.socket.close()
+
+
+# ---------------- Command ----------------
+
+class Command(BaseCommand):
+    help = (
+        "Load-test ChatConsumer with simulated clients, either in process through "
+        "WebsocketCommunicator or over real sockets against a running server (--url). "
+        "Reports connect rate, end-to-end latency percentiles and broadcast throughput "
+        "per room size, and can write the results as JSON for before/after comparisons."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help='Simulated clients (max 9999)')
+        parser.add_argument('--room-sizes', default='2,10,100,500', help='Comma separated members per room')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent per room for each room size')
+        parser.add_argument('--layer', choices=['memory', 'redis', 'settings'], default='settings',
+                            help='Channel layer for in-process runs (ignored with --url)')
+        parser.add_argument('--url', help='Server base URL, e.g. ws://127.0.0.1:8000; omit to run in process')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for deliveries per room size')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark users and rooms afterwards')
+
+    def handle(self, *args, **options):
+        clients = options['clients']
+        sizes = [int(size) for size in options['room_sizes'].split(',')]
+        if not 1 <= clients <= 9999:
+            raise CommandError("--clients must be between 1 and 9999")
+        if max(sizes) > clients:
+            raise CommandError("Room sizes cannot exceed --clients")
+        if options['url']:
+            try:
+                import websockets  # noqa: F401
+            except ImportError:
+                raise CommandError("Real-socket runs need the 'websockets' package")
+        else:
+            self.configure_layer(options['layer'])
+
+        self.cleanup()
+        users = self.create_users(clients)
+        try:
+            results = asyncio.run(self.run(users, sizes, options))
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def configure_layer(self, layer):
+        # Raise the per-channel capacity so bursts measure latency, not dropped frames
+        if layer == 'memory':
+            channel_layers.set('default', InMemoryChannelLayer(capacity=100000))
+        elif layer == 'redis':
+            from channels_redis.core import RedisChannelLayer
+
+            config = settings.CHANNEL_LAYERS['default'].get('CONFIG', {})
+            hosts = config.get('hosts') or ['redis://127.0.0.1:6379']
+            channel_layers.set('default', RedisChannelLayer(hosts=hosts, capacity=100000))
+
+    # ---------------- Fixtures ----------------
+
+    def create_users(self, count):
+        password = make_password(None)
+        return CustomUser.objects.bulk_create([
+            CustomUser(userid=BENCH_USERID.format(i), username=f'{BENCH_PREFIX}{i}', first_name=f'Bench{i}', password=password)
+            for i in range(count)
+        ], batch_size=1000)
+
+    def cleanup(self):
+        GroupChat.objects.filter(name__startswith=BENCH_PREFIX).delete()
+        CustomUser.objects.filter(username__startswith=BENCH_PREFIX).delete()
+
+    def create_rooms(self, users, size):
+        rooms = []
+        for start in range(0, len(users) - size + 1, size):
+            group = GroupChat.objects.create(name=f'{BENCH_PREFIX}{size}_{start}')
+            members = users[start:start + size]
+            group.members.add(*members)
+            rooms.append((group, members))
+        return rooms
+
+    def session_cookie(self, user):
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = user.pk
+        store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.save()
+        return f'{settings.SESSION_COOKIE_NAME}={store.session_key}'
+
+    # ---------------- Run ----------------
+
+    async def run(self, users, sizes, options):
+        layer = get_channel_layer()
+        results = {
+            'started_at': timezone.now().isoformat(),
+            'transport': 'socket' if options['url'] else 'communicator',
+            'url': options['url'],
+            # With --url the layer is whatever the server runs
+            'layer': 'server' if options['url'] else f'{type(layer).__module__}.{type(layer).__name__}',
+            'clients': len(users),
+            'messages_per_room': options['messages'],
+            'python': platform.python_version(),
+            'room_sizes': [],
+        }
+        self.stdout.write(
+            f"{results['transport']} / {results['layer']}: {len(users)} clients, "
+            f"{options['messages']} messages per room"
+        )
+        self.stdout.write(
+            f"{'size':>6} {'rooms':>6} {'conn/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'deliv/s':>10} {'lost':>6}"
+        )
+        for size in sizes:
+            result = await self.run_size(users, size, options)
+            results['room_sizes'].append(result)
+            self.stdout.write(
+                f"{size:>6} {result['rooms']:>6} {result['connect_rate']:>8.0f} "
+                f"{result['latency_ms']['p50'] or 0:>8.1f} {result['latency_ms']['p95'] or 0:>8.1f} "
+                f"{result['latency_ms']['p99'] or 0:>8.1f} {result['deliveries_per_second']:>10.0f} "
+                f"{result['expected_deliveries'] - result['deliveries']:>6}"
+            )
+        return results
+
+    async def run_size(self, users, size, options):
+        rooms = await sync_to_async(self.create_rooms)(users, size)
+
+        # Connect every member of every room
+        clients = []
+        for group, members in rooms:
+            for user in members:
+                if options['url']:
+                    url = f"{options['url'].rstrip('/')}/ws/chat/group/{group.id}/"
+                    cookie = await sync_to_async(self.session_cookie)(user)
+                    clients.append((group, SocketClient(user, url, cookie)))
+                else:
+                    clients.append((group, CommunicatorClient(user, f'/ws/chat/group/{group.id}/')))
+
+        started = time.perf_counter()
+        connected = await asyncio.gather(*(client.connect() for _, client in clients))
+        connect_seconds = time.perf_counter() - started
+        failed = connected.count(False)
+        clients = [pair for pair, ok in zip(clients, connected) if ok]
+
+        # Each receiver records the latency of every chat message it gets
+        latencies = []
+        members_by_room = {}
+        for group, client in clients:
+            members_by_room.setdefault(group.id, []).append(client)
+        expected = sum(len(members) for members in members_by_room.values()) * options['messages']
+        done = asyncio.Event()
+
+        async def listen(client):
+            while True:
+                frame = json.loads(await client.receive())
+                if frame.get('type') != 'chat_message':
+                    continue
+                sent_at = float(frame['message'].split(':', 2)[1])
+                latencies.append(time.perf_counter() - sent_at)
+                if len(latencies) >= expected:
+                    done.set()
+
+        listeners = [asyncio.ensure_future(listen(client)) for _, client in clients]
+
+        async def send_room(members):
+            for seq in range(options['messages']):
+                sender = members[seq % len(members)]
+                await sender.send(json.dumps({'message': f'bench:{time.perf_counter()}:{seq}'}))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send_room(members) for members in members_by_room.values()))
+        try:
+            await asyncio.wait_for(done.wait(), options['timeout'])
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        await asyncio.gather(*(client.close() for _, client in clients), return_exceptions=True)
+        await sync_to_async(GroupChat.objects.filter(name__startswith=f'{BENCH_PREFIX}{size}_').delete)()
+
+        latencies_ms = [latency * 1000 for latency in latencies]
+        return {
+            'room_size': size,
+            'rooms': len(rooms),
+            'connections': len(clients),
+            'failed_connections': failed,
+            'connect_seconds': connect_seconds,
+            'connect_rate': len(clients) / connect_seconds if connect_seconds else 0,
+            'messages_sent': len(members_by_room) * options['messages'],
+            'expected_deliveries': expected,
+            'deliveries': len(latencies),
+            'deliveries_per_second': len(latencies) / elapsed if elapsed else 0,
+            'latency_ms': {
+                'p50': percentile(latencies_ms, 50),
+                'p95': percentile(latencies_ms, 95),
+                'p99': percentile(latencies_ms, 99),
+                'max': max(latencies_ms) if latencies_ms else None,
+            },
+        }
@@ -0,0 +1,252 @@
+import csv
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from a_rtchat.models import ChatReadState, CustomUser, GroupChat, Message, PrivateChat
+from a_rtchat.partitions import ensure_partitions, is_partitioned
+from a_rtchat.search import invalidate_directory
+
+
+# Valid userids kept clear of real ones: the YYYY part runs from 8000 up
+SYNTH_USERID = 'UTEL/CC/UGCL-{:04d}/{:04d}'
+SYNTH_PREFIX = 'synth_'
+WORDS = (
+    "shift handover station report ready please confirm the site team meeting at "
+    "today tomorrow network outage fixed ticket closed call me when you are done "
+    "thanks noted on my way delayed check the logs update sent approved"
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic chat dataset for profiling: users, groups with skewed "
+        "(Zipf-like) membership, private chats and messages spread over time. Rows are "
+        "written with bulk_create, and messages with COPY on PostgreSQL. Chat summaries "
+        "and read states are filled in so the sidebar and history paths behave as in production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--max-group-size', type=int, default=500, help='Members of the largest group')
+        parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent for group sizes and room activity')
+        parser.add_argument('--private-chats', type=int, default=5000)
+        parser.add_argument('--messages', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=365, help='Spread messages over this many past days')
+        parser.add_argument('--password', default='synthetic', help='Password shared by all generated users')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=50000)
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create for messages even on PostgreSQL')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError("--users must be at least 2")
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+
+        with self.step("users"):
+            users = self.create_users(options['users'], options['password'])
+            invalidate_directory()
+        with self.step("groups"):
+            groups = self.create_groups(users, options['groups'], options['max_group_size'], options['skew'])
+        with self.step("private chats"):
+            privates = self.create_private_chats(users, options['private_chats'])
+
+        # Room activity follows the same skew: a few rooms carry most of the traffic
+        rooms = [('group', group_id, members) for group_id, members in groups]
+        rooms += [('private', chat_id, pair) for chat_id, pair in privates]
+        if not rooms:
+            raise CommandError("Nothing to write messages to: add --groups or --private-chats")
+        self.random.shuffle(rooms)
+        weights = self.zipf_weights(len(rooms), options['skew'])
+
+        if connection.vendor == 'postgresql' and is_partitioned():
+            # Keep the backdated messages out of the default partition
+            with self.step("message partitions"):
+                now = timezone.now()
+                ensure_partitions(now - timedelta(days=options['days']), now)
+        with self.step(f"{options['messages']} messages ({'COPY' if self.use_copy else 'bulk_create'})"):
+            self.create_messages(rooms, weights, options['messages'], options['days'])
+        with self.step("chat summaries and read states"):
+            self.refresh_summaries(groups, privates)
+        if connection.vendor == 'postgresql':
+            with self.step("ANALYZE"):
+                with connection.cursor() as cursor:
+                    for model in (CustomUser, GroupChat, GroupChat.members.through, PrivateChat, Message, ChatReadState):
+                        cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(users)} users, {len(groups)} groups, {len(privates)} private chats, "
+            f"{options['messages']} messages. Log in as {users[0].username} (or any {SYNTH_PREFIX}N) "
+            f"with password '{options['password']}'."
+        ))
+
+    # ---------------- Helpers ----------------
+
+    @contextmanager
+    def step(self, label):
+        started = time.perf_counter()
+        yield
+        self.stdout.write(f"  {label}: {time.perf_counter() - started:.1f}s")
+
+    def zipf_weights(self, count, skew):
+        return [1 / (rank + 1) ** skew for rank in range(count)]
+
+    def create_users(self, count, password):
+        # One hash for everyone: hashing is the slow part and the value is the same
+        password = make_password(password)
+        # Runs add to earlier ones instead of colliding with them
+        start = CustomUser.objects.filter(username__startswith=SYNTH_PREFIX).count()
+        if start + count > 1999 * 10000:
+            raise CommandError("Too many synthetic users")
+        users = (
+            CustomUser(
+                userid=SYNTH_USERID.format(i % 10000, 8000 + i // 10000),
+                username=f'{SYNTH_PREFIX}{i}',
+                first_name=self.random.choice(WORDS).title(),
+                last_name=f'Synthetic{i}',
+                password=password,
+            )
+            for i in range(start, start + count)
+        )
+        created = []
+        while True:
+            batch = [user for _, user in zip(range(self.batch_size), users)]
+            if not batch:
+                return created
+            created += CustomUser.objects.bulk_create(batch)
+
+    def create_groups(self, users, count, max_size, skew):
+        """
+        Return [(group_id, [member ids])]. Group sizes fall off as rank ** -skew.
+        """
+        groups = GroupChat.objects.bulk_create([
+            GroupChat(name=f'Synthetic group {i}') for i in range(count)
+        ])
+        user_ids = [user.pk for user in users]
+        Membership = GroupChat.members.through
+        result = []
+        rows = []
+        for rank, group in enumerate(groups):
+            size = max(2, min(len(user_ids), int(max_size / (rank + 1) ** skew)))
+            members = self.random.sample(user_ids, size)
+            rows += [Membership(groupchat_id=group.id, customuser_id=user_id) for user_id in members]
+            result.append((group.id, members))
+        Membership.objects.bulk_create(rows, batch_size=self.batch_size)
+        return result
+
+    def create_private_chats(self, users, count):
+        """
+        Return [(chat_id, (user1 id, user2 id))] for distinct pairs.
+        """
+        user_ids = [user.pk for user in users]
+        count = min(count, len(user_ids) * (len(user_ids) - 1) // 2)
+        pairs = set()
+        while len(pairs) < count:
+            first, second = self.random.sample(user_ids, 2)
+            pairs.add((min(first, second), max(first, second)))
+        chats = PrivateChat.objects.bulk_create(
+            [PrivateChat(user1_id=first, user2_id=second) for first, second in sorted(pairs)],
+            batch_size=self.batch_size,
+        )
+        return [(chat.id, (chat.user1_id, chat.user2_id)) for chat in chats]
+
+    # ---------------- Messages ----------------
+
+    def generate_messages(self, rooms, weights, count, days):
+        """
+        Yield (sender_id, group_id, private_chat_id, text, timestamp) in time order.
+        """
+        now = timezone.now()
+        step = timedelta(days=days) / max(count, 1)
+        timestamp = now - timedelta(days=days)
+        chosen = self.random.choices(range(len(rooms)), weights=weights, k=count)
+        for index in chosen:
+            room_type, room_id, members = rooms[index]
+            text = ' '.join(self.random.choices(WORDS, k=self.random.randint(2, 20)))
+            timestamp += step
+            yield (
+                self.random.choice(members),
+                room_id if room_type == 'group' else None,
+                room_id if room_type == 'private' else None,
+                text,
+                timestamp,
+            )
+
+    def create_messages(self, rooms, weights, count, days):
+        rows = self.generate_messages(rooms, weights, count, days)
+        written = 0
+        while written < count:
+            batch = [row for _, row in zip(range(self.batch_size), rows)]
+            if not batch:
+                break
+            if self.use_copy:
+                self.copy_messages(batch)
+            else:
+                Message.objects.bulk_create([
+                    Message(sender_id=sender_id, group_id=group_id, private_chat_id=private_chat_id,
+                            message=text, timestamp=timestamp, read=True)
+                    for sender_id, group_id, private_chat_id, text, timestamp in batch
+                ])
+            written += len(batch)
+            self.stdout.write(f"    {written}/{count} messages", ending='\r')
+        self.stdout.write('')
+
+    def copy_messages(self, batch):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for sender_id, group_id, private_chat_id, text, timestamp in batch:
+            writer.writerow([sender_id, group_id, private_chat_id, text, timestamp.isoformat(), 't', 'f', 'f'])
+        buffer.seek(0)
+        table = connection.ops.quote_name(Message._meta.db_table)
+        sql = (
+            f"COPY {table} (sender_id, group_id, private_chat_id, message, timestamp, read, is_pinned, deleted) "
+            f"FROM STDIN WITH (FORMAT csv)"
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.copy_expert(sql, buffer)
+
+    # ---------------- Summaries ----------------
+
+    def refresh_summaries(self, groups, privates):
+        """
+        Fill the denormalized last-message columns and mark every member read up
+        to the last message, the state the runtime paths keep up incrementally.
+        """
+        group_ids = [group_id for group_id, _ in groups]
+        private_ids = [chat_id for chat_id, _ in privates]
+        for model, fk, ids in ((GroupChat, 'group', group_ids), (PrivateChat, 'private_chat', private_ids)):
+            latest = Message.objects.filter(**{fk: OuterRef('pk')}).order_by('-timestamp', '-id')
+            model.objects.filter(id__in=ids).update(
+                last_message=Subquery(latest.values('id')[:1]),
+                last_message_preview=Subquery(latest.annotate(preview=Substr('message', 1, 100)).values('preview')[:1]),
+                last_message_sender=Subquery(latest.values('sender_id')[:1]),
+                last_message_at=Subquery(latest.values('timestamp')[:1]),
+            )
+
+        states = [
+            ChatReadState(user_id=user_id, group_id=group_id)
+            for group_id, members in groups for user_id in members
+        ]
+        states += [
+            ChatReadState(user_id=user_id, private_chat_id=chat_id)
+            for chat_id, pair in privates for user_id in pair
+        ]
+        ChatReadState.objects.bulk_create(states, batch_size=self.batch_size, ignore_conflicts=True)
+        ChatReadState.objects.filter(group_id__in=group_ids).update(
+            last_read_message=Subquery(GroupChat.objects.filter(pk=OuterRef('group_id')).values('last_message_id')[:1])
+        )
+        ChatReadState.objects.filter(private_chat_id__in=private_ids).update(
+            last_read_message=Subquery(PrivateChat.objects.filter(pk=OuterRef('private_chat_id')).values('last_message_id')[:1])
+        )
@@ -0,0 +1,251 @@
+import csv
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from a_rtchat.backends import invalidate_cached_users
+from a_rtchat.models import CustomUser, USERID_REGEX
+from a_rtchat.search import invalidate_directory
+
+
+COLUMNS = ('userid', 'username', 'first_name', 'middle_name', 'last_name', 'password', 'is_active', 'is_staff')
+UPDATE_FIELDS = ['username', 'first_name', 'middle_name', 'last_name', 'password', 'is_active', 'is_staff']
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+def _hash_passwords(passwords):
+    """
+    Hash one chunk of passwords. Runs in a worker process.
+    """
+    return [make_password(password) for password in passwords]
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import users from an .xlsx or .csv file with the columns "
+        + ", ".join(COLUMNS)
+        + ". Existing users are updated by userid, in the columns the file has; "
+        "their passwords are kept unless --reset-passwords is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the .xlsx or .csv file')
+        parser.add_argument('--sheet', help='Worksheet name (xlsx only, defaults to the active sheet)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT batch')
+        parser.add_argument('--workers', type=int, default=None, help='Password hashing processes (defaults to CPU count)')
+        parser.add_argument('--default-password', help='Password for rows whose password cell is empty')
+        parser.add_argument(
+            '--reset-passwords', action='store_true',
+            help="Overwrite existing users' passwords; by default only new users get the file's passwords",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        self.workers = options['workers'] or os.cpu_count() or 1
+        self.default_password = options['default_password']
+        self.reset_passwords = options['reset_passwords']
+        self.update_fields = None
+        self.userid_pattern = re.compile(USERID_REGEX)
+        self.seen_userids = set()
+        self.seen_usernames = set()
+
+        rows = self.read_rows(path, options['sheet'])
+        imported = skipped = 0
+        started = time.monotonic()
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            for batch_number, batch in enumerate(iter(lambda: list(islice(rows, batch_size)), []), start=1):
+                batch_started = time.monotonic()
+                users = []
+                for line, row in batch:
+                    user = self.build_user(line, row)
+                    if user is None:
+                        skipped += 1
+                    else:
+                        users.append(user)
+
+                self.hash_passwords(pool, users)
+                saved = self.save_batch(users)
+                # bulk_create sends no post_save, so updated users are dropped from the auth cache here
+                invalidate_cached_users([user.userid for user in users])
+                imported += saved
+                skipped += len(users) - saved
+
+                elapsed = time.monotonic() - batch_started
+                self.stdout.write(
+                    f"Batch {batch_number}: {saved}/{len(batch)} rows in {elapsed:.2f}s "
+                    f"({saved / elapsed if elapsed else 0:.0f} rows/s)"
+                )
+
+        # bulk_create sends no post_save, so retire the cached directory here
+        invalidate_directory()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} users, skipped {skipped} rows in {elapsed:.1f}s "
+            f"({imported / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
+
+    # ---------------- Reading ----------------
+
+    def read_rows(self, path, sheet):
+        """
+        Yield (line number, {column: value}) without loading the whole file.
+        """
+        if path.suffix.lower() == '.csv':
+            return self.read_csv(path)
+        if path.suffix.lower() in ('.xlsx', '.xlsm'):
+            return self.read_xlsx(path, sheet)
+        raise CommandError("Only .xlsx and .csv files are supported")
+
+    def read_csv(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+            reader = csv.reader(handle)
+            header = self.parse_header(next(reader, []))
+            for line, values in enumerate(reader, start=2):
+                yield line, self.to_row(header, values)
+
+    def read_xlsx(self, path, sheet):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[sheet] if sheet else workbook.active
+            values = worksheet.iter_rows(values_only=True)
+            header = self.parse_header(next(values, ()))
+            for line, row in enumerate(values, start=2):
+                yield line, self.to_row(header, row)
+        finally:
+            workbook.close()
+
+    def parse_header(self, header):
+        header = [str(name or '').strip().lower() for name in header]
+        missing = {'userid', 'username'} - set(header)
+        if missing:
+            raise CommandError(f"Missing required column(s): {', '.join(sorted(missing))}")
+        # Existing users are only updated in the columns the file has, so a
+        # sheet without is_active or is_staff leaves those flags alone
+        self.update_fields = [
+            name for name in UPDATE_FIELDS
+            if name in header and (name != 'password' or self.reset_passwords)
+        ]
+        return header
+
+    def to_row(self, header, values):
+        return {
+            name: '' if value is None else str(value).strip()
+            for name, value in zip(header, values)
+            if name in COLUMNS
+        }
+
+    # ---------------- Validation ----------------
+
+    def build_user(self, line, row):
+        userid = row.get('userid', '')
+        username = row.get('username', '')
+        password = row.get('password') or self.default_password
+
+        if not any(row.values()):
+            return None
+        if not self.userid_pattern.match(userid):
+            return self.reject(line, f"invalid userid {userid!r}, expected UTEL/CC/UGCL-XXXX/YYYY")
+        if not username:
+            return self.reject(line, "username is empty")
+        if not password:
+            return self.reject(line, "password is empty and no --default-password was given")
+        if userid in self.seen_userids:
+            return self.reject(line, f"duplicate userid {userid}")
+        if username in self.seen_usernames:
+            return self.reject(line, f"duplicate username {username}")
+
+        self.seen_userids.add(userid)
+        self.seen_usernames.add(username)
+        return CustomUser(
+            userid=userid,
+            username=username,
+            first_name=row.get('first_name', ''),
+            middle_name=row.get('middle_name', ''),
+            last_name=row.get('last_name', ''),
+            password=password,
+            is_active=(row.get('is_active') or 'true').lower() in TRUE_VALUES,
+            is_staff=row.get('is_staff', '').lower() in TRUE_VALUES,
+        )
+
+    def reject(self, line, reason):
+        self.stderr.write(f"Row {line}: {reason}")
+        return None
+
+    # ---------------- Writing ----------------
+
+    def hash_passwords(self, pool, users):
+        """
+        Hash the batch's passwords across the pool; PBKDF2 dominates the import time.
+
+        Without --reset-passwords the passwords of existing users are not
+        written, so they are not hashed either; they get an unusable password
+        in case the user is deleted before the upsert inserts them again.
+        """
+        if not self.reset_passwords:
+            existing = set(
+                CustomUser.objects.filter(pk__in=[user.userid for user in users]).values_list('pk', flat=True)
+            )
+            for user in users:
+                if user.userid in existing:
+                    user.set_unusable_password()
+            users = [user for user in users if user.userid not in existing]
+        if not users:
+            return
+        chunk = -(-len(users) // self.workers)
+        chunks = [
+            [user.password for user in users[start:start + chunk]]
+            for start in range(0, len(users), chunk)
+        ]
+        hashed = [password for result in pool.map(_hash_passwords, chunks) for password in result]
+        for user, password in zip(users, hashed):
+            user.password = password
+
+    def save_batch(self, users):
+        """
+        Upsert the batch in one statement, falling back to row by row to isolate bad rows.
+        """
+        if not users:
+            return 0
+        try:
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(
+                    users, update_conflicts=True, unique_fields=['userid'], update_fields=self.update_fields,
+                )
+            return len(users)
+        except IntegrityError:
+            pass
+
+        saved = 0
+        for user in users:
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.bulk_create(
+                        [user], update_conflicts=True, unique_fields=['userid'], update_fields=self.update_fields,
+                    )
+                saved += 1
+            except IntegrityError as e:
+                self.stderr.write(f"User {user.userid}: {e}")
+        return saved
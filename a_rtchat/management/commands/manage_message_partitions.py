@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError
+from django.utils import timezone
+
+from a_rtchat.partitions import (
+    add_months, create_partition, detach_partition, is_partitioned, month_partitions, month_start, partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the monthly partitions of the message table: create the partitions of the "
+        "coming months and optionally detach (archive) or drop the ones older than a retention "
+        "period. Run it daily, e.g. from cron; it only does work at month boundaries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=getattr(settings, 'CHAT_MESSAGE_PARTITIONS_AHEAD', 3),
+            help='Months after the current one to create partitions for',
+        )
+        parser.add_argument(
+            '--retain-months', type=int,
+            help='Detach partitions entirely older than this many months; detached partitions stay as plain tables',
+        )
+        parser.add_argument('--drop', action='store_true', help='Drop detached partitions instead of keeping them')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be done')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("The message table is not partitioned; apply the a_rtchat migrations first")
+        if options['drop'] and options['retain_months'] is None:
+            raise CommandError("--drop needs --retain-months")
+
+        existing = month_partitions()
+        current = month_start(timezone.now())
+
+        for offset in range(options['ahead'] + 1):
+            month = add_months(current, offset)
+            if month in existing:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"Would create {partition_name(month)}")
+                continue
+            moved = create_partition(month)
+            note = f" ({moved} rows moved from the default partition)" if moved else ""
+            self.stdout.write(self.style.SUCCESS(f"Created {partition_name(month)}{note}"))
+
+        if options['retain_months'] is None:
+            return
+        if options['retain_months'] < 1:
+            raise CommandError("--retain-months must be at least 1")
+
+        # A month partition is expired once all of it is older than the cutoff
+        cutoff = add_months(current, -options['retain_months'])
+        action = 'drop' if options['drop'] else 'detach'
+        for month in sorted(month for month in existing if month < cutoff):
+            name = partition_name(month)
+            if options['dry_run']:
+                self.stdout.write(f"Would {action} {name}")
+                continue
+            try:
+                detach_partition(month, drop=options['drop'])
+            except OperationalError as error:
+                # Most likely the lock timeout; the next run tries again
+                self.stderr.write(f"Could not {action} {name}: {error}")
+                continue
+            self.stdout.write(self.style.SUCCESS(f"{'Dropped' if options['drop'] else 'Detached'} {name}"))
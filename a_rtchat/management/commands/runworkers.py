@@ -0,0 +1,97 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Run N Daphne workers accepting connections from one shared listening socket. "
+        "Workers talk to each other through the Redis channel layer, so a message sent "
+        "on any worker reaches sockets held by all of them. Dead workers are restarted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=int(os.environ.get('CHAT_WORKERS', os.cpu_count() or 1)))
+        parser.add_argument('--bind', default=os.environ.get('CHAT_BIND', '0.0.0.0'))
+        parser.add_argument('--port', type=int, default=int(os.environ.get('CHAT_PORT', 8000)))
+        parser.add_argument('--backlog', type=int, default=2048)
+        parser.add_argument('--application', default='kampuni.asgi:application')
+        parser.add_argument('daphne_args', nargs='*', help='Extra arguments passed to every daphne process (after --)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind((options['bind'], options['port']))
+        except OSError as e:
+            raise CommandError(f"Cannot bind {options['bind']}:{options['port']}: {e}")
+        listener.listen(options['backlog'])
+        listener.set_inheritable(True)
+
+        self.command = [
+            sys.executable, '-m', 'daphne',
+            '--fd', str(listener.fileno()),
+            *options['daphne_args'],
+            options['application'],
+        ]
+        self.listener = listener
+        self.stopping = False
+        self.workers = {}
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(
+            f"Serving {options['application']} on {options['bind']}:{options['port']} "
+            f"with {options['workers']} workers"
+        )
+        for slot in range(options['workers']):
+            self.spawn(slot)
+
+        try:
+            self.supervise()
+        finally:
+            self.shutdown()
+
+    def spawn(self, slot):
+        env = dict(os.environ, CHAT_WORKER_ID=str(slot))
+        process = subprocess.Popen(self.command, pass_fds=(self.listener.fileno(),), env=env)
+        self.workers[slot] = (process, time.monotonic())
+        self.stdout.write(f"Worker {slot} started (pid {process.pid})")
+
+    def supervise(self):
+        while not self.stopping:
+            time.sleep(1)
+            for slot, (process, started) in list(self.workers.items()):
+                code = process.poll()
+                if code is None or self.stopping:
+                    continue
+                self.stderr.write(f"Worker {slot} (pid {process.pid}) exited with {code}")
+                # Back off if the worker is crashing right after start
+                if time.monotonic() - started < 5:
+                    time.sleep(5)
+                self.spawn(slot)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def shutdown(self):
+        for process, _ in self.workers.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + 30
+        for process, _ in self.workers.values():
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.listener.close()
+        self.stdout.write("All workers stopped")
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from .models import GroupChat, PrivateChat
+
+
+class MembershipCache:
+    """
+    In-process LRU cache of (user, room) -> room object, or None for non-members.
+
+    Entries expire after `ttl` seconds, which also bounds how stale another
+    worker process can be; local changes are invalidated immediately through
+    the membership signals.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or getattr(settings, 'CHAT_MEMBERSHIP_CACHE_SIZE', 10000)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'CHAT_MEMBERSHIP_CACHE_TTL', 300)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, room_type, room_id):
+        """
+        Return (hit, room).
+        """
+        key = (user_id, room_type, int(room_id))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            room, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, room
+
+    def set(self, user_id, room_type, room_id, room):
+        key = (user_id, room_type, int(room_id))
+        with self._lock:
+            self._entries[key] = (room, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, room_type, room_id, user_ids=None):
+        """
+        Drop the entries of one room, for the given users or for everyone.
+        """
+        with self._lock:
+            if user_ids is not None:
+                for user_id in user_ids:
+                    self._entries.pop((user_id, room_type, int(room_id)), None)
+                return
+            for key in [key for key in self._entries if key[1:] == (room_type, int(room_id))]:
+                del self._entries[key]
+
+    def invalidate_user(self, user_id, room_type):
+        with self._lock:
+            for key in [key for key in self._entries if key[:2] == (user_id, room_type)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+membership_cache = MembershipCache()
+
+
+def load_member_room(user, room_type, room_id):
+    """
+    Return the chat if `user` is a member of it, else None.
+    """
+    if room_type == 'group':
+        return GroupChat.objects.filter(id=room_id, members=user).first()
+    if room_type == 'private':
+        return PrivateChat.objects.filter(Q(user1=user) | Q(user2=user), id=room_id).first()
+    return None
+
+
+async def get_member_room(user, room_type, room_id):
+    """
+    Cached load_member_room for the WebSocket handshake.
+    """
+    hit, room = membership_cache.get(user.pk, room_type, room_id)
+    if not hit:
+        room = await database_sync_to_async(load_member_room)(user, room_type, room_id)
+        membership_cache.set(user.pk, room_type, room_id, room)
+    return room
+
+
+def load_user_rooms(user):
+    """
+    Return {(room_type, room_id): room} for every chat `user` belongs to.
+    """
+    rooms = {('group', group.id): group for group in GroupChat.objects.filter(members=user)}
+    for chat in PrivateChat.objects.filter(Q(user1=user) | Q(user2=user)):
+        rooms[('private', chat.id)] = chat
+    return rooms
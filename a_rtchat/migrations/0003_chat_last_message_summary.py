@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:28
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Substr
+
+
+def backfill_last_message(apps, schema_editor):
+    Message = apps.get_model('a_rtchat', 'Message')
+    for model_name, fk in (('GroupChat', 'group'), ('PrivateChat', 'private_chat')):
+        latest = Message.objects.filter(**{fk: OuterRef('pk')}).order_by('-timestamp', '-id')
+        apps.get_model('a_rtchat', model_name).objects.update(
+            last_message=Subquery(latest.values('id')[:1]),
+            last_message_preview=Subquery(latest.annotate(preview=Substr('message', 1, 100)).values('preview')[:1]),
+            last_message_sender=Subquery(latest.values('sender_id')[:1]),
+            last_message_at=Subquery(latest.values('timestamp')[:1]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0002_alter_customuser_is_superuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupchat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='a_rtchat.message'),
+        ),
+        migrations.AddField(
+            model_name='groupchat',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupchat',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='groupchat',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='privatechat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='a_rtchat.message'),
+        ),
+        migrations.AddField(
+            model_name='privatechat',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='privatechat',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='privatechat',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='userid',
+            field=models.CharField(max_length=150, primary_key=True, serialize=False, unique=True, validators=[django.core.validators.RegexValidator(message='UserID must follow format UTEL/CC/UGCL-XXXX/YYYY', regex='^UTEL/CC/UGCL-\\d{4}/\\d{4}$')]),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+    ]
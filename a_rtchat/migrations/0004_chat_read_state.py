@@ -0,0 +1,72 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_read_states(apps, schema_editor):
+    """
+    Seed one read state per member from the legacy global Message.read flag.
+    """
+    Message = apps.get_model('a_rtchat', 'Message')
+    GroupChat = apps.get_model('a_rtchat', 'GroupChat')
+    PrivateChat = apps.get_model('a_rtchat', 'PrivateChat')
+    ChatReadState = apps.get_model('a_rtchat', 'ChatReadState')
+
+    def unread_by_sender(fk):
+        totals = {}
+        rows = Message.objects.filter(read=False, **{f'{fk}__isnull': False}).order_by()
+        for chat_id, sender_id, total in rows.values_list(f'{fk}_id', 'sender_id').annotate(total=Count('id')):
+            totals.setdefault(chat_id, {})[sender_id] = total
+        return totals
+
+    def state(user_id, fk, chat_id, last_message_id, totals):
+        by_sender = totals.get(chat_id, {})
+        unread = sum(by_sender.values()) - by_sender.get(user_id, 0)
+        return ChatReadState(
+            user_id=user_id, unread_count=unread, last_read_message_id=None if unread else last_message_id,
+            **{f'{fk}_id': chat_id},
+        )
+
+    group_totals = unread_by_sender('group')
+    last_group_message = dict(GroupChat.objects.values_list('id', 'last_message_id'))
+    memberships = GroupChat.members.through.objects.values_list('customuser_id', 'groupchat_id')
+    ChatReadState.objects.bulk_create(
+        (state(user_id, 'group', group_id, last_group_message[group_id], group_totals) for user_id, group_id in memberships.iterator()),
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+    private_totals = unread_by_sender('private_chat')
+    states = []
+    for chat_id, user1_id, user2_id, last_message_id in PrivateChat.objects.values_list('id', 'user1_id', 'user2_id', 'last_message_id').iterator():
+        for user_id in {user1_id, user2_id}:
+            states.append(state(user_id, 'private_chat', chat_id, last_message_id, private_totals))
+    ChatReadState.objects.bulk_create(states, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0003_chat_last_message_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='a_rtchat.groupchat')),
+                ('last_read_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='a_rtchat.message')),
+                ('private_chat', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='a_rtchat.privatechat')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('group__isnull', False)), fields=('user', 'group'), name='unique_group_read_state'), models.UniqueConstraint(condition=models.Q(('private_chat__isnull', False)), fields=('user', 'private_chat'), name='unique_private_read_state')],
+            },
+        ),
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:31
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Build the indexes without locking the message table for writes
+    atomic = False
+
+    dependencies = [
+        ('a_rtchat', '0004_chat_read_state'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(condition=models.Q(('group__isnull', False)), fields=['group', 'timestamp', 'id'], name='message_group_ts_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='message',
+            index=models.Index(condition=models.Q(('private_chat__isnull', False)), fields=['private_chat', 'timestamp', 'id'], name='message_private_ts_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='privatechat',
+            index=models.Index(fields=['user1', 'user2'], name='privatechat_pair_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Build the index without locking the message table for writes
+    atomic = False
+
+    dependencies = [
+        ('a_rtchat', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('message', config='simple'), name='message_search_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:51
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Build the index without locking the users table for writes
+    atomic = False
+
+    dependencies = [
+        ('a_rtchat', '0006_message_search_index'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='customuser',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('username', 'first_name', 'middle_name', 'last_name', config='simple'), name='customuser_search_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Numbered chat list changes until migration 0011
+CHAT_VERSION_SEQUENCE = 'a_rtchat_chat_version_seq'
+
+
+class NextChatVersion(models.Func):
+    template = f"nextval('{CHAT_VERSION_SEQUENCE}')"
+    output_field = models.BigIntegerField()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0007_user_search_index'),
+    ]
+
+    operations = [
+        # Must exist before the column defaults that call nextval() on it
+        migrations.RunSQL(
+            f'CREATE SEQUENCE IF NOT EXISTS {CHAT_VERSION_SEQUENCE}',
+            f'DROP SEQUENCE IF EXISTS {CHAT_VERSION_SEQUENCE}',
+        ),
+        migrations.CreateModel(
+            name='RemovedChat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_type', models.CharField(max_length=10)),
+                ('chat_id', models.BigIntegerField()),
+                ('version', models.BigIntegerField(db_default=NextChatVersion())),
+                ('removed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='chatreadstate',
+            name='version',
+            field=models.BigIntegerField(db_default=NextChatVersion()),
+        ),
+        migrations.AddIndex(
+            model_name='chatreadstate',
+            index=models.Index(fields=['user', 'version'], name='readstate_user_version_idx'),
+        ),
+        migrations.AddField(
+            model_name='removedchat',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='removed_chats', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='removedchat',
+            index=models.Index(fields=['user', 'version'], name='removedchat_user_version_idx'),
+        ),
+    ]
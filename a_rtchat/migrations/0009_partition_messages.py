@@ -0,0 +1,140 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:05
+
+from datetime import date, datetime, timezone as dt_timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+TABLE = 'a_rtchat_message'
+# Month partitions created ahead of the current month; manage_message_partitions keeps this up
+MONTHS_AHEAD = 3
+
+
+def _add_months(moment, count):
+    index = moment.year * 12 + moment.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _table_definition(cursor, table):
+    """
+    CREATE INDEX statements (bar the primary key) and foreign key constraints of `table`.
+    """
+    cursor.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s "
+        "AND indexname <> %s",
+        [table, f'{table}_pkey'],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _restore_definition(cursor, table, indexes, foreign_keys):
+    for statement in indexes:
+        cursor.execute(statement)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+
+
+def partition_messages(apps, schema_editor):
+    """
+    Rebuild the message table as a table range-partitioned by month on
+    timestamp. The rows are copied over, so this holds an exclusive lock on
+    messages for the duration of the copy.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _table_definition(cursor, TABLE)
+        cursor.execute(f'SELECT min("timestamp"), coalesce(max(id), 0) FROM {TABLE}')
+        first, max_id = cursor.fetchone()
+
+        old = f'{TABLE}_unpartitioned'
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+        cursor.execute(f'ALTER TABLE {old} ALTER COLUMN id DROP IDENTITY')
+        # Partitioned tables cannot have identity columns (before Postgres 17): use a plain sequence
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'CREATE SEQUENCE {TABLE}_id_seq START WITH {max_id + 1} OWNED BY {TABLE}.id')
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+
+        # One partition per month from the oldest message through MONTHS_AHEAD months from now
+        month, last = _add_months(first or timezone.now(), 0), _add_months(timezone.now(), MONTHS_AHEAD)
+        while month <= last:
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                [_bound(month), _bound(_add_months(month, 1))],
+            )
+            month = _add_months(month, 1)
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+        cursor.execute(f'DROP TABLE {old}')
+        # Keys and indexes are built after the copy; created on the parent they cascade to every partition
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, "timestamp")')
+        _restore_definition(cursor, TABLE, indexes, foreign_keys)
+        cursor.execute(f'ANALYZE {TABLE}')
+
+
+def unpartition_messages(apps, schema_editor):
+    """
+    Copy the attached partitions back into a plain table. Detached (archived)
+    partitions are left alone.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _table_definition(cursor, TABLE)
+        cursor.execute(f'SELECT coalesce(max(id), 0) FROM {TABLE}')
+        max_id = cursor.fetchone()[0]
+
+        old = f'{TABLE}_partitioned'
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {old}')
+        cursor.execute(f'CREATE TABLE {TABLE} (LIKE {old})')
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {old}')
+        cursor.execute(f'DROP TABLE {old}')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {max_id + 1})'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)')
+        _restore_definition(cursor, TABLE, indexes, foreign_keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0008_chat_list_versions'),
+    ]
+
+    operations = [
+        # Foreign keys can only reference a unique key of a partitioned table,
+        # which must include the partition column; drop the constraints first
+        migrations.AlterField(
+            model_name='chatreadstate',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='a_rtchat.message'),
+        ),
+        migrations.AlterField(
+            model_name='groupchat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='a_rtchat.message'),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='reply_to',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replies', to='a_rtchat.message'),
+        ),
+        migrations.AlterField(
+            model_name='privatechat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='a_rtchat.message'),
+        ),
+        migrations.RunPython(partition_messages, unpartition_messages),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+TABLE = 'a_rtchat_message'
+
+INDEXES = [
+    models.Index(fields=['timestamp', 'id'], name='message_timestamp_idx'),
+    models.Index(condition=models.Q(('is_pinned', True)), fields=['timestamp', 'id'], name='message_pinned_idx'),
+    models.Index(condition=models.Q(('deleted', True)), fields=['timestamp', 'id'], name='message_deleted_idx'),
+]
+
+# (name, WHERE clause) of each index, all on ("timestamp", id)
+INDEX_SQL = [
+    ('message_timestamp_idx', ''),
+    ('message_pinned_idx', ' WHERE is_pinned'),
+    ('message_deleted_idx', ' WHERE deleted'),
+]
+
+
+def add_indexes(apps, schema_editor):
+    """
+    Build the indexes without blocking writes to messages.
+
+    CREATE INDEX on a partitioned table locks every partition against writes
+    until all of them are indexed, and CONCURRENTLY is not allowed there. So
+    each index is created invalid ON ONLY the parent, built CONCURRENTLY on
+    every attached partition and attached to the parent, which becomes valid
+    once all partitions are attached. Partitions created later inherit it.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        Message = apps.get_model('a_rtchat', 'Message')
+        for index in INDEXES:
+            schema_editor.add_index(Message, index)
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        if cursor.fetchone() is None:
+            for name, where in INDEX_SQL:
+                cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {TABLE} ("timestamp", id){where}')
+            return
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+            [TABLE],
+        )
+        partitions = [row[0] for row in cursor.fetchall()]
+        for name, where in INDEX_SQL:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON ONLY {TABLE} ("timestamp", id){where}')
+            for partition in partitions:
+                partition_index = f'{partition}_{name}'
+                cursor.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} ("timestamp", id){where}'
+                )
+                # Rerunning after a failure must not attach an index twice
+                cursor.execute(
+                    "SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = %s::regclass",
+                    [partition_index, name],
+                )
+                if cursor.fetchone() is None:
+                    cursor.execute(f'ALTER INDEX {name} ATTACH PARTITION {partition_index}')
+
+
+def remove_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        Message = apps.get_model('a_rtchat', 'Message')
+        for index in INDEXES:
+            schema_editor.remove_index(Message, index)
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, _ in INDEX_SQL:
+            # Drops the attached partition indexes with it
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('a_rtchat', '0009_partition_messages'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(add_indexes, remove_indexes)],
+            state_operations=[migrations.AddIndex(model_name='message', index=index) for index in INDEXES],
+        ),
+    ]
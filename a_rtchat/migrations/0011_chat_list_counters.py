@@ -0,0 +1,85 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The sequence created by migration 0008
+CHAT_VERSION_SEQUENCE = 'a_rtchat_chat_version_seq'
+
+# Bumps the writer's ChatListVersion and stamps the row with it. The counter row
+# stays locked until commit, so one user's versions commit in increasing order
+NEXT_CHAT_VERSION = '''
+CREATE FUNCTION a_rtchat_next_chat_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO a_rtchat_chatlistversion AS counter (user_id, version) VALUES (NEW.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = counter.version + 1
+    RETURNING counter.version INTO NEW.version;
+    RETURN NEW;
+END
+$$;
+CREATE TRIGGER chat_list_version BEFORE INSERT OR UPDATE ON a_rtchat_chatreadstate
+    FOR EACH ROW EXECUTE FUNCTION a_rtchat_next_chat_version();
+CREATE TRIGGER chat_list_version BEFORE INSERT ON a_rtchat_removedchat
+    FOR EACH ROW EXECUTE FUNCTION a_rtchat_next_chat_version();
+'''
+
+DROP_NEXT_CHAT_VERSION = '''
+DROP TRIGGER IF EXISTS chat_list_version ON a_rtchat_chatreadstate;
+DROP TRIGGER IF EXISTS chat_list_version ON a_rtchat_removedchat;
+DROP FUNCTION IF EXISTS a_rtchat_next_chat_version();
+'''
+
+# Counters continue from each user's newest version, so the `since` values
+# clients already hold stay valid
+BACKFILL_COUNTERS = '''
+INSERT INTO a_rtchat_chatlistversion (user_id, version)
+SELECT userid, coalesce((
+    SELECT max(version) FROM (
+        SELECT version FROM a_rtchat_chatreadstate WHERE user_id = userid
+        UNION ALL
+        SELECT version FROM a_rtchat_removedchat WHERE user_id = userid
+    ) versions
+), 0)
+FROM a_rtchat_customuser
+'''
+
+RESTORE_SEQUENCE = f'''
+CREATE SEQUENCE IF NOT EXISTS {CHAT_VERSION_SEQUENCE};
+SELECT setval('{CHAT_VERSION_SEQUENCE}', coalesce(max(version), 0) + 1, false)
+FROM a_rtchat_chatlistversion;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0010_message_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatListVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(BACKFILL_COUNTERS, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='chatreadstate',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='removedchat',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(NEXT_CHAT_VERSION, DROP_NEXT_CHAT_VERSION),
+        # Going back, the sequence must exist again before the column defaults that call it
+        migrations.RunSQL(
+            f'DROP SEQUENCE IF EXISTS {CHAT_VERSION_SEQUENCE}',
+            RESTORE_SEQUENCE,
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.5 on 2026-10-18 14:02
+
+from django.db import migrations
+
+# Chat list versions become the id of the writing transaction, plus an offset
+# above every version taken so far, so the `since` values clients already hold
+# stay valid. Writers take no lock: a transaction's id is its own.
+CHAT_VERSION_FUNCTIONS = '''
+CREATE OR REPLACE FUNCTION a_rtchat_chat_version() RETURNS bigint LANGUAGE sql VOLATILE AS $$
+    SELECT pg_current_xact_id()::text::bigint + {offset}
+$$;
+CREATE OR REPLACE FUNCTION a_rtchat_chat_version_horizon() RETURNS bigint LANGUAGE sql STABLE AS $$
+    SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint + {offset}
+$$;
+CREATE OR REPLACE FUNCTION a_rtchat_next_chat_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.version := a_rtchat_chat_version();
+    RETURN NEW;
+END
+$$;
+'''
+
+NEXT_VERSION = '''
+SELECT greatest(
+    (SELECT max(version) FROM a_rtchat_chatlistversion),
+    (SELECT max(version) FROM a_rtchat_chatreadstate),
+    (SELECT max(version) FROM a_rtchat_removedchat),
+    0
+) + 1
+'''
+
+# Migration 0011's counter trigger, with counters continuing from each user's newest version
+COUNTER_VERSIONS = '''
+CREATE OR REPLACE FUNCTION a_rtchat_next_chat_version() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO a_rtchat_chatlistversion AS counter (user_id, version) VALUES (NEW.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = counter.version + 1
+    RETURNING counter.version INTO NEW.version;
+    RETURN NEW;
+END
+$$;
+DROP FUNCTION IF EXISTS a_rtchat_chat_version_horizon();
+DROP FUNCTION IF EXISTS a_rtchat_chat_version();
+INSERT INTO a_rtchat_chatlistversion (user_id, version)
+SELECT userid, coalesce((
+    SELECT max(version) FROM (
+        SELECT version FROM a_rtchat_chatreadstate WHERE user_id = userid
+        UNION ALL
+        SELECT version FROM a_rtchat_removedchat WHERE user_id = userid
+    ) versions
+), 0)
+FROM a_rtchat_customuser
+'''
+
+
+def stamp_transaction_ids(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(NEXT_VERSION)
+        offset = cursor.fetchone()[0]
+        cursor.execute(CHAT_VERSION_FUNCTIONS.format(offset=offset))
+
+
+def count_versions(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(COUNTER_VERSIONS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_rtchat', '0011_chat_list_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(stamp_transaction_ids, count_versions),
+        migrations.DeleteModel(
+            name='ChatListVersion',
+        ),
+    ]
@@ -1,7 +1,23 @@
-from django.db import models 
+from django.db import connection, models, transaction
+from django.db.models import Case, ExpressionWrapper, F, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Upper
+from django.db.models.lookups import GreaterThanOrEqual
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.conf import settings
 from django.core.validators import RegexValidator
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+
+USERID_REGEX = r"^UTEL/CC/UGCL-\d{4}/\d{4}$"
+
+# Text search configuration of the message and user search indexes. Messages
+# and names mix languages, so words are only lowercased, not stemmed. Queries
+# must use the same value.
+MESSAGE_SEARCH_CONFIG = 'simple'
+
+# Name fields matched by the user directory search
+USER_SEARCH_FIELDS = ('username', 'first_name', 'middle_name', 'last_name')
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, userid, username, password=None, **extra_fields):
         if not userid:
@@ -24,7 +40,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         unique=True,
         validators=[
             RegexValidator(
-                regex=r"^UTEL/CC/UGCL-\d{4}/\d{4}$",
+                regex=USERID_REGEX,
                 message="UserID must follow format UTEL/CC/UGCL-XXXX/YYYY",
             )
         ],
@@ -41,6 +57,16 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = []  # for createsuperuser; username is already required
+
+    class Meta:
+        indexes = [
+            # Directory typeahead: pg_trgm substring (icontains) and similarity
+            # matches on any name field; the expressions match UPPER() in icontains
+            GinIndex(
+                *(OpClass(Upper(field), name='gin_trgm_ops') for field in USER_SEARCH_FIELDS),
+                name='customuser_trgm_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.first_name} {self.middle_name} {self.last_name}".strip()
@@ -50,6 +76,15 @@ class GroupChat(models.Model):
     name = models.CharField(max_length=100)
     members = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_groups')
     created_at = models.DateTimeField(auto_now_add=True)
+    # No database constraint: Message is partitioned (see partitions.py) and has no unique id to reference
+    last_message = models.ForeignKey(
+        'Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', db_constraint=False
+    )
+    last_message_preview = models.CharField(max_length=100, blank=True)
+    last_message_sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     def __str__(self):
         return self.name or f"GroupChat #{self.pk}"
@@ -58,16 +93,35 @@ class PrivateChat(models.Model):
     user1 = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='private_chats_1')
     user2 = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='private_chats_2')
     created_at = models.DateTimeField(auto_now_add=True)
+    # No database constraint: Message is partitioned (see partitions.py) and has no unique id to reference
+    last_message = models.ForeignKey(
+        'Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+', db_constraint=False
+    )
+    last_message_preview = models.CharField(max_length=100, blank=True)
+    last_message_sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         user1 = self.user1.first_name if self.user1 else "Unknown"
         user2 = self.user2.first_name if self.user2 else "Unknown"
         return f"{user1} & {user2}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user1', 'user2'], name='privatechat_pair_idx'),
+        ]
+
     def get_other_user(self, current_user):
         return self.user2 if self.user1 == current_user else self.user1
     
 class Message(models.Model):
+    """
+    A chat message. The table is range-partitioned by month on timestamp
+    (migration 0009, maintained by manage_message_partitions), so its database
+    primary key is (id, timestamp) and foreign keys to it are not enforced.
+    """
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
         on_delete=models.CASCADE,
@@ -96,7 +150,8 @@ class Message(models.Model):
         null=True, 
         blank=True, 
         on_delete=models.SET_NULL,
-        related_name='replies'  # Unique related_name for replies
+        related_name='replies',  # Unique related_name for replies
+        db_constraint=False,
     )
     deleted = models.BooleanField(default=False)
     deleted_by = models.ForeignKey(
@@ -113,7 +168,208 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['timestamp']  # Optional: ensures messages are ordered by timestamp
+        indexes = [
+            # History pages, replay and last-message lookups: (room, timestamp, id) keyset order
+            models.Index(
+                fields=['group', 'timestamp', 'id'], name='message_group_ts_idx',
+                condition=Q(group__isnull=False),
+            ),
+            models.Index(
+                fields=['private_chat', 'timestamp', 'id'], name='message_private_ts_idx',
+                condition=Q(private_chat__isnull=False),
+            ),
+            # Full-text search: an expression index, so no column to keep in sync
+            GinIndex(SearchVector('message', config=MESSAGE_SEARCH_CONFIG), name='message_search_idx'),
+            # Admin changelist: newest-first pages, date hierarchy and the pinned/deleted filters
+            models.Index(fields=['timestamp', 'id'], name='message_timestamp_idx'),
+            models.Index(fields=['timestamp', 'id'], name='message_pinned_idx', condition=Q(is_pinned=True)),
+            models.Index(fields=['timestamp', 'id'], name='message_deleted_idx', condition=Q(deleted=True)),
+        ]
     def mark_as_read(self):
         if not self.read:
             self.read = True
-            self.save()
\ No newline at end of file
+            self.save()
+
+    def increment_unread_counts(self, count=1):
+        """
+        Add this message (or `count` messages from the same sender) to the unread
+        counter of every other member of its chat. Every member's row is
+        written, the sender's too, whose preview changed, so every member's
+        row takes a new chat list version (ChatReadState.version).
+        """
+        if self.group_id:
+            states = ChatReadState.objects.filter(group_id=self.group_id)
+        else:
+            states = ChatReadState.objects.filter(private_chat_id=self.private_chat_id)
+        states.update(
+            unread_count=Case(
+                When(user_id=self.sender_id, then=F('unread_count')),
+                default=F('unread_count') + count,
+            ),
+        )
+
+    @classmethod
+    def record_delivery(cls, messages):
+        """
+        Update chat summaries and unread counters for a batch of saved messages:
+        one summary UPDATE per chat and one counter UPDATE per chat and sender.
+
+        The chats are locked first, in pk order, so deliveries to the same chat
+        run one after the other instead of deadlocking on their members' rows.
+        """
+        latest = {}
+        senders = {}
+        for message in messages:
+            chat = (message.group_id, message.private_chat_id)
+            current = latest.get(chat)
+            if current is None or (message.timestamp, message.id) > (current.timestamp, current.id):
+                latest[chat] = message
+            key = chat + (message.sender_id,)
+            first, count = senders.get(key, (message, 0))
+            senders[key] = (first, count + 1)
+
+        with transaction.atomic():
+            group_ids = [group_id for group_id, _ in latest if group_id]
+            private_ids = [private_id for _, private_id in latest if private_id]
+            list(GroupChat.objects.filter(pk__in=group_ids).order_by('pk').select_for_update().values_list('pk', flat=True))
+            list(PrivateChat.objects.filter(pk__in=private_ids).order_by('pk').select_for_update().values_list('pk', flat=True))
+            for message in latest.values():
+                message.update_chat_summary()
+            for message, count in senders.values():
+                message.increment_unread_counts(count)
+
+    def update_chat_summary(self):
+        """
+        Store this message as the last message of its chat, unless a newer one is already there.
+        """
+        if self.group_id:
+            chats = GroupChat.objects.filter(pk=self.group_id)
+        else:
+            chats = PrivateChat.objects.filter(pk=self.private_chat_id)
+        chats.filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lte=self.timestamp)
+        ).update(
+            last_message=self,
+            last_message_preview=self.message[:100],
+            last_message_sender=self.sender_id,
+            last_message_at=self.timestamp,
+        )
+
+
+class ChatReadState(models.Model):
+    """
+    A member's read watermark in one chat, with the number of messages received since.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='read_states')
+    group = models.ForeignKey(GroupChat, on_delete=models.CASCADE, null=True, blank=True, related_name='read_states')
+    private_chat = models.ForeignKey(PrivateChat, on_delete=models.CASCADE, null=True, blank=True, related_name='read_states')
+    last_read_message = models.ForeignKey(
+        Message, null=True, blank=True, on_delete=models.SET_NULL, related_name='+', db_constraint=False
+    )
+    unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Chat list version of the last change to this row or its chat's last
+    # message: the id of the writing transaction, set by a database trigger
+    # (migration 0012). Delta syncs resume from chat_version_horizon()
+    version = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'version'], name='readstate_user_version_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'group'], condition=Q(group__isnull=False), name='unique_group_read_state'
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'private_chat'], condition=Q(private_chat__isnull=False), name='unique_private_read_state'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} read up to {self.last_read_message_id}"
+
+    @classmethod
+    def mark_read(cls, user, chat_type, chat):
+        """
+        Move the user's watermark up to `chat.last_message_id`, the last message
+        the caller has shown, and reset the unread counter.
+
+        `chat` was loaded before the page was rendered. The counter is only
+        cleared if that is still the chat's last message when the UPDATE runs,
+        so a message delivered in between keeps its unread increment, as in
+        receipts.write_read_receipts. The watermark never moves back.
+
+        Nothing is written when the row is already up to date: every write
+        takes a new chat list version, and reopening a chat that was read must
+        not invalidate the cached chat list. A missing row is inserted.
+
+        The row is locked before the UPDATE. A delivery to this chat in flight
+        holds it already, so the UPDATE waits for it and then sees its message.
+        """
+        lookup = {'group': chat} if chat_type == 'group' else {'private_chat': chat}
+        states = cls.objects.filter(user=user, **lookup)
+        watermark = chat.last_message_id
+        if watermark is None:
+            if not states.exists():
+                cls.objects.bulk_create([cls(user=user, **lookup)], ignore_conflicts=True)
+            return
+        chat_last = Subquery(type(chat).objects.filter(pk=chat.pk).values('last_message_id')[:1])
+        caught_up = GreaterThanOrEqual(Value(watermark), chat_last)
+        pending = (
+            Q(last_read_message_id__isnull=True)
+            | Q(last_read_message_id__lt=watermark)
+            | Q(caught_up, unread_count__gt=0)
+        )
+        state = states.annotate(
+            pending=ExpressionWrapper(pending, output_field=models.BooleanField())
+        ).values_list('pending', flat=True).first()
+        if state is None:
+            cls.objects.bulk_create([cls(user=user, last_read_message_id=watermark, **lookup)], ignore_conflicts=True)
+            return
+        if not state:
+            return
+        with transaction.atomic():
+            list(states.select_for_update().values_list('pk', flat=True))
+            states.filter(pending).update(
+                last_read_message_id=Greatest(Coalesce('last_read_message_id', 0), Value(watermark)),
+                unread_count=Case(
+                    When(caught_up, then=Value(0)),
+                    default=F('unread_count'),
+                    output_field=cls._meta.get_field('unread_count'),
+                ),
+            )
+
+
+def chat_version_horizon():
+    """
+    The chat list version delta syncs resume from.
+
+    Versions are transaction ids, taken when a transaction first writes, so
+    they commit out of order. Every transaction with a lower id than the
+    horizon has finished: a sync that reads the horizon before its rows and
+    asks for version >= horizon next time misses no change.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT a_rtchat_chat_version_horizon()')
+        return cursor.fetchone()[0]
+
+
+class RemovedChat(models.Model):
+    """
+    A chat the user left or that was deleted, so delta syncs can drop it from the list.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='removed_chats')
+    chat_type = models.CharField(max_length=10)
+    chat_id = models.BigIntegerField()
+    # Set by the same trigger as ChatReadState.version
+    version = models.BigIntegerField(default=0, editable=False)
+    removed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'version'], name='removedchat_user_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} left {self.chat_type} {self.chat_id}"
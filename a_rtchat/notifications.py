@@ -0,0 +1,67 @@
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------- Group Names ----------------
+
+def room_group_name(room_type, room_id):
+    return f"chat_{room_type}_{room_id}"
+
+
+def user_group_name(user_id):
+    """
+    Group of every user-level socket of one user. Userids contain '/', which
+    channel group names do not allow.
+    """
+    return f"user_{user_id.replace('/', '.')}"
+
+
+# ---------------- Pushes ----------------
+
+def push_to_users(user_ids, event):
+    """
+    Send a channel layer event to the user-level sockets of `user_ids` once the
+    current transaction commits. Failures are logged: a missed push only
+    delays a sidebar update until the next page load.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    async def send_all(channel_layer):
+        # One hop into the event loop for all users, not one per user: a bulk
+        # membership change can reach thousands
+        for user_id in user_ids:
+            await channel_layer.group_send(user_group_name(user_id), event)
+
+    def send():
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        try:
+            async_to_sync(send_all)(channel_layer)
+        except Exception:
+            logger.exception("Could not push %s to %d users", event.get("type"), len(user_ids))
+
+    transaction.on_commit(send)
+
+
+def push_frame(user_ids, **frame):
+    """
+    Push a JSON frame, forwarded unchanged by UserConsumer.chat_message.
+    """
+    push_to_users(user_ids, {"type": "chat_message", "frame": json.dumps(frame)})
+
+
+def push_room_joined(user_ids, room_type, room_id):
+    push_to_users(user_ids, {"type": "room.joined", "room_type": room_type, "room_id": room_id})
+
+
+def push_room_left(user_ids, room_type, room_id):
+    push_to_users(user_ids, {"type": "room.left", "room_type": room_type, "room_id": room_id})
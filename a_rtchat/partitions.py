@@ -0,0 +1,142 @@
+import re
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Message
+
+
+# Message is range-partitioned by timestamp into one partition per calendar
+# month (UTC), plus a default partition catching rows no month partition covers
+MESSAGE_TABLE = Message._meta.db_table
+DEFAULT_PARTITION = f'{MESSAGE_TABLE}_default'
+# How long a plain DETACH PARTITION waits for its table lock before giving up
+DETACH_LOCK_TIMEOUT = getattr(settings, 'CHAT_PARTITION_LOCK_TIMEOUT', '5s')
+_PARTITION_NAME = re.compile(rf'^{MESSAGE_TABLE}_p(\d{{4}})(\d{{2}})$')
+
+
+def month_start(moment):
+    return date(moment.year, moment.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{MESSAGE_TABLE}_p{month:%Y%m}'
+
+
+def _bound(month):
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def is_partitioned():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [MESSAGE_TABLE])
+        return cursor.fetchone() is not None
+
+
+def month_partitions():
+    """
+    The attached month partitions as {month: name}.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [MESSAGE_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_partition(month):
+    """
+    Create the partition of `month`. Rows already in the default partition for
+    that month are moved into it, since Postgres refuses to create a partition
+    whose range the default partition still holds rows for. Returns the number
+    of rows moved.
+    """
+    name = partition_name(month)
+    start, end = _bound(month), _bound(add_months(month, 1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMP TABLE moved_messages (LIKE {MESSAGE_TABLE})')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *) '
+            'INSERT INTO moved_messages SELECT * FROM moved',
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f'CREATE TABLE {name} PARTITION OF {MESSAGE_TABLE} FOR VALUES FROM (%s) TO (%s)',
+            [start, end],
+        )
+        if moved:
+            cursor.execute(f'INSERT INTO {MESSAGE_TABLE} SELECT * FROM moved_messages')
+        cursor.execute('DROP TABLE moved_messages')
+    return moved
+
+
+def ensure_partitions(first, last):
+    """
+    Create the missing month partitions from the month of `first` through the
+    month of `last`. Returns the names created.
+    """
+    existing = month_partitions()
+    created = []
+    month, last = month_start(first), month_start(last)
+    while month <= last:
+        if month not in existing:
+            create_partition(month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def has_default_partition():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [DEFAULT_PARTITION])
+        return cursor.fetchone()[0]
+
+
+def detach_partition(month, drop=False):
+    """
+    Detach the partition of `month`. It stays behind as a plain table (an
+    archive that can be dumped or re-attached) unless `drop` is set.
+
+    DETACH PARTITION ... CONCURRENTLY only blocks writes to that partition, but
+    it cannot run in a transaction, and Postgres refuses it while the table has
+    a default partition. The plain DETACH used then locks the whole table, so
+    it gives up after DETACH_LOCK_TIMEOUT instead of queueing every writer
+    behind a long-running reader. A concurrent detach that was interrupted is
+    finished first.
+    """
+    name = partition_name(month)
+    if not has_default_partition():
+        if connection.in_atomic_block:
+            raise RuntimeError('detach_partition() cannot run CONCURRENTLY inside a transaction')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(%s) AND inhparent = %s::regclass",
+                [name, MESSAGE_TABLE],
+            )
+            row = cursor.fetchone()
+            mode = 'FINALIZE' if row and row[0] else 'CONCURRENTLY'
+            cursor.execute(f'ALTER TABLE {MESSAGE_TABLE} DETACH PARTITION {name} {mode}')
+            if drop:
+                cursor.execute(f'DROP TABLE {name}')
+        return name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT set_config(%s, %s, true)', ['lock_timeout', DETACH_LOCK_TIMEOUT])
+        cursor.execute(f'ALTER TABLE {MESSAGE_TABLE} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+    return name
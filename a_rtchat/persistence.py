@@ -0,0 +1,142 @@
+import asyncio
+import atexit
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+
+def write_messages(messages):
+    """
+    Insert unsaved messages with one bulk INSERT and record their delivery.
+
+    Returns one entry per message: the saved Message, or the exception that
+    prevented it from being saved. If the batch insert fails the messages are
+    retried one by one so a single bad row (e.g. a deleted chat) only fails itself.
+    """
+    try:
+        with transaction.atomic():
+            Message.objects.bulk_create(messages)
+            Message.record_delivery(messages)
+        return messages
+    except DatabaseError:
+        if len(messages) == 1:
+            raise
+
+    results = []
+    for message in messages:
+        message.pk = None
+        try:
+            with transaction.atomic():
+                message.save()
+                Message.record_delivery([message])
+            results.append(message)
+        except DatabaseError as e:
+            results.append(e)
+    return results
+
+
+class MessageWriteBuffer:
+    """
+    Per-process write-behind buffer coalescing messages from every room into
+    periodic bulk INSERTs.
+
+    A batch is flushed when it reaches `batch_size` messages or `window`
+    seconds after its first message, whichever comes first, and holds at
+    most `batch_size` messages. save() resolves only once the message is
+    committed, so callers never broadcast a message that is not stored.
+    """
+
+    def __init__(self, batch_size=None, window=None):
+        self.batch_size = batch_size or getattr(settings, 'CHAT_WRITE_BATCH_SIZE', 100)
+        self.window = window if window is not None else getattr(settings, 'CHAT_WRITE_BATCH_WINDOW', 0.02)
+        self._pending = []
+        self._timer = None
+        self._flushes = set()
+
+    async def save(self, message):
+        """
+        Queue an unsaved Message and wait until it is persisted. Returns the
+        message with its id and timestamp set.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((message, future))
+        self._schedule_flush()
+        return await future
+
+    def _schedule_flush(self):
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._start_flush)
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self.flush())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def _take_batch(self, limit=None):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:limit], self._pending[limit:]
+        return batch
+
+    async def flush(self):
+        """
+        Write up to `batch_size` of the queued messages. Messages queued while
+        the flush was pending stay queued for the next one.
+        """
+        batch = self._take_batch(self.batch_size)
+        if self._pending:
+            self._schedule_flush()
+        if not batch:
+            return
+
+        try:
+            results = await database_sync_to_async(write_messages)([message for message, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def drain(self):
+        """
+        Flush the queue and wait for flushes already in progress.
+        """
+        while self._pending:
+            await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def flush_sync(self):
+        """
+        Write whatever is still queued when the event loop is gone (interpreter exit).
+        """
+        batch = self._take_batch()
+        if not batch:
+            return
+        try:
+            results = write_messages([message for message, _ in batch])
+        except DatabaseError:
+            logger.exception("Lost %d queued messages at shutdown", len(batch))
+            return
+        failed = sum(isinstance(result, Exception) for result in results)
+        if failed:
+            logger.error("Lost %d queued messages at shutdown", failed)
+
+
+message_buffer = MessageWriteBuffer()
+atexit.register(message_buffer.flush_sync)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_TTL = getattr(settings, 'CHAT_PRESENCE_TTL', 60)
+PRESENCE_HEARTBEAT = getattr(settings, 'CHAT_PRESENCE_HEARTBEAT', 25)
+TYPING_INTERVAL = getattr(settings, 'CHAT_TYPING_INTERVAL', 2.0)
+
+
+# ---------------- Presence ----------------
+
+def _redis(channel_layer):
+    """
+    The channels_redis connection for shared state, or None when the layer is not Redis-backed.
+    """
+    connection = getattr(channel_layer, 'connection', None)
+    return connection(0) if connection else None
+
+
+def _presence_key(user_id):
+    return f"presence:{user_id}"
+
+
+async def touch(channel_layer, user_id, channel_name):
+    """
+    Mark one connection of the user as alive for PRESENCE_TTL seconds.
+
+    Each user has a sorted set of connection -> expiry time, so several tabs
+    or workers can hold a user online and a crashed worker's entries age out.
+    """
+    redis = _redis(channel_layer)
+    if redis is None:
+        return
+    now = time.time()
+    key = _presence_key(user_id)
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(key, {channel_name: now + PRESENCE_TTL})
+            pipe.zremrangebyscore(key, '-inf', now)
+            pipe.expire(key, PRESENCE_TTL)
+            await pipe.execute()
+    except Exception:
+        logger.exception("Could not update presence for %s", user_id)
+
+
+async def leave(channel_layer, user_id, channel_name):
+    redis = _redis(channel_layer)
+    if redis is None:
+        return
+    try:
+        await redis.zrem(_presence_key(user_id), channel_name)
+    except Exception:
+        logger.exception("Could not clear presence for %s", user_id)
+
+
+async def heartbeat(channel_layer, user_id, channel_name):
+    """
+    Refresh the connection's presence until cancelled on disconnect.
+    """
+    while True:
+        await asyncio.sleep(PRESENCE_HEARTBEAT)
+        await touch(channel_layer, user_id, channel_name)
+
+
+async def get_online(channel_layer, user_ids):
+    """
+    Return {user_id: online} for many users in one Redis round-trip.
+    """
+    redis = _redis(channel_layer)
+    if redis is None or not user_ids:
+        return {user_id: False for user_id in user_ids}
+    now = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.zcount(_presence_key(user_id), now, '+inf')
+        counts = await pipe.execute()
+    return {user_id: count > 0 for user_id, count in zip(user_ids, counts)}
+
+
+# ---------------- Typing ----------------
+
+class TypingCoalescer:
+    """
+    Coalesce typing events per room: the first keystroke in a room opens a
+    window of TYPING_INTERVAL seconds, and a single "typing" frame listing
+    everyone who typed in that window is broadcast when it closes. Keystrokes
+    inside an open window only touch process memory.
+    """
+
+    def __init__(self, interval=TYPING_INTERVAL):
+        self.interval = interval
+        self._rooms = {}
+
+    def add(self, channel_layer, group_name, room_type, room_id, user):
+        typists = self._rooms.get(group_name)
+        if typists is None:
+            typists = self._rooms[group_name] = {}
+            asyncio.get_running_loop().call_later(
+                self.interval,
+                lambda: asyncio.ensure_future(self._flush(channel_layer, group_name, room_type, room_id)),
+            )
+        typists[user.username] = user.first_name or user.username
+
+    async def _flush(self, channel_layer, group_name, room_type, room_id):
+        typists = self._rooms.pop(group_name, None)
+        if not typists:
+            return
+        frame = json.dumps({
+            "type": "typing",
+            "room_type": room_type,
+            "room_id": room_id,
+            "users": [
+                {"sender_username": username, "sender_first_name": first_name}
+                for username, first_name in typists.items()
+            ],
+        })
+        try:
+            await channel_layer.group_send(group_name, {"type": "chat_message", "frame": frame})
+        except Exception:
+            logger.exception("Could not broadcast typing for %s", group_name)
+
+
+typing_coalescer = TypingCoalescer()
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Subquery, Value, When
+from django.db.models.lookups import GreaterThanOrEqual
+
+from .models import ChatReadState, GroupChat, PrivateChat
+from .notifications import room_group_name
+
+logger = logging.getLogger(__name__)
+
+READ_RECEIPT_INTERVAL = getattr(settings, 'CHAT_READ_RECEIPT_INTERVAL', 5.0)
+
+_CHATS = {'group': GroupChat, 'private': PrivateChat}
+_FIELDS = {'group': 'group_id', 'private': 'private_chat_id'}
+
+
+def write_read_receipts(receipts):
+    """
+    Move read watermarks forward for a batch of {(user_id, room_type, room_id): message_id}.
+    Returns the receipts applied, as (user_id, room_type, room_id, message_id).
+
+    Watermarks are capped at the chat's last message and never move back.
+    Reading up to the last message clears the unread counter; a message that
+    arrives in the meantime is still counted, since the check runs in the
+    UPDATE. Each row is locked first, as in ChatReadState.mark_read, so the
+    UPDATE waits for a delivery in flight and sees its message. One row is
+    locked at a time: deliveries lock many and must not wait on a receipt.
+    """
+    last_ids = {}
+    for room_type, chat in _CHATS.items():
+        room_ids = {room_id for _, kind, room_id in receipts if kind == room_type}
+        if room_ids:
+            for room_id, last_id in chat.objects.filter(pk__in=room_ids).values_list('pk', 'last_message_id'):
+                last_ids[room_type, room_id] = last_id
+
+    applied = []
+    for (user_id, room_type, room_id), message_id in receipts.items():
+        message_id = min(message_id, last_ids.get((room_type, room_id)) or 0)
+        if not message_id:
+            continue
+        chat_last = Subquery(_CHATS[room_type].objects.filter(pk=room_id).values('last_message_id')[:1])
+        states = ChatReadState.objects.filter(
+            Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=message_id),
+            user_id=user_id, **{_FIELDS[room_type]: room_id},
+        )
+        with transaction.atomic():
+            list(states.select_for_update().values_list('pk', flat=True))
+            updated = states.update(
+                last_read_message_id=message_id,
+                unread_count=Case(
+                    When(GreaterThanOrEqual(Value(message_id), chat_last), then=Value(0)),
+                    default=F('unread_count'),
+                    output_field=ChatReadState._meta.get_field('unread_count'),
+                ),
+            )
+        if updated:
+            applied.append((user_id, room_type, room_id, message_id))
+    return applied
+
+
+class ReadReceiptCoalescer:
+    """
+    Coalesce read receipts from chat sockets: a receipt only updates process
+    memory, keeping the newest message id per user and room, and every
+    READ_RECEIPT_INTERVAL seconds the watermarks are written in one batch
+    (write_read_receipts). Each room then gets one compact "read_receipt"
+    frame listing who has read up to which message.
+    """
+
+    def __init__(self, interval=READ_RECEIPT_INTERVAL):
+        self.interval = interval
+        self._pending = {}
+        self._users = {}
+        self._timer = None
+
+    def add(self, channel_layer, user, room_type, room_id, message_id):
+        key = (user.pk, room_type, room_id)
+        if message_id <= self._pending.get(key, 0):
+            return
+        self._pending[key] = message_id
+        self._users[user.pk] = user.username
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.interval, lambda: asyncio.ensure_future(self.flush(channel_layer)),
+            )
+
+    async def flush(self, channel_layer):
+        self._timer = None
+        receipts, self._pending = self._pending, {}
+        usernames, self._users = self._users, {}
+        if not receipts:
+            return
+        try:
+            applied = await database_sync_to_async(write_read_receipts)(receipts)
+        except Exception:
+            logger.exception("Could not write %d read receipts", len(receipts))
+            return
+
+        rooms = {}
+        for user_id, room_type, room_id, message_id in applied:
+            rooms.setdefault((room_type, room_id), []).append(
+                {"sender_username": usernames[user_id], "message_id": message_id}
+            )
+        for (room_type, room_id), reads in rooms.items():
+            frame = json.dumps({"type": "read_receipt", "room_type": room_type, "room_id": room_id, "reads": reads})
+            try:
+                await channel_layer.group_send(
+                    room_group_name(room_type, room_id), {"type": "chat_message", "frame": frame},
+                )
+            except Exception:
+                logger.exception("Could not broadcast read receipts for %s %s", room_type, room_id)
+
+
+read_receipts = ReadReceiptCoalescer()
@@ -1,6 +1,7 @@
 from django.urls import path
-from a_rtchat.consumers import ChatConsumer
+from a_rtchat.consumers import ChatConsumer, UserConsumer
 
 websocket_urlpatterns = [
+    path('ws/chat/', UserConsumer.as_asgi()),
     path('ws/chat/<str:room_type>/<int:room_id>/', ChatConsumer.as_asgi()),
 ]
\ No newline at end of file
@@ -0,0 +1,187 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchVector, TrigramSimilarity
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.functions import Greatest, Upper
+from django.utils.html import escape
+
+from .history import decode_cursor, encode_cursor
+from .models import MESSAGE_SEARCH_CONFIG, USER_SEARCH_FIELDS, CustomUser, GroupChat, Message, PrivateChat
+
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+DIRECTORY_PAGE_SIZE = 10
+DIRECTORY_CACHE_TTL = getattr(settings, 'CHAT_USER_SEARCH_CACHE_TTL', 30)
+DIRECTORY_LIST_PAGE_SIZE = 50
+DIRECTORY_LIST_MAX_PAGE_SIZE = 200
+DIRECTORY_LIST_CACHE_TTL = getattr(settings, 'CHAT_USER_DIRECTORY_CACHE_TTL', 3600)
+LOCAL_DIRECTORY_CACHE_TTL = getattr(settings, 'CHAT_LOCAL_DIRECTORY_CACHE_TTL', 5)
+DIRECTORY_FIELDS = ('userid', 'first_name', 'middle_name', 'last_name')
+
+_DIRECTORY_VERSION_KEY = 'user-directory:version'
+
+# Highlight markers that cannot appear in stored text; swapped for <mark> after escaping
+_START, _STOP = '\x02', '\x03'
+
+
+def user_rooms_filter(user):
+    """
+    Q selecting messages in every room `user` belongs to, from two small id lookups.
+    """
+    group_ids = list(GroupChat.members.through.objects.filter(customuser=user).values_list('groupchat_id', flat=True))
+    private_ids = list(PrivateChat.objects.filter(Q(user1=user) | Q(user2=user)).values_list('id', flat=True))
+    return Q(group_id__in=group_ids) | Q(private_chat_id__in=private_ids)
+
+
+def highlight(snippet):
+    """
+    HTML-escape a ts_headline snippet and wrap the matched words in <mark>.
+    """
+    return escape(snippet).replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def search_messages(user, text, room=None, before=None, limit=SEARCH_PAGE_SIZE):
+    """
+    Full-text search over the messages visible to `user`, newest first, as
+    (messages, next_cursor).
+
+    `text` uses web search syntax ("quoted phrases", or, -exclude). `room` is an
+    optional filter from history.room_filter() narrowing the search to one chat
+    the caller has already checked membership of. The match runs on the
+    message_search_idx GIN index and pages are keyset-paginated on
+    (timestamp, id) like history pages. Each message gets a `snippet` with the
+    matches in <mark>.
+    """
+    limit = max(1, min(int(limit), SEARCH_MAX_PAGE_SIZE))
+    query = SearchQuery(text, search_type='websearch', config=MESSAGE_SEARCH_CONFIG)
+
+    queryset = (
+        Message.objects
+        .alias(search=SearchVector('message', config=MESSAGE_SEARCH_CONFIG))
+        .filter(search=query, deleted=False)
+        .filter(Q(**room) if room else user_rooms_filter(user))
+    )
+    if before:
+        timestamp, message_id = decode_cursor(before)
+        queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+
+    # The headline is computed after the LIMIT, so only for the rows returned
+    queryset = queryset.annotate(
+        snippet=SearchHeadline(
+            'message', query, config=MESSAGE_SEARCH_CONFIG,
+            start_sel=_START, stop_sel=_STOP, max_words=30, min_words=10, max_fragments=2,
+        ),
+    ).select_related('sender', 'group').only(
+        'id', 'timestamp', 'group_id', 'private_chat_id', 'group__name',
+        'sender__userid', 'sender__username', 'sender__first_name', 'sender__last_name',
+    ).order_by('-timestamp', '-id')
+
+    messages = list(queryset[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    for message in messages:
+        message.snippet = highlight(message.snippet)
+
+    next_cursor = encode_cursor(messages[-1]) if has_more and messages else None
+    return messages, next_cursor
+
+
+# ---------------- Users ----------------
+
+def directory_cache_ttl(ttl):
+    """
+    `ttl` with a shared cache (CHAT_CACHE_URL), else at most LOCAL_DIRECTORY_CACHE_TTL.
+
+    invalidate_directory() only reaches the cache of the worker it runs in
+    unless that cache is shared, so other workers' copies must expire soon.
+    """
+    return ttl if getattr(settings, 'CHAT_CACHE_URL', None) else min(ttl, LOCAL_DIRECTORY_CACHE_TTL)
+
+
+def directory_version():
+    """
+    Version of the cached user directory, part of every directory and search cache key.
+    """
+    version = cache.get(_DIRECTORY_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(_DIRECTORY_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_directory():
+    """
+    Retire every cached directory page and search result at once.
+    """
+    try:
+        cache.incr(_DIRECTORY_VERSION_KEY)
+    except ValueError:
+        cache.set(_DIRECTORY_VERSION_KEY, 1, None)
+
+
+def directory_page(page=1, page_size=DIRECTORY_LIST_PAGE_SIZE):
+    """
+    One page of the user directory in name order, as (users, has_more).
+
+    Pages are cached and shared by all users under the directory version, so
+    a CustomUser change (see invalidate_directory) retires them all together.
+    Without a shared cache they are only kept a few seconds (directory_cache_ttl).
+    """
+    page = max(1, int(page))
+    page_size = max(1, min(int(page_size), DIRECTORY_LIST_MAX_PAGE_SIZE))
+    key = f'user-directory:{directory_version()}:{page_size}:{page}'
+    cached = cache.get(key)
+    if cached is None:
+        start = (page - 1) * page_size
+        users = list(
+            CustomUser.objects.order_by('first_name', 'last_name', 'username')
+            .values(*DIRECTORY_FIELDS)[start:start + page_size + 1]
+        )
+        cached = (users[:page_size], len(users) > page_size)
+        cache.set(key, cached, directory_cache_ttl(DIRECTORY_LIST_CACHE_TTL))
+    return cached
+
+
+def _name_matches(word):
+    """
+    Q matching users with `word` inside (icontains) or similar to (pg_trgm %)
+    any name field; both are served by customuser_trgm_idx.
+    """
+    matches = Q()
+    for field in USER_SEARCH_FIELDS:
+        matches |= Q(**{f'{field}__icontains': word}) | Q(**{f'{field}_upper__trigram_similar': word.upper()})
+    return matches
+
+
+def search_directory(text, exclude=None, limit=DIRECTORY_PAGE_SIZE):
+    """
+    Typeahead search of users by their username and names.
+
+    Every word of `text` must occur in, or be a close (trigram) match for, one
+    of the name fields, so "irst" finds "First" and "kariuky" finds "Kariuki".
+    Matches come from the customuser_trgm_idx GIN index and are ranked by
+    trigram similarity of the best matching field, then alphabetically.
+    The ranked rows for a query are cached for DIRECTORY_CACHE_TTL seconds and
+    shared by all users; `exclude` (a userid) is filtered out afterwards so the
+    cache entry does not depend on who asked.
+    """
+    text = ' '.join(text.lower().split())
+    if not text:
+        return []
+    key = 'user-search:' + hashlib.md5(f'{directory_version()}:{text}:{limit}'.encode()).hexdigest()
+    users = cache.get(key)
+    if users is None:
+        queryset = CustomUser.objects.alias(**{f'{field}_upper': Upper(field) for field in USER_SEARCH_FIELDS})
+        for word in text.split():
+            queryset = queryset.filter(_name_matches(word))
+        users = list(
+            queryset
+            .alias(rank=Greatest(*(TrigramSimilarity(f'{field}_upper', text.upper()) for field in USER_SEARCH_FIELDS)))
+            .order_by('-rank', 'first_name', 'last_name', 'username')
+            .values(*DIRECTORY_FIELDS)[:limit + 1]
+        )
+        cache.set(key, users, directory_cache_ttl(DIRECTORY_CACHE_TTL))
+    return [user for user in users if user['userid'] != exclude][:limit]
@@ -0,0 +1,218 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .backends import invalidate_cached_user
+from .membership import membership_cache
+from .models import CustomUser, GroupChat, PrivateChat, ChatReadState, RemovedChat
+from .notifications import push_room_joined, push_room_left
+from .search import invalidate_directory
+
+
+# ---------------- Read States ----------------
+
+@receiver(m2m_changed, sender=GroupChat.members.through)
+def sync_group_read_states(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep one ChatReadState per group member. New members start with everything read.
+    """
+    if action == 'post_add' and pk_set:
+        if reverse:
+            groups = GroupChat.objects.filter(pk__in=pk_set).values_list('pk', 'last_message_id')
+            states = [
+                ChatReadState(user=instance, group_id=group_id, last_read_message_id=last_message_id)
+                for group_id, last_message_id in groups
+            ]
+        else:
+            states = [
+                ChatReadState(user_id=user_id, group=instance, last_read_message_id=instance.last_message_id)
+                for user_id in pk_set
+            ]
+        ChatReadState.objects.bulk_create(states, ignore_conflicts=True)
+
+    elif action == 'post_remove' and pk_set:
+        if reverse:
+            ChatReadState.objects.filter(user=instance, group_id__in=pk_set).delete()
+        else:
+            ChatReadState.objects.filter(group=instance, user_id__in=pk_set).delete()
+
+    elif action == 'pre_clear':
+        if reverse:
+            ChatReadState.objects.filter(user=instance, group__isnull=False).delete()
+        else:
+            ChatReadState.objects.filter(group=instance).delete()
+
+
+@receiver(post_save, sender=PrivateChat)
+def create_private_read_states(sender, instance, created, **kwargs):
+    if created:
+        ChatReadState.objects.bulk_create([
+            ChatReadState(user_id=instance.user1_id, private_chat=instance),
+            ChatReadState(user_id=instance.user2_id, private_chat=instance),
+        ], ignore_conflicts=True)
+
+
+# ---------------- Chat List Removals ----------------
+
+@receiver(m2m_changed, sender=GroupChat.members.through)
+def record_group_removals(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Leave a RemovedChat per member and group, picked up by chat list delta syncs.
+    """
+    if action == 'pre_clear':
+        if reverse:
+            pk_set = set(instance.chat_groups.values_list('pk', flat=True))
+        else:
+            pk_set = set(instance.members.values_list('pk', flat=True))
+    elif action != 'post_remove':
+        return
+    if reverse:
+        removals = [RemovedChat(user=instance, chat_type='group', chat_id=group_id) for group_id in pk_set or ()]
+    else:
+        removals = [RemovedChat(user_id=user_id, chat_type='group', chat_id=instance.pk) for user_id in pk_set or ()]
+    RemovedChat.objects.bulk_create(removals)
+
+
+@receiver(pre_delete, sender=GroupChat)
+def record_group_deleted(sender, instance, **kwargs):
+    RemovedChat.objects.bulk_create([
+        RemovedChat(user_id=user_id, chat_type='group', chat_id=instance.pk)
+        for user_id in instance.members.values_list('pk', flat=True)
+    ])
+
+
+@receiver(pre_delete, sender=PrivateChat)
+def record_private_chat_deleted(sender, instance, origin=None, **kwargs):
+    # When a user is being deleted their private chats cascade; only the other side needs a record
+    if isinstance(origin, QuerySet) and origin.model is CustomUser:
+        deleting = set(origin.values_list('pk', flat=True))
+    else:
+        deleting = {origin.pk} if isinstance(origin, CustomUser) else set()
+    RemovedChat.objects.bulk_create([
+        RemovedChat(user_id=user_id, chat_type='private', chat_id=instance.pk)
+        for user_id in (instance.user1_id, instance.user2_id) if user_id not in deleting
+    ])
+
+
+# ---------------- Chat List Versions ----------------
+
+@receiver(post_save, sender=GroupChat)
+def bump_renamed_group(sender, instance, created, update_fields=None, **kwargs):
+    """
+    A group's name is shown in its members' chat lists: give their rows a new version.
+    """
+    if created or (update_fields is not None and 'name' not in update_fields):
+        return
+    # Any write to a row takes a new version
+    ChatReadState.objects.filter(group=instance).update(updated_at=Now())
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_renamed_user(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Same for a user's names, shown in the chat lists of everyone they have a private chat with.
+    """
+    if created or (update_fields is not None and not set(update_fields) & {'username', 'first_name', 'last_name'}):
+        return
+    chats = PrivateChat.objects.filter(Q(user1=instance) | Q(user2=instance)).values('pk')
+    ChatReadState.objects.filter(private_chat__in=chats).exclude(user=instance).update(updated_at=Now())
+
+
+# ---------------- Membership Cache ----------------
+
+@receiver(m2m_changed, sender=GroupChat.members.through)
+def invalidate_group_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear':
+        if reverse:
+            membership_cache.invalidate_user(instance.pk, 'group')
+        else:
+            membership_cache.invalidate('group', instance.pk)
+    elif reverse:
+        for group_id in pk_set or ():
+            membership_cache.invalidate('group', group_id, user_ids=[instance.pk])
+    else:
+        membership_cache.invalidate('group', instance.pk, user_ids=pk_set or ())
+
+
+@receiver(post_save, sender=PrivateChat)
+def invalidate_private_membership(sender, instance, **kwargs):
+    membership_cache.invalidate('private', instance.pk)
+
+
+@receiver(post_delete, sender=GroupChat)
+@receiver(post_delete, sender=PrivateChat)
+def invalidate_deleted_room(sender, instance, **kwargs):
+    room_type = 'group' if sender is GroupChat else 'private'
+    membership_cache.invalidate(room_type, instance.pk)
+
+
+# ---------------- Live Room Subscriptions ----------------
+
+@receiver(m2m_changed, sender=GroupChat.members.through)
+def push_group_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Subscribe or unsubscribe the open user-level sockets of added and removed members.
+    """
+    push = {'post_add': push_room_joined, 'post_remove': push_room_left, 'pre_clear': push_room_left}.get(action)
+    if push is None:
+        return
+    if action == 'pre_clear':
+        if reverse:
+            pk_set = set(instance.chat_groups.values_list('pk', flat=True))
+        else:
+            pk_set = set(instance.members.values_list('pk', flat=True))
+    if reverse:
+        for group_id in pk_set or ():
+            push([instance.pk], 'group', group_id)
+    else:
+        push(pk_set or (), 'group', instance.pk)
+
+
+@receiver(post_save, sender=PrivateChat)
+def push_private_chat_created(sender, instance, created, **kwargs):
+    if created:
+        push_room_joined([instance.user1_id, instance.user2_id], 'private', instance.pk)
+
+
+@receiver(pre_delete, sender=GroupChat)
+def push_group_deleted(sender, instance, **kwargs):
+    # Membership rows go with the group without m2m_changed, so collect them first
+    push_room_left(instance.members.values_list('pk', flat=True), 'group', instance.pk)
+
+
+@receiver(post_delete, sender=PrivateChat)
+def push_private_chat_deleted(sender, instance, **kwargs):
+    push_room_left([instance.user1_id, instance.user2_id], 'private', instance.pk)
+
+
+# ---------------- User Directory ----------------
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_directory(sender, update_fields=None, **kwargs):
+    # Logins and password changes touch no field the directory shows
+    if update_fields is not None and set(update_fields) <= {'last_login', 'password'}:
+        return
+    # After commit, so no worker can cache the directory again from the old rows
+    transaction.on_commit(invalidate_directory)
+
+
+# ---------------- Session Users ----------------
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_session_user(sender, instance, **kwargs):
+    # Password and is_active changes must reach every worker's next request,
+    # after commit so no request can cache the old row again
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, user, **kwargs):
+    if user is not None:
+        invalidate_cached_user(user.pk)
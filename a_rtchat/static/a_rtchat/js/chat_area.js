@@ -39,7 +39,7 @@ function applyLocalTime(root = document) {
 // ================================
 // Display Messages
 // ================================
-function displayMessage(message, senderFirstName, senderUsername, currentUsername, timestamp, chatType) {
+function displayMessage(message, senderFirstName, senderUsername, currentUsername, timestamp, chatType, prepend = false) {
     const chatMessages = document.getElementById("chatMessages");
     const placeholder = chatMessages.querySelector('.empty');
     if (placeholder) placeholder.remove();
@@ -61,56 +61,254 @@ function displayMessage(message, senderFirstName, senderUsername, currentUsernam
         <div class="timestamp" data-iso="${timestamp}">${formattedTime}</div>
     `;
 
+    if (prepend) {
+        chatMessages.insertBefore(messageElement, chatMessages.firstChild);
+        return messageElement;
+    }
     chatMessages.appendChild(messageElement);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageElement;
+}
+
+// Show a chat_message frame in the open room, once: a message can arrive both
+// live and in a reconnect replay. Tracks the cursor to resume from.
+function displayMessageFrame(data, currentUsername) {
+    const chatMessages = document.getElementById("chatMessages");
+    if (data.id && chatMessages.querySelector(`.message[data-id="${data.id}"]`)) return;
+
+    const senderFirstName = (data.sender_first_name || data.sender || 'unknown').toLowerCase();
+    const senderUsername = data.sender_username || data.sender || 'unknown';
+    const element = displayMessage(data.message, senderFirstName, senderUsername, currentUsername, data.timestamp, data.room_type);
+    if (data.id) element.dataset.id = data.id;
+    if (data.cursor) chatMessages.dataset.lastCursor = data.cursor;
 }
 
 // ================================
-// WebSocket Connection
+// Load Older Messages (keyset pages)
 // ================================
-function connectToRoom(roomType, roomId) {
-    if (window.chatSocket) window.chatSocket.close();
+function loadOlderMessages() {
+    const chatMessages = document.getElementById('chatMessages');
+    const cursor = chatMessages.dataset.nextCursor;
+    if (!cursor || !chatMessages.dataset.room || chatMessages.dataset.loading) return;
 
+    const [roomType, roomId] = chatMessages.dataset.room.split('_');
+    const currentUsername = document.getElementById('chatAppContent').dataset.username;
+    chatMessages.dataset.loading = '1';
+
+    fetch(`/get_messages/${roomType}/${roomId}/?before=${encodeURIComponent(cursor)}`)
+        .then(res => res.json())
+        .then(data => {
+            const previousHeight = chatMessages.scrollHeight;
+            (data.messages || []).slice().reverse().forEach(msg => {
+                const senderFirstName = (msg.sender_first_name || msg.sender || 'unknown').toLowerCase();
+                const senderUsername = msg.sender_username || msg.sender || 'unknown';
+                displayMessage(msg.message, senderFirstName, senderUsername, currentUsername, msg.timestamp, roomType, true);
+            });
+            chatMessages.dataset.nextCursor = data.next_cursor || '';
+            chatMessages.scrollTop += chatMessages.scrollHeight - previousHeight;
+        })
+        .catch(err => console.error('Error loading older messages:', err))
+        .finally(() => delete chatMessages.dataset.loading);
+}
+
+// ================================
+// WebSocket Connection
+// ================================
+// One socket per user, subscribed to all of the user's rooms. Frames carry
+// room_type and room_id: the open room renders them, the sidebar shows the rest.
+function connectUserSocket() {
     const ws_scheme = window.location.protocol === "https:" ? "wss" : "ws";
-    const chatSocket = new WebSocket(`${ws_scheme}://${window.location.host}/ws/chat/${roomType}/${roomId}/`);
+    // After a drop, ask for the open room's messages since the last one shown
+    const chatMessages = document.getElementById('chatMessages');
+    const resume = window.chatSocketLost && chatMessages.dataset.room && chatMessages.dataset.lastCursor
+        ? `?room=${chatMessages.dataset.room}&after=${encodeURIComponent(chatMessages.dataset.lastCursor)}`
+        : '';
+    const chatSocket = new WebSocket(`${ws_scheme}://${window.location.host}/ws/chat/${resume}`);
 
     chatSocket.onmessage = function(e) {
         const data = JSON.parse(e.data);
         const currentUsername = document.getElementById('chatAppContent').dataset.username;
+        const isActive = `${data.room_type}_${data.room_id}` === document.getElementById('chatMessages').dataset.room;
+
+        const visible = document.visibilityState === 'visible';
 
         if (data.type === 'chat_message') {
-            const senderFirstName = (data.sender_first_name || data.sender || 'unknown').toLowerCase();
-            const senderUsername = data.sender_username || data.sender || 'unknown';
-            displayMessage(data.message, senderFirstName, senderUsername, currentUsername, data.timestamp, data.room_type);
-        } else if (data.type === 'notification') {
-            const chatList = document.getElementById('chatList');
-            const chatListItem = chatList.querySelector(
-                `.contact-item[data-room="${data.room_id}"][data-type="${data.room_type}"]`
-            );
-            if (chatListItem) {
-                if (data.unread_count) {
-                    let unreadMarker = chatListItem.querySelector('.unread-marker');
+            if (isActive) displayMessageFrame(data, currentUsername);
+            if (isActive && visible && data.sender_username !== currentUsername) {
+                sendReadReceipt(data.room_type, data.room_id, data.id);
+            }
+            updateChatListItem(data, !(isActive && visible) && data.sender_username !== currentUsername);
+        } else if (data.type === 'replay') {
+            if (isActive) {
+                data.messages.forEach(msg => displayMessageFrame(msg, currentUsername));
+                if (visible && data.messages.length) sendReadReceipt(data.room_type, data.room_id, data.messages[data.messages.length - 1].id);
+            }
+        } else if (data.type === 'read_receipt') {
+            showReadReceipts(data, currentUsername, isActive);
+        } else if (data.type === 'too_far_behind') {
+            if (isActive) window.location.href = `/chat/${data.room_type}/${data.room_id}/`;
+        } else if (data.type === 'typing') {
+            if (isActive) showTyping(data.users.filter(u => u.sender_username !== currentUsername));
+        } else if (data.type === 'read') {
+            const item = findChatListItem(data.room_type, data.room_id);
+            item?.querySelector('.unread-marker')?.remove();
+        } else if (data.type === 'room_joined' || data.type === 'room_left') {
+            refreshChatList();
+        }
+    };
+
+    chatSocket.onclose = () => {
+        console.error("Chat socket closed, reconnecting");
+        window.chatSocketLost = true;
+        setTimeout(connectUserSocket, 2000);
+    };
+    chatSocket.onopen = () => {
+        console.log("Chat socket opened");
+        // Catch up on what changed while disconnected
+        if (window.chatSocketLost) syncChatList();
+    };
+
+    window.chatSocket = chatSocket;
+}
+
+// ================================
+// Live Chat List
+// ================================
+function findChatListItem(roomType, roomId) {
+    return document.querySelector(`#chatList .contact-item[data-room="${roomId}"][data-type="${roomType}"]`);
+}
+
+function updateChatListItem(data, countUnread) {
+    const item = findChatListItem(data.room_type, data.room_id);
+    if (!item) return refreshChatList();
+
+    const lastMessageSpan = item.querySelector('.last-message');
+    if (lastMessageSpan) {
+        lastMessageSpan.textContent = data.message.length > 30 ? `${data.message.substring(0, 29)}…` : data.message;
+    }
+    const time = item.querySelector('.message-time');
+    if (time) {
+        time.setAttribute('data-iso', data.timestamp);
+        applyLocalTime(item);
+    }
+    if (countUnread) {
+        let unreadMarker = item.querySelector('.unread-marker');
+        if (!unreadMarker) {
+            unreadMarker = document.createElement('span');
+            unreadMarker.className = 'unread-marker';
+            unreadMarker.textContent = '0';
+            item.appendChild(unreadMarker);
+        }
+        unreadMarker.textContent = parseInt(unreadMarker.textContent || '0', 10) + 1;
+    }
+    item.parentNode.prepend(item);
+}
+
+function refreshChatList() {
+    // Re-render the list from the server after rooms were added or removed
+    fetch('/home/')
+        .then(res => res.text())
+        .then(html => {
+            const page = new DOMParser().parseFromString(html, 'text/html');
+            const fresh = page.querySelector('#chatList .contact-list');
+            const list = document.querySelector('#chatList .contact-list');
+            if (!fresh || !list) return;
+            list.innerHTML = fresh.innerHTML;
+            document.getElementById('chatList').dataset.chatVersion = page.getElementById('chatList').dataset.chatVersion;
+            applyLocalTime(list);
+            refreshPresence();
+        })
+        .catch(err => console.error('Error refreshing chat list:', err));
+}
+
+// Fetch only the chats that changed since the version this page has seen.
+// Filtered lists carry no version and are not synced.
+function syncChatList() {
+    const chatList = document.getElementById('chatList');
+    const since = chatList.dataset.chatVersion;
+    if (!since || chatList.dataset.syncing) return;
+    chatList.dataset.syncing = '1';
+
+    fetch(`/sync_chats/?since=${encodeURIComponent(since)}`)
+        .then(res => res.json())
+        .then(data => {
+            (data.removed || []).forEach(chat => findChatListItem(chat.chat_type, chat.id)?.remove());
+
+            const activeRoom = document.getElementById('chatMessages').dataset.room;
+            let missing = false;
+            // Newest first: prepend in reverse so the list ends up in order
+            (data.chats || []).slice().reverse().forEach(chat => {
+                const item = findChatListItem(chat.chat_type, chat.id);
+                if (!item) { missing = true; return; }
+                const preview = chat.last_message ? chat.last_message.message : '';
+                const lastMessageSpan = item.querySelector('.last-message');
+                if (lastMessageSpan) lastMessageSpan.textContent = preview.length > 30 ? `${preview.substring(0, 29)}…` : preview;
+                const time = item.querySelector('.message-time');
+                if (time && chat.last_message) {
+                    time.setAttribute('data-iso', chat.last_message.timestamp);
+                    applyLocalTime(item);
+                }
+                let unreadMarker = item.querySelector('.unread-marker');
+                if (chat.unread_count > 0 && `${chat.chat_type}_${chat.id}` !== activeRoom) {
                     if (!unreadMarker) {
                         unreadMarker = document.createElement('span');
                         unreadMarker.className = 'unread-marker';
-                        chatListItem.appendChild(unreadMarker);
+                        item.appendChild(unreadMarker);
                     }
-                    unreadMarker.textContent = data.unread_count;
-                    unreadMarker.style.display = 'inline-block';
+                    unreadMarker.textContent = chat.unread_count;
+                } else if (unreadMarker) {
+                    unreadMarker.remove();
                 }
-                if (data.last_message) {
-                    const lastMessageSpan = chatListItem.querySelector('.last-message');
-                    if (lastMessageSpan) lastMessageSpan.textContent = data.last_message.message.substring(0,30);
-                }
-                chatListItem.parentNode.prepend(chatListItem);
-            }
-        }
-    };
+                item.parentNode.prepend(item);
+            });
 
-    chatSocket.onclose = () => console.error("Chat socket closed");
-    chatSocket.onopen = () => console.log("Chat socket opened");
+            chatList.dataset.chatVersion = data.version;
+            if (missing) refreshChatList();
+        })
+        .catch(err => console.error('Chat list sync error:', err))
+        .finally(() => delete chatList.dataset.syncing);
+}
 
-    window.chatSocket = chatSocket;
+// ================================
+// Typing Indicator
+// ================================
+let lastTypingSent = 0;
+let typingTimer = null;
+
+function sendTyping() {
+    // The server coalesces typing per room; this only avoids a frame per keystroke
+    const now = Date.now();
+    const room = document.getElementById('chatMessages').dataset.room;
+    if (!room || !window.chatSocket || window.chatSocket.readyState !== WebSocket.OPEN || now - lastTypingSent < 1000) return;
+    lastTypingSent = now;
+    const [room_type, room_id] = room.split('_');
+    window.chatSocket.send(JSON.stringify({ type: 'typing', room_type, room_id }));
+}
+
+function showTyping(users) {
+    const indicator = document.getElementById('typingIndicator');
+    if (!indicator || users.length === 0) return;
+    const names = users.map(u => u.sender_first_name).join(', ');
+    indicator.textContent = `${names} ${users.length > 1 ? 'are' : 'is'} typing…`;
+    clearTimeout(typingTimer);
+    typingTimer = setTimeout(() => { indicator.textContent = ''; }, 3000);
+}
+
+// ================================
+// Presence
+// ================================
+function refreshPresence() {
+    const items = document.querySelectorAll('.contact-item[data-userid]');
+    if (items.length === 0) return;
+    const params = new URLSearchParams();
+    items.forEach(item => params.append('userid', item.dataset.userid));
+
+    fetch(`/presence/?${params}`)
+        .then(res => res.json())
+        .then(data => {
+            items.forEach(item => item.classList.toggle('online', !!(data.presence || {})[item.dataset.userid]));
+        })
+        .catch(err => console.error('Presence error:', err));
 }
 
 // ================================
@@ -137,32 +335,51 @@ function markMessagesAsRead(chatListItem) {
     if (!chatListItem) return;
     const unreadMarker = chatListItem.querySelector('.unread-marker');
     if (unreadMarker) unreadMarker.remove();
+}
 
-    const room_id = chatListItem.dataset.room;
-    const is_private = chatListItem.dataset.type === 'private';
-    const csrfToken = getCookie('csrftoken');
-
+// Tell the server the user has read up to messageId. Receipts go over the
+// socket, where they are coalesced; the HTTP endpoint is only a fallback.
+function sendReadReceipt(roomType, roomId, messageId) {
+    if (!messageId) return;
+    if (window.chatSocket && window.chatSocket.readyState === WebSocket.OPEN) {
+        window.chatSocket.send(JSON.stringify({ type: 'read', room_type: roomType, room_id: roomId, message_id: messageId }));
+        return;
+    }
     fetch('/mark_messages_as_read/', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
-        body: JSON.stringify({ room_id, is_private })
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+        body: JSON.stringify({ room_id: roomId, is_private: roomType === 'private' })
     }).catch(err => console.error('Error marking as read:', err));
 }
 
+// Receipts of the other participants tick the user's own messages they have read
+function showReadReceipts(data, currentUsername, isActive) {
+    data.reads.forEach(read => {
+        if (read.sender_username === currentUsername) {
+            findChatListItem(data.room_type, data.room_id)?.querySelector('.unread-marker')?.remove();
+        } else if (isActive) {
+            document.querySelectorAll('#chatMessages .message.sent[data-id]').forEach(el => {
+                if (parseInt(el.dataset.id, 10) <= read.message_id) el.classList.add('seen');
+            });
+        }
+    });
+}
+
 // ================================
 // Chat List Search
 // ================================
 function setupChatSearch() {
     const searchInput = document.querySelector('.list-search-input');
     const clearSearchIcon = document.querySelector('.clear-search-icon');
-    const chatItems = document.querySelectorAll('.contact-item');
+    // Queried on use: the list is re-rendered when rooms are added or removed
+    const chatItems = () => document.querySelectorAll('#chatList .contact-item');
     if (!searchInput) return;
 
     searchInput.addEventListener('input', function(e) {
         const searchTerm = e.target.value.toLowerCase().trim();
         if (clearSearchIcon) clearSearchIcon.style.display = searchTerm ? 'block' : 'none';
 
-        chatItems.forEach(item => {
+        chatItems().forEach(item => {
             const contactName = item.querySelector('.contact-name').textContent.toLowerCase();
             const lastMessage = item.querySelector('.last-message')?.textContent.toLowerCase() || '';
             item.style.display = contactName.includes(searchTerm) || lastMessage.includes(searchTerm) ? 'flex' : 'none';
@@ -173,7 +390,7 @@ function setupChatSearch() {
         clearSearchIcon.addEventListener('click', function() {
             searchInput.value = '';
             this.style.display = 'none';
-            chatItems.forEach(item => item.style.display = 'flex');
+            chatItems().forEach(item => item.style.display = 'flex');
         });
     }
 }
@@ -181,43 +398,71 @@ function setupChatSearch() {
 // ================================
 // User Search (Private / Group)
 // ================================
+function renderUserResults(users, resultsContainer, isGroupSearch, append = false) {
+    if (!append) resultsContainer.innerHTML = '';
+    resultsContainer.style.display = 'block';
+    if (!append && users.length === 0) {
+        resultsContainer.innerHTML = '<div class="no-results">No users found</div>';
+        return;
+    }
+    users.forEach(user => {
+        const userElement = document.createElement('div');
+        userElement.className = 'search-result-item';
+        userElement.dataset.userId = user.userid;
+        const displayName = user.first_name && user.last_name ? `${user.first_name} ${user.last_name}` : user.userid;
+        userElement.textContent = displayName;
+
+        userElement.addEventListener('click', () => {
+            if (isGroupSearch) addGroupMember(user.userid, displayName);
+            else {
+                const searchInput = document.getElementById('userSearchInput');
+                searchInput.value = displayName;
+                searchInput.dataset.selectedUserId = user.userid;
+                resultsContainer.innerHTML = '';
+                resultsContainer.style.display = 'none';
+            }
+        });
+        resultsContainer.appendChild(userElement);
+    });
+}
+
 function searchUsers(query, resultsContainer, isGroupSearch = false) {
+    if (query.length === 0) return showDirectory(resultsContainer, isGroupSearch);
     if (query.length < 2) {
         resultsContainer.innerHTML = '';
         resultsContainer.style.display = 'none';
         return;
     }
 
+    delete resultsContainer.dataset.directoryPage;
     fetch(`/search_users/?q=${encodeURIComponent(query)}`)
+        .then(res => res.json())
+        .then(data => renderUserResults(data.users || [], resultsContainer, isGroupSearch))
+        .catch(err => console.error('User search error:', err));
+}
+
+// Browse the directory page by page while the search box is empty
+function showDirectory(resultsContainer, isGroupSearch = false, page = 1) {
+    if (resultsContainer.dataset.loading) return;
+    resultsContainer.dataset.loading = '1';
+
+    fetch(`/available_users/?page=${page}`)
         .then(res => res.json())
         .then(data => {
-            resultsContainer.innerHTML = '';
-            if (data.users && data.users.length > 0) {
-                resultsContainer.style.display = 'block';
-                data.users.forEach(user => {
-                    const userElement = document.createElement('div');
-                    userElement.className = 'search-result-item';
-                    userElement.dataset.userId = user.userid;
-                    const displayName = user.first_name && user.last_name ? `${user.first_name} ${user.last_name}` : user.userid;
-                    userElement.textContent = displayName;
-
-                    userElement.addEventListener('click', () => {
-                        if (isGroupSearch) addGroupMember(user.userid, displayName);
-                        else {
-                            const searchInput = document.getElementById('userSearchInput');
-                            searchInput.value = displayName;
-                            searchInput.dataset.selectedUserId = user.userid;
-                            resultsContainer.innerHTML = '';
-                            resultsContainer.style.display = 'none';
-                        }
-                    });
-                    resultsContainer.appendChild(userElement);
-                });
-            } else {
-                resultsContainer.style.display = 'block';
-                resultsContainer.innerHTML = '<div class="no-results">No users found</div>';
-            }
-        }).catch(err => console.error('User search error:', err));
+            renderUserResults(data.users || [], resultsContainer, isGroupSearch, page > 1);
+            resultsContainer.dataset.directoryPage = page;
+            resultsContainer.dataset.hasMore = data.has_more ? '1' : '';
+        })
+        .catch(err => console.error('User directory error:', err))
+        .finally(() => delete resultsContainer.dataset.loading);
+}
+
+function setupDirectoryScroll(resultsContainer, isGroupSearch) {
+    resultsContainer.addEventListener('scroll', () => {
+        const page = parseInt(resultsContainer.dataset.directoryPage || '0', 10);
+        const nearBottom = resultsContainer.scrollTop + resultsContainer.clientHeight >= resultsContainer.scrollHeight - 20;
+        if (page && resultsContainer.dataset.hasMore && nearBottom) showDirectory(resultsContainer, isGroupSearch, page + 1);
+    });
 }
 
 // ================================
@@ -300,6 +545,29 @@ document.addEventListener('DOMContentLoaded', () => {
     document.getElementById('sendButton').onclick = sendMessage;
     document.getElementById('messageInput').addEventListener('keydown', (e) => {
         if (e.key === 'Enter') { e.preventDefault(); sendMessage(); }
+        else sendTyping();
+    });
+
+    // One live connection for all rooms
+    connectUserSocket();
+
+    // Sidebar presence
+    refreshPresence();
+    setInterval(refreshPresence, 30000);
+
+    // Chat list delta sync: cheap when nothing changed
+    setInterval(syncChatList, 60000);
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState !== 'visible') return;
+        syncChatList();
+        // Messages that arrived in the open room while hidden are read now
+        const chatMessages = document.getElementById('chatMessages');
+        const last = chatMessages.querySelector('.message[data-id]:last-of-type');
+        if (chatMessages.dataset.room && last) {
+            const [roomType, roomId] = chatMessages.dataset.room.split('_');
+            markMessagesAsRead(findChatListItem(roomType, roomId));
+            sendReadReceipt(roomType, roomId, parseInt(last.dataset.id, 10));
+        }
     });
 
     // Chat item click
@@ -315,7 +583,7 @@ document.addEventListener('DOMContentLoaded', () => {
             chatBody.style.display = 'flex';
         }
 
-        connectToRoom(chatType, roomName);
+        document.getElementById('chatMessages').dataset.room = `${chatType}_${roomName}`;
         markMessagesAsRead(item);
 
         fetch(`/get_messages/${chatType}/${roomName}/`)
@@ -327,12 +595,16 @@ document.addEventListener('DOMContentLoaded', () => {
                     data.messages.forEach(msg => {
                         const senderFirstName = (msg.sender_first_name || msg.sender || 'unknown').toLowerCase();
                         const senderUsername = msg.sender_username || msg.sender || 'unknown';
-                        displayMessage(msg.message, senderFirstName, senderUsername, currentUsername, msg.timestamp, chatType);
+                        displayMessage(msg.message, senderFirstName, senderUsername, currentUsername, msg.timestamp, chatType).dataset.id = msg.id;
                     });
+                    chatMessages.dataset.lastCursor = data.messages[data.messages.length - 1].cursor;
+                    sendReadReceipt(chatType, roomName, data.messages[data.messages.length - 1].id);
                 } else {
+                    chatMessages.dataset.lastCursor = '0-0';
                     chatMessages.innerHTML = '<p class="empty">No messages in this chat yet</p>';
                 }
                 chatMessages.dataset.room = `${chatType}_${roomName}`;
+                chatMessages.dataset.nextCursor = data.next_cursor || '';
             });
 
         const contactName = item.querySelector('.contact-name').textContent;
@@ -361,6 +633,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const userResultsContainer = document.getElementById('userSearchResults');
     if (userSearchInput && userResultsContainer) {
         userSearchInput.addEventListener('input', (e) => searchUsers(e.target.value, userResultsContainer, false));
+        setupDirectoryScroll(userResultsContainer, false);
     }
 
     // Group search
@@ -368,6 +641,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const groupResultsContainer = document.getElementById('groupMemberResults');
     if (groupSearchInput && groupResultsContainer) {
         groupSearchInput.addEventListener('input', (e) => searchUsers(e.target.value, groupResultsContainer, true));
+        setupDirectoryScroll(groupResultsContainer, true);
     }
 
     // Chat type toggle
@@ -384,6 +658,9 @@ document.addEventListener('DOMContentLoaded', () => {
     // Modal open/close
     document.getElementById('createNewChat').addEventListener('click', () => {
         document.getElementById('newChatModal').style.display = 'flex';
+        // The user list is only loaded once the dialog is opened
+        if (userResultsContainer && !userSearchInput.value) showDirectory(userResultsContainer, false);
+        if (groupResultsContainer && !groupSearchInput.value) showDirectory(groupResultsContainer, true);
     });
     document.getElementById('closeNewChatModal').addEventListener('click', () => {
         document.getElementById('newChatModal').style.display = 'none';
@@ -407,6 +684,11 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         });
         observer.observe(chatMessages, { childList: true, subtree: true });
+
+        // Fetch the previous page when scrolled to the top
+        chatMessages.addEventListener('scroll', () => {
+            if (chatMessages.scrollTop === 0) loadOlderMessages();
+        });
     }
 });
 
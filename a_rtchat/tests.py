@@ -1,3 +1,892 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import presence
+from .admin import MessageAdmin
+from .backends import user_cache_key
+from .export import csv_chunks, export_rows, history_messages, write_xlsx
+from .group_members import add_group_members, remove_group_members
+from .history import encode_cursor, get_message_page, room_filter
+from .membership import membership_cache
+from .partitions import DEFAULT_PARTITION, add_months, create_partition, detach_partition, month_partitions, month_start, partition_name
+from .persistence import MessageWriteBuffer, write_messages
+from .models import CustomUser, GroupChat, PrivateChat, Message, ChatReadState, RemovedChat
+from .notifications import room_group_name
+from .receipts import ReadReceiptCoalescer, write_read_receipts
+from .routing import websocket_urlpatterns
+from .search import directory_cache_ttl, directory_page, search_directory, search_messages
+from .views import get_all_chats, user_chat_list_version
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query issued by the hot paths against a seeded database and
+    fail if any of them has to fall back to a sequential scan of an app table.
+    Sequential scans (and sorts, where order matters) are disabled for the
+    planner, so one only shows up when no usable index exists.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = CustomUser.objects.bulk_create([
+            CustomUser(userid=f'UTEL/CC/UGCL-{i:04d}/2024', username=f'user{i}', first_name=f'User{i}')
+            for i in range(50)
+        ])
+        cls.user = cls.users[0]
+        cls.groups = GroupChat.objects.bulk_create([GroupChat(name=f'Group {i}') for i in range(10)])
+        for group in cls.groups:
+            group.members.add(*cls.users[:25])
+        cls.private_chats = [
+            PrivateChat.objects.create(user1=cls.user, user2=other) for other in cls.users[1:20]
+        ]
+
+        messages = []
+        for i in range(4000):
+            sender = cls.users[i % 25]
+            if i % 2:
+                messages.append(Message(sender=sender, group=cls.groups[(i // 2) % 10], message=f'group message {i}'))
+            else:
+                messages.append(Message(sender=cls.user, private_chat=cls.private_chats[i % 19], message=f'private message {i}'))
+        Message.objects.bulk_create(messages, batch_size=1000)
+        for message in Message.objects.order_by('timestamp', 'id').iterator():
+            message.update_chat_summary()
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoSeqScan(self, func, forbid_sort=False, index=None):
+        """
+        Run func and EXPLAIN each query it issued. With forbid_sort the rows must
+        also come out of an index already in the requested order; with index, at
+        least one of the plans must use that index.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        explained = 0
+        indexes = set()
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if sql.startswith('DECLARE '):
+                # Server-side cursors (iterator()) are logged as DECLARE ... CURSOR ... FOR <query>
+                sql = sql.split(' FOR ', 1)[1]
+            if not sql.lstrip(' (').upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                if forbid_sort:
+                    cursor.execute('SET LOCAL enable_sort = off')
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = [
+                node['Relation Name'] for node in self._plan_nodes(plan[0]['Plan'])
+                if node['Node Type'] == 'Seq Scan' and node.get('Relation Name', '').startswith('a_rtchat_')
+            ]
+            self.assertEqual(scans, [], f'Sequential scan in plan for: {sql}')
+            if forbid_sort:
+                sorts = [node for node in self._plan_nodes(plan[0]['Plan']) if node['Node Type'] == 'Sort']
+                self.assertEqual(sorts, [], f'Sort in plan for: {sql}')
+            indexes.update(node.get('Index Name') for node in self._plan_nodes(plan[0]['Plan']))
+            explained += 1
+        self.assertTrue(explained, 'No queries were captured')
+        if index:
+            # Indexes of partitioned tables (Message) are used through their per-partition children
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT coalesce(pg_partition_root(oid), oid)::regclass::text FROM pg_class WHERE relname = ANY(%s)',
+                    [[name for name in indexes if name]],
+                )
+                indexes.update(row[0] for row in cursor.fetchall())
+            self.assertIn(index, indexes)
+
+    def _plan_nodes(self, node):
+        yield node
+        for child in node.get('Plans', []):
+            yield from self._plan_nodes(child)
+
+    def test_group_history_page(self):
+        room = room_filter('group', self.groups[0])
+        cursor = encode_cursor(Message.objects.filter(group=self.groups[0]).latest('timestamp'))
+        self.assertNoSeqScan(lambda: get_message_page(room), forbid_sort=True)
+        self.assertNoSeqScan(lambda: get_message_page(room, before=cursor), forbid_sort=True)
+        self.assertNoSeqScan(lambda: get_message_page(room, after=cursor), forbid_sort=True)
+
+    def test_private_history_page(self):
+        room = room_filter('private', self.private_chats[0])
+        cursor = encode_cursor(Message.objects.filter(private_chat=self.private_chats[0]).latest('timestamp'))
+        self.assertNoSeqScan(lambda: get_message_page(room), forbid_sort=True)
+        self.assertNoSeqScan(lambda: get_message_page(room, before=cursor), forbid_sort=True)
+
+    def test_sidebar(self):
+        self.assertNoSeqScan(lambda: get_all_chats(self.user))
+        self.assertNoSeqScan(lambda: user_chat_list_version(self.user))
+
+    def test_unread_increment(self):
+        message = Message.objects.filter(group=self.groups[0]).latest('timestamp')
+        self.assertNoSeqScan(message.increment_unread_counts)
+
+    def test_mark_read(self):
+        group = GroupChat.objects.get(pk=self.groups[0].pk)
+        private_chat = PrivateChat.objects.get(pk=self.private_chats[0].pk)
+        self.assertNoSeqScan(lambda: ChatReadState.mark_read(self.user, 'group', group))
+        self.assertNoSeqScan(lambda: ChatReadState.mark_read(self.user, 'private', private_chat))
+
+    def test_read_receipts(self):
+        group = GroupChat.objects.get(pk=self.groups[0].pk)
+        private_chat = PrivateChat.objects.get(pk=self.private_chats[0].pk)
+        receipts = {
+            (self.users[1].pk, 'group', group.pk): group.last_message_id,
+            (self.user.pk, 'private', private_chat.pk): private_chat.last_message_id,
+        }
+        self.assertNoSeqScan(lambda: write_read_receipts(receipts))
+
+    def test_history_export(self):
+        messages = history_messages(groups=GroupChat.objects.filter(pk=self.groups[0].pk))
+        self.assertNoSeqScan(lambda: list(export_rows(messages)), forbid_sort=True)
+        rows = list(export_rows(history_messages(senders=[self.users[1]])))
+        self.assertEqual(len(rows), Message.objects.filter(sender=self.users[1]).count())
+
+    def test_message_admin(self):
+        queryset = MessageAdmin(Message, admin.site).get_queryset(None)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(
+                queryset.datetimes('timestamp', kind), list(QuerySet.datetimes(queryset, 'timestamp', kind)),
+            )
+        self.assertNoSeqScan(lambda: queryset.datetimes('timestamp', 'day'), index='message_timestamp_idx')
+        page = queryset.select_related(*MessageAdmin.list_select_related)
+        self.assertNoSeqScan(lambda: list(page[:100]), forbid_sort=True, index='message_timestamp_idx')
+        self.assertNoSeqScan(lambda: list(page.filter(is_pinned=True)[:100]), index='message_pinned_idx')
+
+    def test_bulk_group_members(self):
+        group = GroupChat.objects.create(name='Department')
+        user_ids = [user.pk for user in self.users] + ['UTEL/CC/UGCL-9999/2024']
+        with self.assertNumQueries(4):
+            self.assertEqual(len(add_group_members(group, user_ids)), 50)
+        self.assertEqual(ChatReadState.objects.filter(group=group).count(), 50)
+        self.assertEqual(add_group_members(group, user_ids[:10]), [])
+        self.assertEqual(len(remove_group_members(group, user_ids[:20])), 20)
+        self.assertEqual(ChatReadState.objects.filter(group=group).count(), 30)
+        self.assertEqual(RemovedChat.objects.filter(chat_type='group', chat_id=group.pk).count(), 20)
+
+    def test_private_chat_pair_lookup(self):
+        other = self.users[5]
+        self.assertNoSeqScan(lambda: PrivateChat.objects.filter(
+            (Q(user1=self.user) & Q(user2=other)) | (Q(user1=other) & Q(user2=self.user))
+        ).first())
+
+    def test_group_membership_check(self):
+        self.assertNoSeqScan(lambda: GroupChat.objects.filter(id=self.groups[0].id, members=self.user).first())
+
+    def test_message_search(self):
+        # A term matching half the table is read newest-first off message_timestamp_idx; a selective one uses GIN
+        self.assertNoSeqScan(lambda: search_messages(self.user, 'group message 1001'), index='message_search_idx')
+        self.assertNoSeqScan(lambda: search_messages(self.user, 'group message'))
+        room = room_filter('private', self.private_chats[0])
+        self.assertNoSeqScan(lambda: search_messages(self.user, 'private', room=room))
+
+    def test_user_directory_search(self):
+        self.assertNoSeqScan(lambda: search_directory('user1'), index='customuser_trgm_idx')
+        self.assertNoSeqScan(lambda: search_directory('ser1 usr1'), index='customuser_trgm_idx')
+        users = search_directory('User1 user1', exclude=self.users[1].userid, limit=10)
+        self.assertEqual({user['userid'] for user in users}, {user.userid for user in self.users[10:20]})
+
+    def test_chat_list_delta(self):
+        # An idle sync: nothing at or above the version asked for
+        version = max(state.version for state in ChatReadState.objects.filter(user=self.user)) + 1
+        self.assertNoSeqScan(
+            lambda: list(ChatReadState.objects.filter(user=self.user, version__gte=version)),
+            index='readstate_user_version_idx',
+        )
+        self.assertNoSeqScan(lambda: list(RemovedChat.objects.filter(user=self.user, version__gte=version)))
+        self.assertNoSeqScan(lambda: get_all_chats(self.user, group_ids=[self.groups[0].id], private_ids=[]))
+
+
+class ReadStateTests(TestCase):
+    """
+    Unread counters and watermarks under concurrent deliveries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.sender = CustomUser.objects.bulk_create([
+            CustomUser(userid=f'UTEL/CC/UGCL-{i:04d}/2024', username=f'reader{i}') for i in range(2)
+        ])
+        cls.group = GroupChat.objects.create(name='Group')
+        cls.group.members.add(cls.reader, cls.sender)
+
+    def deliver(self):
+        message = Message.objects.create(sender=self.sender, group=self.group, message='hello')
+        Message.record_delivery([message])
+        return message
+
+    def read_state(self):
+        return ChatReadState.objects.get(user=self.reader, group=self.group)
+
+    def test_mark_read_keeps_later_message_unread(self):
+        first = self.deliver()
+        shown = GroupChat.objects.get(pk=self.group.pk)
+        # Delivered after the page loaded the chat, before mark_read runs
+        self.deliver()
+        ChatReadState.mark_read(self.reader, 'group', shown)
+        state = self.read_state()
+        self.assertEqual((state.last_read_message_id, state.unread_count), (first.id, 2))
+
+        current = GroupChat.objects.get(pk=self.group.pk)
+        ChatReadState.mark_read(self.reader, 'group', current)
+        state = self.read_state()
+        self.assertEqual((state.last_read_message_id, state.unread_count), (current.last_message_id, 0))
+        # An older page never moves the watermark back
+        ChatReadState.mark_read(self.reader, 'group', shown)
+        self.assertEqual(self.read_state().last_read_message_id, current.last_message_id)
+
+
+class ChatListVersionTests(TransactionTestCase):
+    """
+    Chat list versions are transaction ids and commit out of order; delta
+    syncs must still see every change. Runs outside a test transaction, whose
+    id would be older than every version taken in the test.
+    """
+
+    def setUp(self):
+        self.reader, self.sender = CustomUser.objects.bulk_create([
+            CustomUser(userid=f'UTEL/CC/UGCL-{i:04d}/2024', username=f'reader{i}') for i in range(2)
+        ])
+        self.slow_group, self.group = GroupChat.objects.bulk_create([GroupChat(name='Slow'), GroupChat(name='Group')])
+        for group in (self.slow_group, self.group):
+            group.members.add(self.reader, self.sender)
+        self.deliver(self.group)
+        self.client.force_login(self.reader)
+
+    def deliver(self, group):
+        message = Message.objects.create(sender=self.sender, group=group, message='hello')
+        Message.record_delivery([message])
+        return message
+
+    def read_state(self, group):
+        return ChatReadState.objects.get(user=self.reader, group=group)
+
+    def sync(self, since=None):
+        response = self.client.get(reverse('a_rtchat:sync_chats'), {'since': since} if since is not None else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def open_delivery(self, group):
+        """
+        Deliver to `group` in a thread whose transaction stays open until the returned event is set.
+        """
+        delivered = threading.Event()
+        commit = threading.Event()
+
+        def deliver():
+            try:
+                with transaction.atomic():
+                    self.deliver(group)
+                    delivered.set()
+                    commit.wait(5)
+            finally:
+                connection.close()
+
+        delivery = threading.Thread(target=deliver)
+        delivery.start()
+        self.assertTrue(delivered.wait(5))
+        self.addCleanup(delivery.join, 5)
+        self.addCleanup(commit.set)
+        return commit, delivery
+
+    def test_mark_read_waits_for_open_delivery(self):
+        def mark_read():
+            try:
+                ChatReadState.mark_read(self.reader, 'group', GroupChat.objects.get(pk=self.slow_group.pk))
+            finally:
+                connection.close()
+
+        first = self.deliver(self.slow_group)
+        commit, delivery = self.open_delivery(self.slow_group)
+        reading = threading.Thread(target=mark_read)
+        reading.start()
+        reading.join(0.5)
+        self.assertTrue(reading.is_alive(), 'mark_read did not wait for the delivery in flight')
+        commit.set()
+        delivery.join(5)
+        reading.join(5)
+
+        # The page showed the first message; the one delivered meanwhile keeps the chat unread
+        state = self.read_state(self.slow_group)
+        self.assertEqual((state.last_read_message_id, state.unread_count), (first.id, 2))
+        self.assertEqual(user_chat_list_version(self.reader), state.version)
+
+    def test_sync_during_open_delivery(self):
+        version = self.sync()['version']
+        commit, delivery = self.open_delivery(self.slow_group)
+        # A later change commits first
+        self.deliver(self.group)
+        data = self.sync(version)
+        self.assertEqual([chat['id'] for chat in data['chats']], [self.group.pk])
+        commit.set()
+        delivery.join(5)
+
+        data = self.sync(data['version'])
+        chats = {chat['id']: chat['unread_count'] for chat in data['chats']}
+        self.assertEqual(chats[self.slow_group.pk], 1)
+
+    def test_sync_after_new_message(self):
+        data = self.sync()
+        self.assertTrue(data['full'])
+        self.deliver(self.slow_group)
+
+        data = self.sync(data['version'])
+        self.assertEqual(
+            [(chat['id'], chat['unread_count']) for chat in data['chats']], [(self.slow_group.pk, 1)],
+        )
+        self.assertEqual(data['removed'], [])
+        self.assertEqual(self.sync(data['version'])['chats'], [])
+
+    def test_sync_after_removal(self):
+        version = self.sync()['version']
+        self.slow_group.members.remove(self.reader)
+
+        data = self.sync(version)
+        self.assertEqual(data['chats'], [])
+        self.assertEqual(data['removed'], [{'chat_type': 'group', 'id': self.slow_group.pk}])
+
+    def test_sync_from_stale_version(self):
+        stale = self.sync()['version']
+        self.deliver(self.group)
+        version = self.sync(stale)['version']
+        self.slow_group.members.remove(self.reader)
+        self.assertEqual(self.sync(version)['chats'], [])
+
+        # A client that missed the syncs in between gets both changes
+        data = self.sync(stale)
+        self.assertEqual([chat['id'] for chat in data['chats']], [self.group.pk])
+        self.assertEqual(data['removed'], [{'chat_type': 'group', 'id': self.slow_group.pk}])
+        self.assertEqual(self.client.get(reverse('a_rtchat:sync_chats'), {'since': 'abc'}).status_code, 400)
+
+    def test_reopening_read_chat_keeps_cached_chat_list(self):
+        url = reverse('a_rtchat:chat_area', args=['group', self.group.pk])
+        with mock.patch('a_rtchat.views.get_all_chats', wraps=get_all_chats) as chats:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(chats.call_count, 1)
+            version = self.read_state(self.group).version
+
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(chats.call_count, 1)
+        self.assertEqual(self.read_state(self.group).version, version)
+
+    def test_chat_list_not_cached_during_open_delivery(self):
+        url = reverse('a_rtchat:home')
+        commit, delivery = self.open_delivery(self.slow_group)
+        # Committed with a newer version than the delivery will get
+        self.deliver(self.group)
+        with mock.patch('a_rtchat.views.get_all_chats', wraps=get_all_chats) as chats:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(chats.call_count, 2)
+            commit.set()
+            delivery.join(5)
+
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(chats.call_count, 3)
+
+
+class HistoryViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(userid='UTEL/CC/UGCL-0001/2024', username='user1')
+        cls.group = GroupChat.objects.create(name='Group')
+        cls.group.members.add(cls.user)
+        messages = Message.objects.bulk_create([
+            Message(sender=cls.user, group=cls.group, message=f'message {i}') for i in range(7)
+        ])
+        # Messages saved in one batch can share a timestamp; only the id tells them apart
+        Message.objects.filter(group=cls.group).update(timestamp=messages[0].timestamp)
+        cls.ids = sorted(message.id for message in messages)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('a_rtchat:get_messages', args=['group', self.group.pk])
+
+    def test_pages_with_equal_timestamps(self):
+        pages = []
+        params = {'limit': 3}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            pages.append([message['id'] for message in data['messages']])
+            if not data['next_cursor']:
+                break
+            params['before'] = data['next_cursor']
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([message_id for page in reversed(pages) for message_id in page], self.ids)
+
+    def test_malformed_cursor(self):
+        for cursor in ('abc', '1-x', '-', '1-0', f'{10 ** 20}-1', f'1-{10 ** 20}'):
+            for direction in ('before', 'after'):
+                response = self.client.get(self.url, {direction: cursor})
+                self.assertEqual(response.status_code, 400, f'{direction}={cursor}')
+
+
+class ImportUsersTests(TestCase):
+
+    def import_csv(self, content, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write(content)
+            file.flush()
+            call_command('import_users', file.name, '--workers', '1', *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_reimport_only_updates_given_columns(self):
+        user = CustomUser.objects.create_user(
+            userid='UTEL/CC/UGCL-0001/2024', username='amina', password='kept', is_staff=True, is_active=False,
+        )
+        cache.set(user_cache_key(user.pk), user)
+        self.import_csv('userid,username,first_name,password\nUTEL/CC/UGCL-0001/2024,amina,Amina,changed\n')
+        self.assertIsNone(cache.get(user_cache_key(user.pk)))
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, 'Amina')
+        self.assertTrue(user.check_password('kept'))
+        self.assertEqual((user.is_staff, user.is_active), (True, False))
+
+        self.import_csv(
+            'userid,username,password,is_active\nUTEL/CC/UGCL-0001/2024,amina,changed,yes\n', '--reset-passwords',
+        )
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('changed'))
+        self.assertEqual((user.is_staff, user.is_active), (True, True))
+
+
+class ExportTests(TestCase):
+
+    rows = [(datetime(2024, 1, 1), '=Room', 'UTEL/CC/UGCL-0001/2024', '@sender', '=HYPERLINK("http://x")', False, 1)]
+
+    def test_csv_quotes_formulas(self):
+        lines = b''.join(csv_chunks(iter(self.rows))).decode('utf-8-sig').splitlines()
+        self.assertEqual(next(csv.reader(lines[1:])), [
+            '2024-01-01 00:00:00', "'=Room", 'UTEL/CC/UGCL-0001/2024', "'@sender",
+            '\'=HYPERLINK("http://x")', 'False', '1',
+        ])
+
+    def test_xlsx_writes_text_cells(self):
+        from openpyxl import load_workbook
+
+        file = io.BytesIO()
+        write_xlsx(iter(self.rows), file)
+        sheet = load_workbook(file).active
+        cells = [cell for cell in sheet[2] if isinstance(cell.value, str)]
+        self.assertEqual([cell.value for cell in cells], list(self.rows[0][1:5]))
+        self.assertEqual({cell.data_type for cell in cells}, {'s'})
+
+
+class MessageWriteBufferTests(TransactionTestCase):
+    """
+    Deferred foreign keys are only checked at commit, so these need real transactions.
+    """
+
+    def setUp(self):
+        self.sender = CustomUser.objects.create(userid='UTEL/CC/UGCL-0001/2024', username='sender')
+        self.group = GroupChat.objects.create(name='Group')
+        self.group.members.add(self.sender)
+
+    def save_all(self, buffer, messages):
+        async def save():
+            return await asyncio.gather(*(buffer.save(message) for message in messages), return_exceptions=True)
+        with mock.patch('a_rtchat.persistence.write_messages', wraps=write_messages) as write:
+            results = async_to_sync(save)()
+        return results, [len(call.args[0]) for call in write.call_args_list]
+
+    def message(self, text, group_id=None):
+        return Message(sender=self.sender, group_id=group_id or self.group.pk, message=text)
+
+    def test_batches_by_size_then_window(self):
+        buffer = MessageWriteBuffer(batch_size=2, window=0.01)
+        results, batches = self.save_all(buffer, [self.message(f'message {i}') for i in range(3)])
+        self.assertEqual(batches, [2, 1])
+        self.assertTrue(all(message.pk for message in results))
+        self.assertEqual(GroupChat.objects.get(pk=self.group.pk).last_message_id, results[-1].pk)
+
+    def test_bad_row_only_fails_itself(self):
+        buffer = MessageWriteBuffer(batch_size=3, window=10)
+        messages = [self.message('before'), self.message('orphan', group_id=self.group.pk + 1000), self.message('after')]
+        results, batches = self.save_all(buffer, messages)
+        self.assertEqual(batches, [3])
+        self.assertIsInstance(results[1], IntegrityError)
+        self.assertEqual(
+            list(Message.objects.order_by('id').values_list('message', flat=True)), ['before', 'after'],
+        )
+        self.assertEqual(ChatReadState.objects.get(user=self.sender, group=self.group).unread_count, 0)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ChatConsumerTests(TransactionTestCase):
+    """
+    channels closes the database connection between handlers, which a
+    TestCase transaction would not survive.
+    """
+
+    def setUp(self):
+        self.member, self.outsider = CustomUser.objects.bulk_create([
+            CustomUser(userid=f'UTEL/CC/UGCL-{i:04d}/2024', username=f'user{i}') for i in range(2)
+        ])
+        self.group = GroupChat.objects.create(name='Group')
+        self.group.members.add(self.member)
+        membership_cache.clear()
+
+    def communicator(self, user, query=''):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/group/{self.group.pk}/{query}')
+        communicator.scope['user'] = user
+        return communicator
+
+    async def test_non_member_is_refused(self):
+        connected, _ = await self.communicator(self.outsider).connect()
+        self.assertFalse(connected)
+
+    async def test_joining_clears_cached_refusal(self):
+        connected, _ = await self.communicator(self.outsider).connect()
+        self.assertFalse(connected)
+        self.assertEqual(membership_cache.get(self.outsider.pk, 'group', self.group.pk), (True, None))
+
+        await sync_to_async(self.group.members.add)(self.outsider)
+        self.assertEqual(membership_cache.get(self.outsider.pk, 'group', self.group.pk), (False, None))
+        communicator = self.communicator(self.outsider)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+    async def test_room_is_resolved_once_per_connection(self):
+        communicator = self.communicator(self.member)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        refuse = mock.Mock(side_effect=AssertionError('room looked up again'))
+        with mock.patch('a_rtchat.consumers.get_member_room', refuse), \
+                mock.patch('a_rtchat.membership.load_member_room', refuse):
+            for text in ('first', 'second'):
+                await communicator.send_json_to({'message': text})
+                frame = await communicator.receive_json_from(timeout=5)
+                self.assertEqual((frame['type'], frame['message'], frame['room_id']), ('chat_message', text, self.group.pk))
+        await communicator.disconnect()
+
+    def save_messages(self, count):
+        messages = [Message.objects.create(sender=self.member, group=self.group, message=f'message {i}') for i in range(count)]
+        return [encode_cursor(message) for message in messages], [message.id for message in messages]
+
+    async def test_reconnect_replays_missed_messages(self):
+        cursors, ids = await sync_to_async(self.save_messages)(4)
+        communicator = self.communicator(self.member, f'?after={cursors[1]}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual((frame['type'], frame['room_type'], frame['room_id']), ('replay', 'group', self.group.pk))
+        self.assertEqual([message['id'] for message in frame['messages']], ids[2:])
+        self.assertEqual(frame['messages'][-1]['cursor'], cursors[-1])
+        await communicator.disconnect()
+
+    async def test_reconnect_too_far_behind(self):
+        cursors, _ = await sync_to_async(self.save_messages)(4)
+        with mock.patch('a_rtchat.consumers.REPLAY_LIMIT', 2):
+            communicator = self.communicator(self.member, f'?after={cursors[0]}')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual(frame, {'type': 'too_far_behind', 'room_type': 'group', 'room_id': self.group.pk})
+        await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class UserConsumerTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user, self.other = CustomUser.objects.bulk_create([
+            CustomUser(userid=f'UTEL/CC/UGCL-{i:04d}/2024', username=f'user{i}') for i in range(2)
+        ])
+        self.group, self.other_group = GroupChat.objects.bulk_create([GroupChat(name='Group'), GroupChat(name='Other')])
+        self.group.members.add(self.user, self.other)
+        self.other_group.members.add(self.other)
+        self.private_chat = PrivateChat.objects.create(user1=self.user, user2=self.other)
+        membership_cache.clear()
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chat/')
+        communicator.scope['user'] = self.user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_message_is_routed_by_room(self):
+        communicator = await self.connect()
+        for room_type, room_id in (('group', self.group.pk), ('private', self.private_chat.pk)):
+            await communicator.send_json_to({'room_type': room_type, 'room_id': room_id, 'message': f'to {room_type}'})
+            frame = await communicator.receive_json_from(timeout=5)
+            self.assertEqual(
+                (frame['type'], frame['room_type'], frame['room_id'], frame['message']),
+                ('chat_message', room_type, room_id, f'to {room_type}'),
+            )
+        await communicator.disconnect()
+        self.assertEqual(await sync_to_async(Message.objects.filter(group=self.group).count)(), 1)
+        self.assertEqual(await sync_to_async(Message.objects.filter(private_chat=self.private_chat).count)(), 1)
+
+    async def test_non_member_room_is_rejected(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'room_type': 'group', 'room_id': self.other_group.pk, 'message': 'hello'})
+        self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+        await communicator.disconnect()
+        self.assertFalse(await sync_to_async(Message.objects.filter(group=self.other_group).exists)())
+
+    async def test_joined_and_left_rooms_update_subscriptions(self):
+        communicator = await self.connect()
+        room = {'room_type': 'group', 'room_id': self.other_group.pk}
+
+        await sync_to_async(self.other_group.members.add)(self.user)
+        self.assertEqual(await communicator.receive_json_from(timeout=5), {'type': 'room_joined', **room})
+        await communicator.send_json_to({**room, 'message': 'joined'})
+        frame = await communicator.receive_json_from(timeout=5)
+        self.assertEqual((frame['room_id'], frame['message']), (self.other_group.pk, 'joined'))
+
+        await sync_to_async(self.other_group.members.remove)(self.user)
+        self.assertEqual(await communicator.receive_json_from(timeout=5), {'type': 'room_left', **room})
+        await communicator.send_json_to({**room, 'message': 'left'})
+        self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+        await communicator.disconnect()
+
+
+class ReadReceiptCoalescerTests(TransactionTestCase):
+
+    def setUp(self):
+        self.reader, self.other, self.sender = CustomUser.objects.bulk_create([
+            CustomUser(userid=f'UTEL/CC/UGCL-{i:04d}/2024', username=f'user{i}') for i in range(3)
+        ])
+        self.group = GroupChat.objects.create(name='Group')
+        self.group.members.add(self.reader, self.other, self.sender)
+        self.messages = [Message.objects.create(sender=self.sender, group=self.group, message=f'message {i}') for i in range(3)]
+        Message.record_delivery(self.messages)
+
+    async def test_receipts_in_window_are_written_once(self):
+        layer = InMemoryChannelLayer()
+        channel = await layer.new_channel()
+        await layer.group_add(room_group_name('group', self.group.pk), channel)
+        first, second, last = (message.id for message in self.messages)
+        coalescer = ReadReceiptCoalescer(interval=0.05)
+
+        with mock.patch('a_rtchat.receipts.write_read_receipts', wraps=write_read_receipts) as write:
+            for user, message_id in ((self.reader, first), (self.reader, last), (self.other, second), (self.reader, second)):
+                coalescer.add(layer, user, 'group', self.group.pk, message_id)
+            event = await asyncio.wait_for(layer.receive(channel), 5)
+        write.assert_called_once_with({
+            (self.reader.pk, 'group', self.group.pk): last,
+            (self.other.pk, 'group', self.group.pk): second,
+        })
+        self.assertEqual(json.loads(event['frame']), {
+            'type': 'read_receipt', 'room_type': 'group', 'room_id': self.group.pk,
+            'reads': [
+                {'sender_username': self.reader.username, 'message_id': last},
+                {'sender_username': self.other.username, 'message_id': second},
+            ],
+        })
+
+        states = ChatReadState.objects.filter(group=self.group).values_list('user_id', 'last_read_message_id', 'unread_count')
+        self.assertEqual(
+            set(await sync_to_async(list)(states)),
+            {(self.reader.pk, last, 0), (self.other.pk, second, 3), (self.sender.pk, None, 0)},
+        )
+
+
+class PresenceTests(SimpleTestCase):
+
+    async def redis_layer(self):
+        layer = RedisChannelLayer(hosts=os.environ.get('CHAT_REDIS_URLS', 'redis://127.0.0.1:6379').split(','))
+        try:
+            await layer.connection(0).ping()
+        except Exception:
+            self.skipTest('Redis is not available')
+        return layer
+
+    async def test_presence_expires_without_heartbeat(self):
+        layer = await self.redis_layer()
+        online, offline = 'UTEL/CC/UGCL-0001/2024', 'UTEL/CC/UGCL-0002/2024'
+        await presence.touch(layer, online, 'channel-1')
+        self.addCleanup(async_to_sync(presence.leave), layer, online, 'channel-1')
+        self.assertEqual(await presence.get_online(layer, [online, offline]), {online: True, offline: False})
+
+        # A worker that stopped sending heartbeats is offline once PRESENCE_TTL has passed
+        expired = presence.time.time() + presence.PRESENCE_TTL + 1
+        with mock.patch('a_rtchat.presence.time') as clock:
+            clock.time.return_value = expired
+            self.assertEqual(await presence.get_online(layer, [online]), {online: False})
+
+        await presence.leave(layer, online, 'channel-1')
+        self.assertEqual(await presence.get_online(layer, [online]), {online: False})
+
+    async def test_typing_in_window_is_sent_once(self):
+        layer = InMemoryChannelLayer()
+        channel = await layer.new_channel()
+        group = room_group_name('group', 1)
+        await layer.group_add(group, channel)
+        amina = CustomUser(userid='UTEL/CC/UGCL-0001/2024', username='amina', first_name='Amina')
+        baraka = CustomUser(userid='UTEL/CC/UGCL-0002/2024', username='baraka')
+        coalescer = presence.TypingCoalescer(interval=0.05)
+
+        for user in (amina, baraka, amina, amina):
+            coalescer.add(layer, group, 'group', 1, user)
+        event = await asyncio.wait_for(layer.receive(channel), 5)
+        self.assertEqual(json.loads(event['frame']), {
+            'type': 'typing', 'room_type': 'group', 'room_id': 1,
+            'users': [
+                {'sender_username': 'amina', 'sender_first_name': 'Amina'},
+                {'sender_username': 'baraka', 'sender_first_name': 'baraka'},
+            ],
+        })
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(layer.receive(channel), 0.2)
+
+
+class MessagePartitionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(userid='UTEL/CC/UGCL-0001/2024', username='user1')
+        cls.group = GroupChat.objects.create(name='Group')
+
+    def partition_of(self, message):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM a_rtchat_message WHERE id = %s', [message.id])
+            return cursor.fetchone()[0]
+
+    def manage(self, *args):
+        out = io.StringIO()
+        call_command('manage_message_partitions', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_creates_next_month_and_moves_default_rows(self):
+        next_month = add_months(month_start(timezone.now()), 1)
+        if next_month in month_partitions():
+            detach_partition(next_month, drop=True)
+        message = Message.objects.create(sender=self.user, group=self.group, message='early')
+        Message.objects.filter(pk=message.pk).update(
+            timestamp=datetime(next_month.year, next_month.month, 1, 12, tzinfo=dt_timezone.utc),
+        )
+        self.assertEqual(self.partition_of(message), DEFAULT_PARTITION)
+
+        output = self.manage('--ahead', '1')
+        self.assertIn(f'Created {partition_name(next_month)} (1 rows moved from the default partition)', output)
+        self.assertEqual(self.partition_of(message), partition_name(next_month))
+        self.assertEqual(self.manage('--ahead', '1'), '')
+
+    def test_detaches_expired_months(self):
+        old = add_months(month_start(timezone.now()), -14)
+        create_partition(old)
+        output = self.manage('--ahead', '0', '--retain-months', '12')
+        self.assertIn(f'Detached {partition_name(old)}', output)
+        self.assertNotIn(old, month_partitions())
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [partition_name(old)])
+            self.assertTrue(cursor.fetchone()[0])
+
+
+class MessageSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.friend, cls.stranger = CustomUser.objects.bulk_create([
+            CustomUser(userid=f'UTEL/CC/UGCL-{i:04d}/2024', username=f'user{i}') for i in range(3)
+        ])
+        cls.group, cls.other_group = GroupChat.objects.bulk_create([GroupChat(name='Group'), GroupChat(name='Other')])
+        cls.group.members.add(cls.user, cls.friend)
+        cls.other_group.members.add(cls.stranger)
+        cls.private_chat = PrivateChat.objects.create(user1=cls.user, user2=cls.friend)
+        cls.stranger_chat = PrivateChat.objects.create(user1=cls.friend, user2=cls.stranger)
+
+    def post(self, message, **room):
+        return Message.objects.create(sender=self.friend, message=message, **room)
+
+    def test_only_member_chats(self):
+        visible = [self.post('budget review', group=self.group), self.post('budget draft', private_chat=self.private_chat)]
+        self.post('budget secret', group=self.other_group)
+        self.post('budget gossip', private_chat=self.stranger_chat)
+
+        messages, _ = search_messages(self.user, 'budget')
+        self.assertEqual({message.id for message in messages}, {message.id for message in visible})
+        messages, _ = search_messages(self.user, 'budget', room=room_filter('private', self.private_chat))
+        self.assertEqual([message.id for message in messages], [visible[1].id])
+
+    def test_deleted_messages_excluded(self):
+        kept = self.post('budget review', group=self.group)
+        deleted = self.post('budget typo', group=self.group)
+        Message.objects.filter(pk=deleted.pk).update(deleted=True)
+
+        messages, _ = search_messages(self.user, 'budget')
+        self.assertEqual([message.id for message in messages], [kept.id])
+
+    def test_snippet_is_escaped(self):
+        self.post('budget & costs < 5 > 3 "quoted"', group=self.group)
+
+        messages, _ = search_messages(self.user, 'budget')
+        self.assertEqual(messages[0].snippet, '<mark>budget</mark> &amp; costs &lt; 5 &gt; 3 &quot;quoted')
+
+
+class DirectoryCacheTests(TestCase):
+
+    def test_user_change_retires_cached_pages(self):
+        CustomUser.objects.create(userid='UTEL/CC/UGCL-0001/2024', username='amina', first_name='Amina')
+        users, _ = directory_page()
+        self.assertEqual([user['first_name'] for user in users], ['Amina'])
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.create(userid='UTEL/CC/UGCL-0002/2024', username='baraka', first_name='Baraka')
+        users, _ = directory_page()
+        self.assertEqual([user['first_name'] for user in users], ['Amina', 'Baraka'])
+
+    def test_local_cache_keeps_pages_briefly(self):
+        with self.settings(CHAT_CACHE_URL=None):
+            self.assertEqual(directory_cache_ttl(3600), 5)
+        with self.settings(CHAT_CACHE_URL='redis://127.0.0.1:6379/1'):
+            self.assertEqual(directory_cache_ttl(3600), 3600)
+
+
+class DirectorySearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.bulk_create([
+            CustomUser(userid='UTEL/CC/UGCL-0001/2024', username='amina', first_name='Amina', last_name='Kariuki'),
+            CustomUser(userid='UTEL/CC/UGCL-0002/2024', username='baraka', first_name='Baraka', last_name='Otieno'),
+            CustomUser(userid='UTEL/CC/UGCL-0003/2024', username='first', first_name='First', last_name='Person'),
+        ])
+
+    def names(self, text):
+        return [user['first_name'] for user in search_directory(text)]
+
+    def test_substring_inside_name(self):
+        self.assertEqual(self.names('irst'), ['First'])
+        self.assertEqual(self.names('RIUK'), ['Amina'])
+
+    def test_typo(self):
+        self.assertEqual(self.names('kariuky'), ['Amina'])
+        self.assertEqual(self.names('amina otieno'), [])
+
+    def test_closest_first(self):
+        CustomUser.objects.create(userid='UTEL/CC/UGCL-0004/2024', username='aminata', first_name='Aminata')
+        self.assertEqual(self.names('amina'), ['Amina', 'Aminata'])
@@ -10,9 +10,13 @@ urlpatterns = [
     path('home/', views.home, name='home'),
     path('chat/<str:chat_type>/<int:chat_id>/', views.chat_area, name='chat_area'),
     path('filter/<str:filter_type>/', views.filter_chats, name='filter_chats'),
+    path('sync_chats/', views.sync_chats, name='sync_chats'),
     path('get_messages/<str:chat_type>/<int:chat_id>/', views.get_messages, name='get_messages'),
     path('mark_messages_as_read/', views.mark_messages_as_read, name='mark_messages_as_read'),
     path('search_users/', views.search_users, name='search_users'),
+    path('available_users/', views.available_users, name='available_users'),
+    path('search_messages/', views.search_messages_view, name='search_messages'),
+    path('presence/', views.presence_status, name='presence_status'),
     path('create_private_chat/', views.create_private_chat, name='create_private_chat'),
     path('create_group_chat/', views.create_group_chat, name='create_group_chat'),
 ]
@@ -1,19 +1,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseBadRequest, Http404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q, Count, Max
+from django.db import transaction
+from django.db.models import Q, F, Max, Value, Case, When, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.utils import timezone
 from django.contrib.auth import authenticate, login, logout
 import json
 from a_rtchat.forms import UserLoginForm
-from .models import Message, GroupChat, PrivateChat
+from channels.layers import get_channel_layer
+from .models import GroupChat, PrivateChat, ChatReadState, RemovedChat, chat_version_horizon
+from . import presence
+from .group_members import add_group_members
+from .notifications import push_frame
+from .history import HISTORY_PAGE_SIZE, encode_cursor, get_message_page, room_filter
+from .search import DIRECTORY_LIST_PAGE_SIZE, SEARCH_PAGE_SIZE, directory_page, search_directory, search_messages
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Seconds a rendered chat list is kept; it is keyed by version, so this only bounds staleness of names
+SIDEBAR_CACHE_TTL = getattr(settings, 'CHAT_SIDEBAR_CACHE_TTL', 600)
+
 # ---------------- Login / Logout ----------------
 
 def login_view(request):
@@ -38,70 +49,127 @@ def logout_view(request):
 
 # ---------------- Helper Functions ----------------
 
-def get_all_chats(user):
+def get_all_chats(user, group_ids=None, private_ids=None):
     """
-    Fetch all chats for a user, combine group and private chats, annotate last message and unread count.
+    Fetch all chats for a user as one query over the denormalized last-message
+    summary, newest activity first, with the user's unread count and chat list
+    version of each chat. With group_ids / private_ids only those chats are
+    fetched (for delta syncs).
     """
+    def read_state(fk, field):
+        state = ChatReadState.objects.filter(**{fk: OuterRef('pk')}, user=user).values(field)[:1]
+        return Coalesce(Subquery(state), 0)
+
+    is_user1 = Q(user1=user)
+    columns = (
+        'chat_type', 'id', 'name', 'other_userid', 'other_username', 'other_first_name',
+        'other_last_name', 'preview', 'last_message_id', 'last_message_at', 'activity_at', 'unread_count',
+        'version',
+    )
+
     # Groups
     groups = GroupChat.objects.filter(members=user).annotate(
-        last_message_time=Max('chat_messages__timestamp'),
-        unread_count=Count('chat_messages', filter=Q(chat_messages__read=False) & ~Q(chat_messages__sender=user))
-    )
+        chat_type=Value('group'),
+        other_userid=Value(''),
+        other_username=Value(''),
+        other_first_name=Value(''),
+        other_last_name=Value(''),
+        preview=F('last_message_preview'),
+        activity_at=Coalesce('last_message_at', 'created_at'),
+        unread_count=read_state('group', 'unread_count'),
+        version=read_state('group', 'version'),
+    ).values_list(*columns)
+    if group_ids is not None:
+        groups = groups.filter(id__in=group_ids)
 
     # Private Chats
-    private_chats = PrivateChat.objects.filter(
-        Q(user1=user) | Q(user2=user)
-    ).annotate(
-        last_message_time=Max('private_chat_messages__timestamp'),
-        unread_count=Count('private_chat_messages', filter=Q(private_chat_messages__read=False) & ~Q(private_chat_messages__sender=user))
-    )
+    private_chats = PrivateChat.objects.filter(Q(user1=user) | Q(user2=user)).annotate(
+        chat_type=Value('private'),
+        name=Value(''),
+        other_userid=Case(When(is_user1, then=F('user2__userid')), default=F('user1__userid')),
+        other_username=Case(When(is_user1, then=F('user2__username')), default=F('user1__username')),
+        other_first_name=Case(When(is_user1, then=F('user2__first_name')), default=F('user1__first_name')),
+        other_last_name=Case(When(is_user1, then=F('user2__last_name')), default=F('user1__last_name')),
+        preview=F('last_message_preview'),
+        activity_at=Coalesce('last_message_at', 'created_at'),
+        unread_count=read_state('private_chat', 'unread_count'),
+        version=read_state('private_chat', 'version'),
+    ).values_list(*columns)
+    if private_ids is not None:
+        private_chats = private_chats.filter(id__in=private_ids)
 
     all_chats = []
-
-    # Process Groups
-    for group in groups:
-        last_message = group.chat_messages.order_by('-timestamp').first()
+    for row in groups.union(private_chats, all=True).order_by('-activity_at'):
+        chat = dict(zip(columns, row))
         all_chats.append({
-            'chat_type': 'group',
-            'id': group.id,
-            'name': group.name,
-            'last_message': last_message,
-            'unread_count': group.unread_count,
-            'timestamp': group.last_message_time or group.created_at
+            'chat_type': chat['chat_type'],
+            'id': chat['id'],
+            'name': chat['name'],
+            'other_user': {
+                'userid': chat['other_userid'],
+                'username': chat['other_username'],
+                'first_name': chat['other_first_name'],
+                'last_name': chat['other_last_name'],
+            } if chat['chat_type'] == 'private' else None,
+            'last_message': {
+                'id': chat['last_message_id'],
+                'message': chat['preview'],
+                'timestamp': chat['last_message_at'],
+            } if chat['last_message_id'] else None,
+            'unread_count': chat['unread_count'],
+            'version': chat['version'],
+            'timestamp': chat['activity_at'],
         })
 
-    # Process Private Chats
-    for private_chat in private_chats:
-        last_message = private_chat.private_chat_messages.order_by('-timestamp').first()
-        other_user = private_chat.user2 if private_chat.user1 == user else private_chat.user1
-        all_chats.append({
-            'chat_type': 'private',
-            'id': private_chat.id,
-            'other_user': other_user,
-            'last_message': last_message,
-            'unread_count': private_chat.unread_count,
-            'timestamp': private_chat.last_message_time or private_chat.created_at
-        })
-
-    # Sort by timestamp descending
-    all_chats.sort(key=lambda x: x['timestamp'] or timezone.now(), reverse=True)
-
     return all_chats
 
 
 # ---------------- Home / Chat Views ----------------
 
+def user_chat_list_version(user):
+    """
+    The newest chat list version of `user`, from two index-only lookups.
+
+    Every change shown in the chat list takes a new version: saved messages
+    (Message.increment_unread_counts), read-state changes, joins, leaves and
+    renames. Once every version up to it has committed (it is below
+    chat_version_horizon()), it names one exact rendering of the list.
+    """
+    read = ChatReadState.objects.filter(user=user).aggregate(version=Max('version'))['version']
+    removed = RemovedChat.objects.filter(user=user).aggregate(version=Max('version'))['version']
+    return max(read or 0, removed or 0)
+
+
+def sidebar_context(user, chats=None):
+    """
+    Template context for the chat list.
+
+    chat_area.html caches the rendered list per user and version, so `chats`
+    (get_all_chats by default) is passed uncalled and only runs when that
+    fragment cache misses. While a change to the list may still be in flight
+    the version does not name one rendering yet, and nothing is cached.
+    `chat_version` is where the client's first delta sync starts.
+    """
+    horizon = chat_version_horizon()
+    version = user_chat_list_version(user)
+    return {
+        'all_chats': lambda: (chats or get_all_chats)(user),
+        'chat_version': horizon,
+        'chat_list_version': version,
+        'sidebar_cache_ttl': SIDEBAR_CACHE_TTL if version < horizon else 0,
+    }
+
+
 @login_required
 def home(request):
     return render(request, 'a_rtchat/chat_area.html', {
-        'all_chats': get_all_chats(request.user),
+        **sidebar_context(request.user),
         'active_group': None,
         'active_private_chat': None,
         'other_username': None,
         'room_name': None,
         'messages': None,
         'chat_type': None,
-        'available_users': User.objects.exclude(userid=request.user.userid),
     })
 
 
@@ -110,15 +178,16 @@ def chat_area(request, chat_type, chat_id):
     active_group = None
     active_private_chat = None
     messages = []
+    next_cursor = None
     room_name = None
     other_username = None
 
     if chat_type == 'group':
         active_group = get_object_or_404(GroupChat, id=chat_id, members=request.user)
-        messages = Message.objects.filter(group=active_group).order_by('timestamp')
+        messages, next_cursor = get_message_page(room_filter('group', active_group))
         room_name = f'group_{active_group.id}'
         # Mark messages as read
-        Message.objects.filter(group=active_group, read=False).exclude(sender=request.user).update(read=True)
+        ChatReadState.mark_read(request.user, 'group', active_group)
 
     elif chat_type == 'private':
         active_private_chat = get_object_or_404(
@@ -127,24 +196,26 @@ def chat_area(request, chat_type, chat_id):
             id=chat_id
         )
         other_user = active_private_chat.get_other_user(request.user)
-        messages = Message.objects.filter(private_chat=active_private_chat).order_by('timestamp')
+        messages, next_cursor = get_message_page(room_filter('private', active_private_chat))
         room_name = f'private_{active_private_chat.id}'
         other_username = other_user.username if other_user else 'Unknown User'
         # Mark messages as read
-        Message.objects.filter(private_chat=active_private_chat, read=False).exclude(sender=request.user).update(read=True)
+        ChatReadState.mark_read(request.user, 'private', active_private_chat)
 
     else:
         return HttpResponseBadRequest("Invalid chat type")
 
     return render(request, 'a_rtchat/chat_area.html', {
-        'all_chats': get_all_chats(request.user),
+        **sidebar_context(request.user),
         'active_group': active_group,
         'active_private_chat': active_private_chat,
         'other_username': other_username,
         'room_name': room_name,
         'messages': messages,
+        'next_cursor': next_cursor,
+        # Where a dropped WebSocket resumes from ("0-0": the start of an empty room)
+        'last_cursor': encode_cursor(messages[-1]) if messages else '0-0',
         'chat_type': chat_type,
-        'available_users': User.objects.exclude(userid=request.user.userid),
     })
 
 
@@ -152,30 +223,78 @@ def chat_area(request, chat_type, chat_id):
 @login_required
 def filter_chats(request, filter_type):
     user = request.user
-    all_chats = get_all_chats(user)
 
     # Validate filter_type and prepare filtered list
     if filter_type == 'groups':
-        filtered_chats = [c for c in all_chats if c['chat_type'] == 'group']
+        chat_type = 'group'
     elif filter_type == 'private':
-        filtered_chats = [c for c in all_chats if c['chat_type'] == 'private']
+        chat_type = 'private'
     else:
         # Invalid filter type: redirect to home
         return redirect('a_rtchat:home')
 
+    def filtered_chats(user):
+        return [c for c in get_all_chats(user) if c['chat_type'] == chat_type]
+
     return render(request, 'a_rtchat/chat_area.html', {
-        'all_chats': filtered_chats,
+        **sidebar_context(user, filtered_chats),
         'active_group': None,
         'active_private_chat': None,
         'other_username': None,
         'room_name': None,
         'messages': [],
         'chat_type': None,
-        'available_users': User.objects.exclude(userid=user.userid),
         'current_filter': filter_type  # optional: JS can read this to highlight filter
     })
 
 
+# ---------------- Chat List Sync ----------------
+
+@login_required
+def sync_chats(request):
+    """
+    Delta sync of the chat list: /sync_chats/?since=<version>.
+
+    Returns the chats whose last message, unread count or membership changed
+    since `since`, the chats the user was removed from, and the version to send
+    next time: the horizon read before the rows (chat_version_horizon), so a
+    change committed later with a lower version is still picked up. Changes
+    already sent may come again. Without `since` the whole list is returned.
+    An idle sync is two index-only lookups that find nothing.
+    """
+    user = request.user
+    since = request.GET.get('since')
+    horizon = chat_version_horizon()
+    if not since:
+        chats = get_all_chats(user)
+        return JsonResponse({'version': horizon, 'chats': chats, 'removed': [], 'full': True})
+    try:
+        since = int(since)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid version'}, status=400)
+
+    changed = list(ChatReadState.objects.filter(user=user, version__gte=since).values_list('group_id', 'private_chat_id'))
+    removed = list(RemovedChat.objects.filter(user=user, version__gte=since).values_list('chat_type', 'chat_id'))
+    version = max(since, horizon)
+    if not changed and not removed:
+        return JsonResponse({'version': version, 'chats': [], 'removed': [], 'full': False})
+
+    group_ids = [group_id for group_id, _ in changed if group_id]
+    private_ids = [private_id for _, private_id in changed if private_id]
+    chats = get_all_chats(user, group_ids=group_ids, private_ids=private_ids) if changed else []
+    # A chat left and then rejoined is current again
+    current = {(chat['chat_type'], chat['id']) for chat in chats}
+    return JsonResponse({
+        'version': version,
+        'chats': chats,
+        'removed': [
+            {'chat_type': chat_type, 'id': chat_id}
+            for chat_type, chat_id in removed if (chat_type, chat_id) not in current
+        ],
+        'full': False,
+    })
+
+
 # ---------------- Mark Messages As Read ----------------
 
 @login_required
@@ -194,10 +313,14 @@ def mark_messages_as_read(request):
                 Q(user1=user) | Q(user2=user),
                 id=room_id
             )
-            Message.objects.filter(private_chat=private_chat, read=False).exclude(sender=user).update(read=True)
+            chat_type, chat = 'private', private_chat
         else:
             group = get_object_or_404(GroupChat, id=room_id, members=user)
-            Message.objects.filter(group=group, read=False).exclude(sender=user).update(read=True)
+            chat_type, chat = 'group', group
+
+        ChatReadState.mark_read(user, chat_type, chat)
+        # Clear the badge in the user's other tabs and devices
+        push_frame([user.pk], type='read', room_type=chat_type, room_id=chat.id, unread_count=0)
 
         return JsonResponse({'success': True})
 
@@ -209,28 +332,45 @@ def mark_messages_as_read(request):
 
 @login_required
 def get_messages(request, chat_type, chat_id):
-    try:
-        messages_data = []
+    """
+    Return one keyset-paginated page of a room's history.
 
+    Query params: `before` or `after` (a cursor from a previous response) and
+    `limit`. Without a cursor the newest page is returned.
+    """
+    try:
         if chat_type == 'private':
             chat = get_object_or_404(PrivateChat, Q(user1=request.user) | Q(user2=request.user), id=chat_id)
-            messages = Message.objects.filter(private_chat=chat).order_by('timestamp')
         elif chat_type == 'group':
-            group = get_object_or_404(GroupChat, id=chat_id, members=request.user)
-            messages = Message.objects.filter(group=group).order_by('timestamp')
+            chat = get_object_or_404(GroupChat, id=chat_id, members=request.user)
         else:
             return JsonResponse({'error': 'Invalid chat type'}, status=400)
 
+        try:
+            messages, next_cursor = get_message_page(
+                room_filter(chat_type, chat),
+                before=request.GET.get('before'),
+                after=request.GET.get('after'),
+                limit=request.GET.get('limit', HISTORY_PAGE_SIZE),
+            )
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+        messages_data = []
         for message in messages:
             messages_data.append({
+                'id': message.id,
+                'cursor': encode_cursor(message),
                 'sender_username': message.sender.username,
                 'sender_first_name': message.sender.first_name or message.sender.username,
                 'message': message.message,
                 'timestamp': message.timestamp.strftime('%b. %d, %I:%M %p')
             })
 
-        return JsonResponse({'messages': messages_data})
+        return JsonResponse({'messages': messages_data, 'next_cursor': next_cursor})
 
+    except Http404:
+        raise
     except Exception as e:
         return JsonResponse({'error': f'Internal server error: {str(e)}'}, status=500)
 
@@ -238,18 +378,103 @@ def get_messages(request, chat_type, chat_id):
 
 @login_required
 def search_users(request):
-    query = request.GET.get('q', '')
+    query = request.GET.get('q', '').strip()
     if len(query) < 2:
         return JsonResponse({'users': []})
 
-    users = User.objects.filter(
-        Q(username__icontains=query) |
-        Q(first_name__icontains=query) |
-        Q(middle_name__icontains=query) |
-        Q(last_name__icontains=query)
-    ).exclude(userid=request.user.userid).values('userid', 'first_name','middle_name','last_name')[:10]
+    users = search_directory(query, exclude=request.user.userid)
+
+    return JsonResponse({'users': users})
+
+
+# ---------------- User Directory ----------------
+
+@login_required
+def available_users(request):
+    """
+    One page of the user picker: /available_users/?page=N&page_size=M, name order.
+    """
+    try:
+        users, has_more = directory_page(
+            request.GET.get('page', 1),
+            request.GET.get('page_size', DIRECTORY_LIST_PAGE_SIZE),
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid page'}, status=400)
+
+    return JsonResponse({
+        'users': [user for user in users if user['userid'] != request.user.userid],
+        'has_more': has_more,
+    })
+
+
+# ---------------- Search Messages ----------------
+
+@login_required
+def search_messages_view(request):
+    """
+    Full-text search over the user's chats, newest first.
+
+    Query params: `q`, optional `chat_type` and `chat_id` to search one chat,
+    and `before` (a cursor from a previous response) and `limit` for paging.
+    """
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse({'results': [], 'next_cursor': None})
+
+    try:
+        try:
+            room = None
+            chat_type = request.GET.get('chat_type')
+            if chat_type == 'private':
+                chat = get_object_or_404(PrivateChat, Q(user1=request.user) | Q(user2=request.user), id=request.GET.get('chat_id'))
+                room = room_filter(chat_type, chat)
+            elif chat_type == 'group':
+                chat = get_object_or_404(GroupChat, id=request.GET.get('chat_id'), members=request.user)
+                room = room_filter(chat_type, chat)
+            elif chat_type:
+                return JsonResponse({'error': 'Invalid chat type'}, status=400)
+
+            messages, next_cursor = search_messages(
+                request.user, query, room=room,
+                before=request.GET.get('before'),
+                limit=request.GET.get('limit', SEARCH_PAGE_SIZE),
+            )
+        except (ValueError, TypeError):
+            return JsonResponse({'error': 'Invalid chat, cursor or limit'}, status=400)
 
-    return JsonResponse({'users': list(users)})
+        results = []
+        for message in messages:
+            results.append({
+                'id': message.id,
+                'cursor': encode_cursor(message),
+                'chat_type': 'group' if message.group_id else 'private',
+                'chat_id': message.group_id or message.private_chat_id,
+                'chat_name': message.group.name if message.group_id else None,
+                'sender_username': message.sender.username,
+                'sender_first_name': message.sender.first_name or message.sender.username,
+                'snippet': message.snippet,
+                'timestamp': message.timestamp.strftime('%b. %d, %I:%M %p'),
+            })
+
+        return JsonResponse({'results': results, 'next_cursor': next_cursor})
+
+    except Http404:
+        raise
+    except Exception as e:
+        return JsonResponse({'error': f'Internal server error: {str(e)}'}, status=500)
+
+
+# ---------------- Presence ----------------
+
+@login_required
+async def presence_status(request):
+    """
+    Bulk online lookup for the sidebar: /presence/?userid=...&userid=...
+    """
+    user_ids = request.GET.getlist('userid')[:200]
+    online = await presence.get_online(get_channel_layer(), user_ids)
+    return JsonResponse({'presence': online})
 
 
 # ---------------- Create Private Chat ----------------
@@ -294,12 +519,10 @@ def create_group_chat(request):
         name = data.get('name')
         member_ids = data.get('members', [])
 
-        group = GroupChat.objects.create(name=name)
-        group.members.add(request.user)
-
-        members = User.objects.filter(userid__in=member_ids)
-        for member in members:
-            group.members.add(member)
+        with transaction.atomic():
+            group = GroupChat.objects.create(name=name)
+            # The creator and all members in one batched insert and one membership signal
+            add_group_members(group, [request.user.pk, *member_ids])
 
         return JsonResponse({'success': True, 'group_id': group.id})
 
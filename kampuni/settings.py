@@ -10,17 +10,16 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # Quick-start development settings - unsuitable for production
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-nby^&+s^@^!l^1di#&4z&9+y_5&s#qu)7$d9w9sw2w&=5f^=%^'
+SECRET_KEY = os.environ.get(
+    'DJANGO_SECRET_KEY',
+    'django-insecure-nby^&+s^@^!l^1di#&4z&9+y_5&s#qu)7$d9w9sw2w&=5f^=%^',
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = False
+DEBUG = os.environ.get('DJANGO_DEBUG', '') == '1'
 
-ALLOWED_HOSTS = [
-    '127.0.0.1',
-    '10.6.68.30',
-    '10.6.66.30',
-    # '192.168.1.58',
-]
+# Comma separated in DJANGO_ALLOWED_HOSTS, e.g. "127.0.0.1,10.6.68.30"
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '127.0.0.1,10.6.68.30,10.6.66.30').split(',')
 
 # Application definition
 INSTALLED_APPS = [
@@ -34,6 +33,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'a_rtchat.apps.ARtchatConfig',
      
 ]
@@ -70,30 +70,123 @@ TEMPLATES = [
 # WSGI_APPLICATION = 'kampuni.wsgi.application' # No longer used with Daphne
 ASGI_APPLICATION = 'kampuni.asgi.application'
 
+# Every ASGI worker shares this layer, so a group_send from any worker reaches sockets
+# held by all of them. Give several Redis URLs (comma separated) to shard channels
+# and groups across Redis instances; presence keys live on the first one.
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [('127.0.0.1', 6379)],
+            "hosts": os.environ.get('CHAT_REDIS_URLS', 'redis://127.0.0.1:6379').split(','),
+            "capacity": int(os.environ.get('CHANNEL_LAYER_CAPACITY', 1500)),
         },
     },
 }
 
+# Cache for search results, the user directory and rendered chat lists. Local memory
+# (per process) unless CHAT_CACHE_URL points at Redis, e.g. "redis://127.0.0.1:6379/1",
+# which every worker then shares
+CHAT_CACHE_URL = os.environ.get('CHAT_CACHE_URL')
+if CHAT_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CHAT_CACHE_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+
+# Chat message persistence: messages are written in batches of up to
+# CHAT_WRITE_BATCH_SIZE, at most CHAT_WRITE_BATCH_WINDOW seconds after the first one arrives
+CHAT_WRITE_BATCH_SIZE = 100
+CHAT_WRITE_BATCH_WINDOW = 0.02
+
+# WebSocket room membership cache (per process): max entries and seconds to live
+CHAT_MEMBERSHIP_CACHE_SIZE = 10000
+CHAT_MEMBERSHIP_CACHE_TTL = 300
+
+# Presence (seconds): a connection counts as online for CHAT_PRESENCE_TTL after its last
+# heartbeat, heartbeats run every CHAT_PRESENCE_HEARTBEAT, and typing updates are sent
+# to a room at most once per CHAT_TYPING_INTERVAL
+CHAT_PRESENCE_TTL = 60
+CHAT_PRESENCE_HEARTBEAT = 25
+CHAT_TYPING_INTERVAL = 2.0
+
+# Messages are partitioned by month (see a_rtchat/partitions.py). History pages read the
+# last CHAT_HISTORY_RECENT_DAYS first; manage_message_partitions keeps
+# CHAT_MESSAGE_PARTITIONS_AHEAD months of partitions ready and gives up detaching an
+# old one after CHAT_PARTITION_LOCK_TIMEOUT rather than hold up writers
+CHAT_HISTORY_RECENT_DAYS = 31
+CHAT_MESSAGE_PARTITIONS_AHEAD = 3
+CHAT_PARTITION_LOCK_TIMEOUT = '5s'
+
+# Most missed messages replayed to a reconnecting socket (at most 200); a client
+# further behind is told to reload the page
+CHAT_REPLAY_LIMIT = 100
+
+# Message admin pages count filtered rows exactly up to this many; beyond it the
+# total shown is the planner's estimate rather than a COUNT(*) over millions of rows
+CHAT_ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Read receipts from chat sockets are written and broadcast in one batch every
+# CHAT_READ_RECEIPT_INTERVAL seconds, keeping only the newest per user and room
+CHAT_READ_RECEIPT_INTERVAL = 5.0
+
+# Seconds a user directory search result is reused for the same query
+CHAT_USER_SEARCH_CACHE_TTL = 30
+
+# Seconds a page of the user picker directory is cached (also dropped on any user change).
+# Dropping only reaches other workers through a shared cache (CHAT_CACHE_URL); with
+# per-process local memory, directory pages and searches are kept a few seconds at most
+CHAT_USER_DIRECTORY_CACHE_TTL = 3600
+CHAT_LOCAL_DIRECTORY_CACHE_TTL = 5
+
+# Seconds a user's rendered chat list is kept (it is re-rendered anyway when it changes)
+CHAT_SIDEBAR_CACHE_TTL = 600
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'utelcentre1',
-        'USER': 'postgres',
-        'PASSWORD': 'admin',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'utelcentre1'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'admin'),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # Keep connections open between requests; each worker holds its own
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
     }
 }
 
 AUTH_USER_MODEL = 'a_rtchat.CustomUser'
 
+# With a shared cache, session users are resolved through it (a_rtchat.backends).
+# Only then: with per-process local memory, a deactivation or password change would
+# only drop the entry in the worker that saved it. ModelBackend stays listed so
+# sessions created under either setting remain valid
+AUTHENTICATION_BACKENDS = [
+    *(['a_rtchat.backends.CachedModelBackend'] if CHAT_CACHE_URL else []),
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Seconds a session's user is served from the cache. Changes to the user drop it at
+# once, in other workers too when the cache is shared
+CHAT_AUTH_USER_CACHE_TTL = 60
+
+# Sessions are read from the cache and written through to the database. Only with
+# a shared cache: with per-process local memory a logout would not reach other workers
+SESSION_ENGINE = (
+    'django.contrib.sessions.backends.cached_db' if CHAT_CACHE_URL
+    else 'django.contrib.sessions.backends.db'
+)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [